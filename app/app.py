@@ -1,13 +1,13 @@
 import streamlit as st
-import ollama
-from langchain_community.chat_models import ChatOllama
-import json
-import os
+import time
+import uuid
 from ui import sidebar, chat_area
 import config as default_config
-from utils import persistence
+from utils import persistence, state_cache, warmup
 import logging
 
+_rerun_started = time.perf_counter()
+
 
 # ------------------------------------------------------------------
 # Configure a logger that writes to the console.
@@ -17,12 +17,22 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 # A simple console handler that prints the message and the level.
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-logger.addHandler(handler)
+# app.py runs on every rerun, so only attach it once per process.
+if not logger.handlers:
+	handler = logging.StreamHandler()
+	handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+	logger.addHandler(handler)
+	# The app's own packages log through the same handler (rag.* used to print()).
+	for package in ("rag", "utils", "ui"):
+		logging.getLogger(package).setLevel(logging.INFO)
+		logging.getLogger(package).addHandler(handler)
 
 logger.info(f"running app.py")
 
+# Load the embedding model and the Ollama model in the background (once per process).
+if default_config.WARMUP_ENABLED:
+	warmup.start()
+
 # --- Page Configuration and CSS Injection ---
 st.set_page_config(
 	page_title="Local LLM Chat",
@@ -30,12 +40,12 @@ st.set_page_config(
 	initial_sidebar_state="expanded",
 )
 
-# Function to load and inject CSS
+# Function to load and inject CSS (file contents are cached per process)
 def load_css(file_name):
-	with open(file_name) as f:
-		st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+	st.markdown(f'<style>{state_cache.read_text(file_name)}</style>', unsafe_allow_html=True)
 
 # --- Session State Initialization ---
+# Both loads are served from utils.state_cache, so a rerun does no file reads.
 config = persistence.load_config()
 conversations = persistence.load_conversations()
 
@@ -65,12 +75,30 @@ if "conversation_to_rename" not in st.session_state:
 	st.session_state.conversation_to_rename = ""
 if "current_conversation_title" not in st.session_state:
 	st.session_state.current_conversation_title = None
+if "pending_titles" not in st.session_state:
+	st.session_state.pending_titles = {} # heuristic title -> title_generator key
 if "auto_save" not in st.session_state:
 	st.session_state.auto_save = config["auto_save"]
 if "use_search" not in st.session_state:
 	st.session_state.use_search = config["use_search"]
+if "use_response_cache" not in st.session_state:
+	st.session_state.use_response_cache = default_config.RESPONSE_CACHE_ENABLED
+if "fresh_answer_id" not in st.session_state:
+	st.session_state.fresh_answer_id = 0 # Bumped after each answer to reset the one-shot "fresh answer" checkbox
+if "chat_window_extra" not in st.session_state:
+	st.session_state.chat_window_extra = 0 # Earlier messages loaded beyond CHAT_RENDER_WINDOW
+if "expanded_messages" not in st.session_state:
+	st.session_state.expanded_messages = set() # Long messages the user expanded (see chat_area)
+if "compress_context" not in st.session_state:
+	st.session_state.compress_context = default_config.CONTEXT_COMPRESSION_ENABLED # Query-focused compression (rag.context_compression)
+if "compression_ratio" not in st.session_state:
+	st.session_state.compression_ratio = default_config.CONTEXT_COMPRESSION_RATIO
+if "show_timings" not in st.session_state:
+	st.session_state.show_timings = False # Per-stage timing panel (utils.tracing)
+if "vector_store_id" not in st.session_state:
+	st.session_state.vector_store_id = uuid.uuid4().hex # Key of this session's store in rag.store_registry
 if "uploaded_file_data" not in st.session_state:
-	st.session_state.uploaded_file_data = [] # Initialize as a list
+	st.session_state.uploaded_file_data = [] # [(filename, [document-store key per page]), ...]
 if "file_uploader_id" not in st.session_state:
 	st.session_state.file_uploader_id = config["file_uploader_id"];
 
@@ -79,9 +107,14 @@ if st.session_state.dark_mode:
 else:
 	load_css('style/light_mode.css')
 
-# --- Consolidated Sidebar ---
-with st.sidebar:
-	sidebar.render_sidebar()
+try:
+	# --- Consolidated Sidebar ---
+	with st.sidebar:
+		sidebar.render_sidebar()
 
-# --- Main Content Area ---
-chat_area.render_chatarea()
+	# --- Main Content Area ---
+	chat_area.render_chatarea()
+finally:
+	# Per-rerun overhead, measured even when st.rerun()/st.stop() cut the script short.
+	elapsed_ms = (time.perf_counter() - _rerun_started) * 1000
+	logger.info(f"app.py rerun took {elapsed_ms:.1f} ms (state cache: {state_cache.stats()})")
@@ -1,7 +1,114 @@
 CONFIG_FILE="config.json"
 CONVERSATIONS_FILE="conversations.json"
+SEARCH_INDEX_FILE="search_index.sqlite3"
 MODEL_NAME="gpt-oss:20b"
+# Small model used for background conversation titles, so they don't compete with MODEL_NAME.
+TITLE_MODEL_NAME="llama3.2:1b"
 USE_STREAM=True
+# Chat history rendering (ui.chat_area): only the latest CHAT_RENDER_WINDOW messages are drawn
+# ("Show earlier messages" loads more), and messages longer than CHAT_COLLAPSE_CHARS show a
+# preview until expanded.
+CHAT_RENDER_WINDOW=20
+CHAT_COLLAPSE_CHARS=6000
+# Minimum seconds between re-renders of a streaming answer (utils.stream_render); 0 renders every token.
+STREAM_RENDER_INTERVAL=0.05
+OLLAMA_BASE_URL="http://localhost:11434"
+# How long Ollama keeps MODEL_NAME loaded after a request; -1 keeps it resident.
+OLLAMA_KEEP_ALIVE=-1
+# Requests sent to Ollama at the same time by this process (utils.ollama_client.scheduler); match
+# the server's OLLAMA_NUM_PARALLEL. Others wait in a queue, chat turns ahead of background titles.
+OLLAMA_MAX_IN_FLIGHT=1
+# Waiting requests beyond this are rejected (background) or, for chat turns, handled per
+# OLLAMA_QUEUE_OVERFLOW: "degrade" (answer with the "low" effort parameters) or "reject".
+OLLAMA_MAX_QUEUE=8
+OLLAMA_QUEUE_OVERFLOW="degrade"
+# Load the embedding model and MODEL_NAME in background threads when the app starts.
+WARMUP_ENABLED=True
+
+# Local model registry (rag.model_registry): checksummed safetensors models listed in manifest.json,
+# filled by installation/register-models.py. Registered models load offline.
+MODEL_REGISTRY_DIR="models"
+# Refuse to download unregistered models from the Hugging Face Hub at runtime.
+MODEL_REGISTRY_REQUIRED=False
+
+# Sentence-transformers model used for RAG chunks and semantic cache lookups.
+EMBEDDING_MODEL_NAME="all-MiniLM-L6-v2"
+# CPU inference backend: "torch" (reference), "torch-int8" (dynamic quantization) or "onnx"
+# (needs optimum[onnxruntime]); check parity with benchmarks/bench_embedding_backends.py.
+EMBEDDING_BACKEND="torch"
+# Inference threads; None leaves the library default (all cores).
+EMBEDDING_NUM_THREADS=None
+# Token limit per chunk, capped at the model's own limit.
+EMBEDDING_MAX_SEQ_LENGTH=256
+
+# Response cache in front of ollama_client.get_ollama_stream.
+RESPONSE_CACHE_ENABLED=True
+RESPONSE_CACHE_MAX_ENTRIES=256
+RESPONSE_CACHE_TTL_SECONDS=24*60*60
+# Cosine similarity for a near-duplicate question to reuse an answer; None = exact matches only.
+# Opt-in: questions that differ in one token ("revenue in Q1?" / "in Q2?") can score above 0.95, so a
+# semantic hit additionally requires the same content words (see utils.response_cache).
+RESPONSE_CACHE_SEMANTIC_THRESHOLD=None
+
+# Per-session vector stores (rag.store_registry).
+VECTOR_STORE_ROOT="vector_store/sessions"
+# Total resident size of all stores; least recently used stores are spilled to disk beyond this.
+VECTOR_STORE_MEMORY_CAP_MB=1024
+# Stores idle this long are spilled to disk, and deleted after VECTOR_STORE_DELETE_AFTER_SECONDS.
+VECTOR_STORE_IDLE_SECONDS=15*60
+VECTOR_STORE_DELETE_AFTER_SECONDS=24*60*60
+# Vector encoding for new stores: index_type "flat" (float32), "sq8" (8-bit scalar quantization)
+# or "pq" (product quantization, pq_m sub-vectors of pq_nbits bits); compressed types re-rank
+# candidates on the exact vectors kept on disk when rerank is True.
+VECTOR_STORE_INDEX_OPTIONS={"index_type": "flat", "pq_m": None, "pq_nbits": 8, "rerank": True}
+# Context selection after the vector search (rag.context_selection): CONTEXT_FETCH_K candidates,
+# of which maximal marginal relevance keeps CONTEXT_MAX_CHUNKS (CONTEXT_MMR_LAMBDA: 1.0 = relevance
+# only, lower = more diverse, None = plain top-k); overlapping chunks are then merged and deduplicated.
+CONTEXT_FETCH_K=30
+CONTEXT_MAX_CHUNKS=10
+CONTEXT_MMR_LAMBDA=0.7
+# Small-to-big expansion: when CONTEXT_PARENT_MIN_HITS of the selected chunks belong to the same
+# parent section (rag.ingest PARENT_CHUNK_SIZE), the whole section is pasted instead; at most
+# CONTEXT_PARENT_MAX_EXPANSIONS sections per question. None disables it.
+CONTEXT_PARENT_MIN_HITS=2
+CONTEXT_PARENT_MAX_EXPANSIONS=3
+# Multi-query retrieval (rag.retriever): besides the question, search with the last
+# RETRIEVAL_HISTORY_TURNS user questions and the first RETRIEVAL_ANSWER_CHARS of the last answer
+# folded in (0 disables each); rankings are merged by reciprocal rank fusion with these weights.
+RETRIEVAL_HISTORY_TURNS=2
+RETRIEVAL_HISTORY_WEIGHT=0.7
+RETRIEVAL_ANSWER_CHARS=300
+RETRIEVAL_ANSWER_WEIGHT=0.5
+# Optional query-focused compression of that context (rag.context_compression): keep the sentences
+# most similar to the question, CONTEXT_COMPRESSION_RATIO of the characters. The sidebar toggles it.
+CONTEXT_COMPRESSION_ENABLED=False
+CONTEXT_COMPRESSION_RATIO=0.5
+# Text extraction of uploaded PDF / DOCX / HTML files (rag.extraction): worker processes
+# (None = up to 4, one per core) and the cache of extracted text, keyed by content hash (None disables it).
+# Cached text is private document content: entries unused for EXTRACTION_CACHE_MAX_AGE_SECONDS are deleted
+# (same retention as the session stores), and the least recently used go once the cache exceeds
+# EXTRACTION_CACHE_MAX_MB.
+EXTRACTION_MAX_WORKERS=None
+EXTRACTION_CACHE_DIR="vector_store/extracted"
+EXTRACTION_CACHE_MAX_AGE_SECONDS=VECTOR_STORE_DELETE_AFTER_SECONDS
+EXTRACTION_CACHE_MAX_MB=256
+# Unix socket of a shared rag.index_server (multi-worker deployments); None keeps stores in-process.
+INDEX_SERVER_SOCKET=None
+
+# Answers generated at the same time by the headless engine (engine.cli, engine.http_server).
+ENGINE_MAX_CONCURRENCY=4
+
+# Per-stage timing (utils.tracing): finished traces are appended to TRACE_JSONL_FILE and the
+# aggregates written to TRACE_PROMETHEUS_FILE (node_exporter textfile format); None disables each.
+# The JSONL file grows by one line per turn / engine answer and is not rotated, so it is opt-in.
+TRACE_ENABLED=True
+TRACE_JSONL_FILE=None
+TRACE_PROMETHEUS_FILE=None
+
+# Seconds between mtime checks of cached files (config, conversations, CSS).
+STATE_CACHE_STAT_INTERVAL=2.0
+# Rapid config/conversation saves are coalesced and flushed this long after the last change.
+WRITE_BEHIND_DEBOUNCE_SECONDS=0.5
 
 DEFAULT_INIT_FILE_UPLOADER_ID = 0;
 
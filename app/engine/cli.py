@@ -0,0 +1,125 @@
+# app/engine/cli.py
+"""
+無介面問答的命令列入口
+
+Run it from the app directory:
+
+    # Answer every question in questions.jsonl (or a .txt file, one question per
+    # line) against the files under docs/, 4 at a time; each answer is appended
+    # to answers.jsonl as soon as it is complete ("-" writes to stdout).
+    python -m engine.cli batch --corpus docs/ --questions questions.jsonl --output answers.jsonl --concurrency 4
+
+    # Local HTTP API (see engine.http_server)
+    python -m engine.cli serve --corpus docs/ --port 8765
+
+--store-dir keeps the vector store between runs: a later run with the same
+--store-dir and no --corpus reuses it without re-embedding.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+import config as default_config
+from utils import ollama_client
+
+from .http_server import EngineHTTPServer
+from .pipeline import PARAMS_BY_EFFORT, Engine, Settings, read_questions
+
+logger = logging.getLogger(__name__)
+
+
+def _engine(args: argparse.Namespace) -> Engine:
+    if args.embedder == "hash":
+        from rag.embedding_model import HashEmbeddingModel
+
+        embedder = HashEmbeddingModel()
+    else:
+        embedder = None  # 預設的 EmbeddingModel（EMBEDDING_MODEL_NAME / EMBEDDING_BACKEND）
+    settings = Settings(
+        model_name=args.model,
+        system_prompt=args.system_prompt,
+        language=args.language,
+        reasoning_effort=args.reasoning_effort,
+        history_length=args.history_length,
+        use_response_cache=not args.no_cache,
+        compression_ratio=args.compress,
+    )
+    # 這個行程只有引擎一個 Ollama 客戶端，並行數由 --concurrency 決定
+    ollama_client.scheduler.max_in_flight = args.concurrency
+    engine = Engine(embedder=embedder, settings=settings, store_dir=args.store_dir, max_concurrency=args.concurrency)
+    if args.corpus:
+        engine.ingest_paths(args.corpus)
+    return engine
+
+
+def _batch(args: argparse.Namespace) -> None:
+    questions = read_questions(args.questions)
+    out = sys.stdout if args.output == "-" else open(args.output, "a" if args.append else "w", encoding="utf-8")
+    started = time.perf_counter()
+    failed = 0
+    try:
+        with _engine(args) as engine:
+            for record in engine.run_batch(questions):
+                failed += record["error"] is not None
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.perf_counter() - started
+    logger.info(f"{len(questions)} questions in {seconds:.1f}s ({len(questions) / seconds:.2f}/s), {failed} failed")
+    if failed:
+        sys.exit(1)
+
+
+def _serve(args: argparse.Namespace) -> None:
+    with _engine(args) as engine, EngineHTTPServer((args.host, args.port), engine) as server:
+        logger.info(f"engine listening on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--corpus", nargs="*", default=[], help="files or folders to index")
+    common.add_argument("--store-dir", default=None, help="vector store folder (default: a temporary one)")
+    common.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="'hash' skips the sentence-transformers model (smoke tests)")
+    common.add_argument("--model", default=default_config.MODEL_NAME)
+    common.add_argument("--system-prompt", default=default_config.DEFAULT_SYSTEM_PROMPT)
+    common.add_argument("--language", default=default_config.DEFAULT_SELECTED_LANGUAGE)
+    common.add_argument("--reasoning-effort", choices=list(PARAMS_BY_EFFORT), default=default_config.DEFAULT_REASONING_EFFORT)
+    common.add_argument("--history-length", type=int, default=default_config.DEFAULT_HISTORY_LENGTH)
+    common.add_argument("--concurrency", type=int, default=default_config.ENGINE_MAX_CONCURRENCY,
+                        help="answers generated at the same time")
+    common.add_argument("--no-cache", action="store_true", help="bypass the response cache")
+    common.add_argument("--compress", type=float, default=None, metavar="RATIO",
+                        help="keep only the sentences most relevant to the question, RATIO of the context characters")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", parents=[common], help="answer a file of questions")
+    batch.add_argument("--questions", required=True, help=".jsonl ({\"id\", \"question\", \"history\"}) or one question per line")
+    batch.add_argument("--output", default="-", help="JSONL file, one record per answer ('-' = stdout)")
+    batch.add_argument("--append", action="store_true", help="append to --output instead of overwriting it")
+    batch.set_defaults(run=_batch)
+
+    serve = commands.add_parser("serve", parents=[common], help="local HTTP API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.set_defaults(run=_serve)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s", stream=sys.stderr)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# app/engine/http_server.py
+"""
+本機 HTTP 介面（給其他內部工具使用）
+
+    GET  /health   → {"status": "ok", "chunks": n, "max_concurrency": n}
+    POST /ingest   {"files": [{"name": ..., "text": ...}, ...]} → {"chunks": n}
+    POST /ask      {"question": ..., "history": [{"role", "content"}, ...]?, "id": ...?}
+    POST /batch    {"questions": [{"id"?, "question", "history"?}, ...], "concurrency": n?}
+
+/ask and /batch answer with NDJSON (application/x-ndjson), one JSON object per
+line, flushed as soon as it is ready: /ask sends {"token": ...} lines while the
+answer streams and then the full record (see Engine.answer) with "done": true;
+/batch sends one record per question in completion order. Requests beyond
+the engine's max_concurrency wait for a free slot.
+
+Request bodies are validated before any response is started (400 with
+{"error": ...}); a failure after the NDJSON stream has begun is sent as a
+final {"error": ..., "done": true} line and the chunked body is still closed.
+
+Start it with engine.cli serve; it binds to 127.0.0.1 by default and has no
+authentication.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from .pipeline import Engine, to_messages
+
+logger = logging.getLogger(__name__)
+
+
+# ---- 請求驗證（回傳錯誤訊息，None 表示沒問題） ----
+def _check_history(history: Any) -> str | None:
+    if history is None:
+        return None
+    if not isinstance(history, list) or not all(
+        isinstance(turn, dict) and isinstance(turn.get("content"), str) for turn in history
+    ):
+        return "'history' must be a list of {\"role\", \"content\"} objects"
+    return None
+
+
+def _check_question(item: Any) -> str | None:
+    if not isinstance(item, dict) or not isinstance(item.get("question"), str) or not item["question"]:
+        return "missing 'question'"
+    return _check_history(item.get("history"))
+
+
+def _check_ingest(request: Dict[str, Any]) -> str | None:
+    files = request.get("files", [])
+    if not isinstance(files, list):
+        return "'files' must be a list"
+    for i, f in enumerate(files):
+        if not isinstance(f, dict) or not isinstance(f.get("name"), str) or not isinstance(f.get("text"), str):
+            return f"files[{i}] must be {{\"name\": str, \"text\": str}}"
+    return None
+
+
+def _check_batch(request: Dict[str, Any]) -> str | None:
+    questions = request.get("questions", [])
+    if not isinstance(questions, list):
+        return "'questions' must be a list"
+    for i, item in enumerate(questions):
+        error = _check_question(item)
+        if error:
+            return f"questions[{i}]: {error}"
+    concurrency = request.get("concurrency")
+    if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+        return "'concurrency' must be a positive integer"
+    return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "EngineHTTPServer"
+    protocol_version = "HTTP/1.1"
+
+    # ---- 回應 ----
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_ndjson(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_line(self, payload: Dict[str, Any]) -> None:
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_ndjson(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _stream_ndjson(self, produce: Callable[[], Iterable[Dict[str, Any]]]) -> None:
+        """
+        以 NDJSON 送出 produce() 產生的每一行；中途失敗時送出錯誤行後照常結束 chunked body
+        """
+        self._start_ndjson()
+        try:
+            for payload in produce():
+                self._write_line(payload)
+        except OSError:
+            # 客戶端已斷線，沒有地方可以寫了
+            self.close_connection = True
+            return
+        except Exception as e:
+            logger.exception(f"{self.path} failed while streaming")
+            self._write_line({"error": f"{type(e).__name__}: {e}", "done": True})
+        self._end_ndjson()
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(request, dict):
+            raise ValueError("body must be a JSON object")
+        return request
+
+    # ---- 路由 ----
+    def do_GET(self) -> None:
+        engine = self.server.engine
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "chunks": engine.chunk_count, "max_concurrency": engine.max_concurrency})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        engine = self.server.engine
+        try:
+            request = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": f"invalid JSON: {e}"})
+            return
+
+        validate = {"/ingest": _check_ingest, "/ask": _check_question, "/batch": _check_batch}.get(self.path)
+        if validate is None:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        error = validate(request)
+        if error:
+            self._send_json(400, {"error": error})
+            return
+
+        if self.path == "/ingest":
+            files = [(f["name"], f["text"]) for f in request.get("files", [])]
+            try:
+                chunks = engine.ingest_files(files)
+            except Exception as e:
+                logger.exception("/ingest failed")
+                self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            self._send_json(200, {"chunks": chunks})
+        elif self.path == "/ask":
+            def answer() -> Iterator[Dict[str, Any]]:
+                record = engine.answer(
+                    request["question"],
+                    to_messages(request.get("history")),
+                    id=request.get("id"),
+                    on_token=lambda token: self._write_line({"token": token}),
+                )
+                yield {**record, "done": True}
+
+            self._stream_ndjson(answer)
+        else:
+            self._stream_ndjson(lambda: engine.run_batch(request.get("questions", []), concurrency=request.get("concurrency")))
+
+    def log_message(self, format: str, *args) -> None:
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+class EngineHTTPServer(ThreadingHTTPServer):
+    """
+    每個連線一個執行緒；並行生成數由 Engine 限制
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, engine: Engine) -> None:
+        super().__init__(address, _Handler)
+        self.engine = engine
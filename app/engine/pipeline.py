@@ -0,0 +1,372 @@
+# app/engine/pipeline.py
+"""
+無介面（headless）的 RAG + 對話流程
+
+The chat UI and the batch / HTTP entry points (engine.cli, engine.http_server)
+run the same steps from here: retrieve context for a question (rag.retriever), build the
+prompt, and stream the answer from Ollama. Nothing in this module touches
+st.session_state; everything the UI keeps there is passed in as Settings or
+arguments.
+
+    engine = Engine(embedder=HashEmbeddingModel())
+    engine.ingest_paths(["docs/"])
+    for record in engine.run_batch(read_questions("questions.jsonl"), concurrency=4):
+        print(record["answer"])
+
+run_batch works on max_concurrency questions at a time. Generation itself
+goes through utils.ollama_client.scheduler like every other Ollama request,
+so the number of answers actually in flight is OLLAMA_MAX_IN_FLIGHT (engine.cli
+sets it to --concurrency, as the engine is the only client in its process).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+
+import config as default_config
+from rag import extraction, ingest
+from rag.retriever import Retrieval, compress, retrieve
+from rag.vector_store_manager import VectorStoreManager
+from utils import ollama_client, prompt_builder, response_cache, tracing
+from utils.ollama_client import PARAMS_BY_EFFORT
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Settings:
+    """
+    UI 放在 session_state 裡的對話設定
+    """
+
+    model_name: str = default_config.MODEL_NAME
+    system_prompt: str = default_config.DEFAULT_SYSTEM_PROMPT
+    language: str = default_config.DEFAULT_SELECTED_LANGUAGE
+    reasoning_effort: str = default_config.DEFAULT_REASONING_EFFORT
+    show_cot: bool = default_config.DEFAULT_SHOW_COT
+    history_length: int = default_config.DEFAULT_HISTORY_LENGTH
+    use_response_cache: bool = True
+    compression_ratio: float | None = None  # 壓縮 context 時保留的比例（rag.context_compression）；None 不壓縮
+
+    def extra_body(self) -> Dict[str, Any]:
+        return {"reasoning_effort": self.reasoning_effort, **PARAMS_BY_EFFORT[self.reasoning_effort]}
+
+
+# ----------------------------------------------------------------------
+# 1. Prompt 與生成
+# ----------------------------------------------------------------------
+def build_prompt(settings: Settings, history: Sequence, context: str | None) -> list:
+    """
+    :param history: 對話歷史，最後一則是這次的提問（HumanMessage）
+    """
+    with tracing.span("build_prompt"):
+        return prompt_builder.build_prompt(
+            settings.system_prompt,
+            settings.language,
+            settings.show_cot,
+            settings.reasoning_effort,
+            list(history),
+            rag_context=context,
+            history_length=settings.history_length,
+        )
+
+
+def cache_key(settings: Settings, context: str | None, question: str, prompt: list) -> response_cache.CacheKey:
+    return response_cache.make_key(
+        settings.model_name,
+        settings.system_prompt,
+        context,
+        question,
+        options={
+            "language": settings.language,
+            "show_cot": settings.show_cot,
+            # Earlier turns in the prompt window change what a follow-up means.
+            "history": [m.content for m in prompt[1:-1]],
+            **settings.extra_body(),
+        },
+    )
+
+
+def stream_answer(
+    settings: Settings,
+    question: str,
+    prompt: list,
+    context: str | None,
+    on_cache_hit: Callable[[], None] | None = None,
+    raise_errors: bool = False,
+    on_queue: Callable[[int], None] | None = None,
+    on_degraded: Callable[[], None] | None = None,
+    on_heartbeat: Callable[[], None] | None = None,
+) -> Iterator[str]:
+    """
+    逐塊串流回覆（經過回覆快取與 ollama_client.scheduler 的佇列）
+    """
+    key = cache_key(settings, context, question, prompt) if settings.use_response_cache else None
+    return ollama_client.get_ollama_stream(
+        settings.model_name,
+        prompt,
+        extra_body=settings.extra_body(),
+        cache_key=key,
+        on_cache_hit=on_cache_hit,
+        raise_errors=raise_errors,
+        on_queue=on_queue,
+        on_degraded=on_degraded,
+        on_heartbeat=on_heartbeat,
+    )
+
+
+def to_messages(history: Iterable[Dict[str, str]] | None) -> list:
+    """
+    [{"role": "user" | "assistant", "content": ...}, ...] → LangChain 訊息
+    """
+    return [
+        HumanMessage(content=turn["content"]) if turn.get("role", "user") == "user" else AIMessage(content=turn["content"])
+        for turn in history or []
+    ]
+
+
+# ----------------------------------------------------------------------
+# 2. Engine：語料 + 並行問答
+# ----------------------------------------------------------------------
+class Engine:
+    """
+    一份語料（自己的向量庫）加上有並行上限的問答
+    """
+
+    def __init__(
+        self,
+        embedder=None,
+        settings: Settings | None = None,
+        store_dir: str | Path | None = None,
+        max_concurrency: int = default_config.ENGINE_MAX_CONCURRENCY,
+    ) -> None:
+        """
+        建構子
+
+        :param embedder: 預設為 rag.embedding_model.embedding_model
+        :param store_dir: 向量庫資料夾；None 時使用暫存資料夾（close() 時刪除）。
+            資料夾中已有索引時直接沿用，不必重新 ingest
+        :param max_concurrency: run_batch 同時處理的問題數
+        """
+        if embedder is None:
+            from rag.embedding_model import embedding_model as embedder
+        self.embedder = embedder
+        self.settings = settings or Settings()
+        self.max_concurrency = max(1, max_concurrency)
+        self._ingest_lock = threading.Lock()
+        self._tmpdir = None
+        if store_dir is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="localllm-engine-")
+            store_dir = self._tmpdir.name
+        store_dir = Path(store_dir)
+        self.store = VectorStoreManager(
+            index_path=store_dir / "faiss.index",
+            metadata_path=store_dir / "metadata.json",
+            **default_config.VECTOR_STORE_INDEX_OPTIONS,
+        )
+        self.last_filename: str | None = None
+        self.chunk_count = 0
+        if self.store.index_path.exists():
+            self.embedder.load()
+            self.store.init_vector_store(dim=self.embedder.dimension)
+            self.chunk_count = len(self.store.metadata)
+
+    def close(self) -> None:
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def __enter__(self) -> "Engine":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- 語料 ----
+    def ingest_files(self, files: Sequence[Tuple[str, str]]) -> int:
+        """
+        以 files 取代目前的語料
+
+        :param files: [(檔名, 文字), ...]
+        :return: 片段數
+        """
+        with self._ingest_lock, tracing.trace("upload", files=len(files)):
+            chunks = ingest.ingest(self.store, self.embedder, files)
+            self.chunk_count = len(chunks)
+            self.last_filename = files[-1][0] if files else None
+        logger.info(f"[引擎] 已建立語料：{len(files)} 個檔案，{len(chunks)} 個片段")
+        return len(chunks)
+
+    def ingest_paths(self, paths: Iterable[str | Path]) -> int:
+        """
+        讀取檔案或資料夾（遞迴，略過隱藏檔）並取代目前的語料；
+        PDF / DOCX / HTML / Markdown 經 rag.extraction 擷取，頁面邊擷取邊嵌入
+        """
+        files = [(path.name, path.read_bytes()) for path in _expand_paths(paths)]
+
+        def pages() -> Iterator[extraction.Page]:
+            for page in extraction.extract_files(files):
+                if page.error is not None:
+                    logger.warning(f"[引擎] 無法擷取，略過：{page.filename}（{page.error}）")
+                    continue
+                yield page
+
+        with self._ingest_lock, tracing.trace("upload", files=len(files)):
+            chunks = ingest.ingest_pages(self.store, self.embedder, pages())
+            self.chunk_count = len(chunks)
+            # 與 ingest_files 相同：以輸入順序的最後一個檔案為「最後上傳的檔案」
+            extracted = {chunk.filename for chunk in chunks}
+            self.last_filename = next((name for name, _ in reversed(files) if name in extracted), None)
+        logger.info(f"[引擎] 已建立語料：{len(files)} 個檔案，{len(chunks)} 個片段")
+        return len(chunks)
+
+    # ---- 問答 ----
+    def _retrieve(self, question: str, history: Sequence | None = None, query_vector: np.ndarray | None = None) -> Retrieval:
+        if not self.chunk_count:
+            return Retrieval()
+        retrieval = retrieve(self.store, self.embedder, question, history, self.last_filename, query_vector=query_vector)
+        if self.settings.compression_ratio is not None:
+            compress(retrieval, self.embedder, question, self.settings.compression_ratio)
+        return retrieval
+
+    def stream(
+        self,
+        question: str,
+        history: Sequence | None = None,
+        retrieval: Retrieval | None = None,
+        on_degraded: Callable[[], None] | None = None,
+    ) -> Iterator[str]:
+        """
+        逐塊產生回覆；在 ollama_client.scheduler 排隊時會阻塞
+
+        :param history: 先前的對話（LangChain 訊息）
+        :param on_degraded: 佇列過長、改用 "low" 參數生成時呼叫
+        :raises QueueFull: 佇列已滿（OLLAMA_QUEUE_OVERFLOW="reject"）
+        :raises Exception: Ollama 連線或生成失敗
+        """
+        if retrieval is None:
+            retrieval = self._retrieve(question, history)
+        prompt = build_prompt(self.settings, [*(history or []), HumanMessage(content=question)], retrieval.context)
+        yield from stream_answer(
+            self.settings, question, prompt, retrieval.context, raise_errors=True, on_degraded=on_degraded
+        )
+
+    def answer(
+        self,
+        question: str,
+        history: Sequence | None = None,
+        id: Any = None,
+        query_vector: np.ndarray | None = None,
+        on_token: Callable[[str], None] | None = None,
+    ) -> Dict[str, Any]:
+        """
+        回答一個問題
+
+        :param on_token: 每個片段到達時呼叫（例如 HTTP 串流）
+        :return: {"id", "question", "answer", "sources", "error", "degraded", "context_tokens_saved",
+            "first_token_ms", "total_ms", "stages"}
+        """
+        record: Dict[str, Any] = {
+            "id": id, "question": question, "answer": "", "sources": [], "error": None, "degraded": False,
+            "context_tokens_saved": None,
+        }
+        parts: List[str] = []
+        first_token_at = None
+        with tracing.trace("engine_answer") as answer_trace:
+            started = time.perf_counter()
+            try:
+                retrieval = self._retrieve(question, history, query_vector)
+                record["sources"] = [
+                    {"doc_id": doc_id, "filename": filename, "score": round(score, 4)}
+                    for doc_id, score, filename in retrieval.hits
+                ]
+                if retrieval.compression is not None:
+                    record["context_tokens_saved"] = retrieval.compression.tokens_saved
+                tokens = self.stream(question, history, retrieval, on_degraded=lambda: record.update(degraded=True))
+                # 若 on_token 失敗（例如 HTTP 客戶端斷線），關閉串流讓 Ollama 停止生成
+                with contextlib.closing(tokens):
+                    for token in tokens:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        parts.append(token)
+                        if on_token is not None:
+                            on_token(token)
+            except Exception as e:
+                logger.warning(f"[引擎] 問題 {id!r} 失敗：{e}")
+                record["error"] = f"{type(e).__name__}: {e}"
+        record["answer"] = "".join(parts)
+        record["first_token_ms"] = round((first_token_at - started) * 1000, 1) if first_token_at else None
+        record["total_ms"] = round(answer_trace.duration_ms, 1)
+        record["stages"] = {name: round(ms, 1) for name, ms in answer_trace.stage_totals().items()}
+        return record
+
+    def _embed_questions(self, questions: Sequence[str]) -> List[np.ndarray | None]:
+        if not self.chunk_count or not questions:
+            return [None] * len(questions)
+        with tracing.span("embed_query", queries=len(questions)):
+            vectors = self.embedder.embed_chunks(list(questions), batch_size=ingest.EMBED_BATCH_SIZE)
+        return list(np.asarray(vectors, dtype=np.float32))
+
+    def run_batch(self, questions: Sequence[Dict[str, Any]], concurrency: int | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        並行回答多個問題，依完成順序產生結果
+
+        :param questions: [{"id", "question", "history"(可省略)}, ...]（見 read_questions）
+        :param concurrency: 同時處理的問題數，預設為 max_concurrency
+        """
+        vectors = self._embed_questions([q["question"] for q in questions])
+        with ThreadPoolExecutor(max_workers=concurrency or self.max_concurrency, thread_name_prefix="engine") as pool:
+            futures = [
+                pool.submit(self.answer, q["question"], to_messages(q.get("history")), q.get("id"), vector)
+                for q, vector in zip(questions, vectors)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+# ----------------------------------------------------------------------
+# 3. 檔案輸入 / 輸出
+# ----------------------------------------------------------------------
+def _expand_paths(paths: Iterable[str | Path]) -> List[Path]:
+    files: List[Path] = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(
+                p for p in sorted(path.rglob("*"))
+                if p.is_file() and not any(part.startswith(".") for part in p.relative_to(path).parts)
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def read_questions(path: str | Path) -> List[Dict[str, Any]]:
+    """
+    讀取問題檔：.jsonl 每行 {"id"?, "question", "history"?}；其他副檔名每個非空行一個問題
+
+    :return: [{"id", "question", "history"}, ...]；未給 id 時使用行號
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if str(path).endswith(".jsonl"):
+                item = json.loads(line)
+                item.setdefault("id", line_number)
+                questions.append(item)
+            else:
+                questions.append({"id": line_number, "question": line})
+    return questions
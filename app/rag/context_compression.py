@@ -0,0 +1,185 @@
+# app/rag/context_compression.py
+"""
+以提問為中心的 context 壓縮（只保留與提問最相關的句子）
+
+A 500-character chunk that matches a question usually contains one or two
+sentences that matter; the rest still costs prefill time on a CPU-only
+Ollama host. This optional stage runs after rag.context_selection and before
+the prompt is built:
+
+1. every selected span is split into sentences;
+2. all sentences of the turn are embedded in one EmbeddingModel batch and
+   scored by cosine similarity to the question;
+3. the best sentences are kept, in their original order, until the context
+   is down to `ratio` of its characters (each span keeps at least its best
+   sentence, so no source disappears); dropped runs are shown as "…".
+
+CSV rows (spans without a character offset) are structured records and are
+passed through unchanged.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass, field, replace
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from utils import tracing
+
+from .context_selection import Span
+
+logger = logging.getLogger(__name__)
+
+GAP_MARKER = "…"  # 標示被略過的句子
+MIN_SENTENCE_CHARS = 20  # 更短的片段併入前一句（標題、編號等）
+
+# 句尾標點（含中文）或換行後切開；標點留在前一句
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？；])\s+|(?<=[。！？；])|\n+")
+
+
+@dataclass
+class Compression:
+    """
+    一次壓縮的結果與統計
+    """
+
+    spans: List[Span] = field(default_factory=list)
+    sentences_in: int = 0
+    sentences_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+
+# ----------------------------------------------------------------------
+# 1. Token 計數
+# ----------------------------------------------------------------------
+_encoder = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    以 tiktoken cl100k_base 計算 token 數（與上傳時的計數相同）；
+    tiktoken 無法使用時（未安裝、離線取不到 BPE 檔）以 4 字元 ≈ 1 token 估算
+    """
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.info(f"[壓縮] tiktoken 無法使用，改以字元數估算 token：{e}")
+            _encoder = False
+    if _encoder is False:
+        return (len(text) + 3) // 4
+    return len(_encoder.encode(text))
+
+
+# ----------------------------------------------------------------------
+# 2. 切句
+# ----------------------------------------------------------------------
+def split_sentences(text: str) -> List[str]:
+    """
+    切成句子（過短的片段併入前一句）
+    """
+    sentences: List[str] = []
+    for piece in _SENTENCE_END.split(text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if sentences and len(piece) < MIN_SENTENCE_CHARS:
+            sentences[-1] += " " + piece
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+# ----------------------------------------------------------------------
+# 3. 壓縮
+# ----------------------------------------------------------------------
+def compress(
+    embedder,
+    question: str,
+    spans: Sequence[Span],
+    ratio: float,
+    query_vector: np.ndarray | None = None,
+    batch_size: int = 64,
+) -> Compression:
+    """
+    只保留與提問最相關的句子
+
+    :param embedder: EmbeddingModel（已載入）
+    :param spans: rag.context_selection.select_context 的結果
+    :param ratio: 保留的字元比例（0–1）；1.0 不壓縮
+    :param query_vector: 已算好的提問向量（檢索時的那一個）
+    :return: Compression；spans 順序與輸入相同
+    """
+    with tracing.span("compress_context", spans=len(spans)) as attrs:
+        result = Compression(spans=list(spans))
+        result.tokens_in = result.tokens_out = sum(count_tokens(span.text) for span in spans)
+
+        # (span 索引, 句子) ；CSV 列與只有一句的片段不壓縮
+        sentences: List[Tuple[int, str]] = []
+        for i, span in enumerate(spans):
+            if span.start is None:
+                continue
+            parts = split_sentences(span.text)
+            if len(parts) > 1:
+                sentences.extend((i, sentence) for sentence in parts)
+        result.sentences_in = result.sentences_out = len(sentences)
+        if not sentences or ratio >= 1.0:
+            return result
+
+        # 一批嵌入所有句子
+        vectors = np.asarray(embedder.embed_chunks([s for _, s in sentences], batch_size=batch_size), dtype=np.float32)
+        if query_vector is None:
+            query_vector = embedder.embed_text(question)
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = (vectors @ query) / np.where(norms == 0, 1.0, norms)
+
+        # 每個片段先保留最相關的一句，再依分數補到字元預算
+        keep = np.zeros(len(sentences), dtype=bool)
+        span_ids = np.array([i for i, _ in sentences])
+        for i in np.unique(span_ids):
+            members = np.flatnonzero(span_ids == i)
+            keep[members[np.argmax(scores[members])]] = True
+        lengths = np.array([len(s) for _, s in sentences])
+        budget = ratio * lengths.sum()
+        used = lengths[keep].sum()
+        for j in np.argsort(-scores):
+            if used >= budget:
+                break
+            if not keep[j] and used + lengths[j] <= budget:
+                keep[j] = True
+                used += lengths[j]
+
+        for i in np.unique(span_ids):
+            members = np.flatnonzero(span_ids == i)
+            parts: List[str] = []
+            for position, j in enumerate(members):
+                if keep[j]:
+                    if position and not keep[members[position - 1]]:
+                        parts.append(GAP_MARKER)
+                    parts.append(sentences[j][1])
+            if not keep[members[-1]]:
+                parts.append(GAP_MARKER)
+            result.spans[i] = replace(spans[i], text=" ".join(parts))
+
+        result.sentences_out = int(keep.sum())
+        result.tokens_out = sum(count_tokens(span.text) for span in result.spans)
+        attrs.update(
+            sentences_in=result.sentences_in,
+            sentences_out=result.sentences_out,
+            tokens_in=result.tokens_in,
+            tokens_out=result.tokens_out,
+        )
+        tracing.count("context_tokens_saved", result.tokens_saved)
+        return result
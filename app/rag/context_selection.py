@@ -0,0 +1,276 @@
+# app/rag/context_selection.py
+"""
+檢索結果的 context 篩選（MMR → 合併相鄰片段 → 去重）
+
+Text is chunked small-to-big (rag.ingest): small child chunks, without
+overlap, are what gets embedded and searched, and each records the parent
+section it was cut from. The nearest neighbours of a question are therefore
+often consecutive children of the same section, and pasting the top hits
+verbatim gives a fragmented prompt (or, with the single-level chunking and
+its CHUNK_OVERLAP, repeats the overlap). This stage runs after the vector
+search:
+
+1. maximal marginal relevance over the stored chunk vectors picks chunks that
+   are relevant to the question but not to each other;
+2. when at least expand_min_hits of the picked chunks are children of the
+   same parent section (rag.ingest small-to-big chunking), the section's
+   other children are fetched too, so the whole section is pasted;
+3. chunks from the same file whose character ranges overlap or touch, or that
+   belong to the same section, are merged into one span (the overlap appears
+   once);
+4. spans whose text is identical to, or contained in, an earlier span are
+   dropped (e.g. the same file uploaded twice, repeated boilerplate).
+
+CSV rows carry no character offsets, so they are never merged.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from utils import tracing
+
+MERGE_GAP = 2  # 兩個片段之間最多相隔幾個字元（被切掉的空白）仍視為相鄰
+
+
+@dataclass
+class Span:
+    """
+    放進 prompt 的一段連續文字（一個或多個片段合併而成）
+    """
+
+    filename: str
+    text: str
+    score: float  # 組成片段中最高的相似度
+    doc_ids: List[int] = field(default_factory=list)
+    start: int | None = None  # 在原檔中的字元位置；None 表示無法合併（例如 CSV 列）
+    page: int | None = None  # 起始頁碼（rag.extraction 擷取的 PDF / DOCX）
+    parent: Tuple[int, int] | None = None  # 所屬父段落的 doc id 範圍（合併後為最後一個片段的）
+
+    @property
+    def end(self) -> int | None:
+        return None if self.start is None else self.start + len(self.text)
+
+
+# ----------------------------------------------------------------------
+# 1. MMR
+# ----------------------------------------------------------------------
+def mmr(
+    query_vector: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_: float = 0.7,
+    relevance: np.ndarray | None = None,
+) -> List[int]:
+    """
+    Maximal marginal relevance：每次挑 λ·相關度 − (1−λ)·與已選片段的最大相似度 最高者
+
+    :param query_vector: 查詢向量
+    :param vectors: 候選片段的向量，形狀 (n, dim)
+    :param k: 最多選幾個
+    :param lambda_: 1.0 只看相關度；越小越重視多樣性
+    :param relevance: 每個候選的相關度（預設為與查詢的 cosine）
+    :return: 選到的候選索引（依挑選順序）
+    """
+    n = len(vectors)
+    if not n or k <= 0:
+        return []
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    if relevance is None:
+        relevance = vectors @ _normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+    similarity = vectors @ vectors.T
+    selected: List[int] = []
+    # 每個候選與已選片段的最大相似度
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = np.where(available, lambda_ * relevance - (1.0 - lambda_) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+# ----------------------------------------------------------------------
+# 2. 合併相鄰片段
+# ----------------------------------------------------------------------
+def merge_adjacent(spans: Sequence[Span]) -> List[Span]:
+    """
+    同一檔案中字元範圍重疊或相鄰的片段合併成一段（重疊部分只保留一次）
+
+    :return: 合併後的片段，依分數由高到低
+    """
+    by_file: Dict[str, List[Span]] = {}
+    merged: List[Span] = []
+    for span in spans:
+        if span.start is None or span.start < 0:
+            merged.append(span)
+        else:
+            by_file.setdefault(span.filename, []).append(span)
+
+    for file_spans in by_file.values():
+        file_spans.sort(key=lambda s: s.start)
+        current = file_spans[0]
+        for span in file_spans[1:]:
+            gap = span.start - current.end
+            # 同一父段落中相鄰的子片段之間只隔著切片時去掉的空白，一律合併
+            siblings = span.parent is not None and span.parent == current.parent and span.doc_ids[0] == current.doc_ids[-1] + 1
+            if gap > MERGE_GAP and not siblings:
+                merged.append(current)
+                current = span
+                continue
+            if span.end > current.end:
+                # gap < 0：重疊，略過已有的部分；gap > 0：補回被切掉的空白（同樣長度，位置才對得上）
+                text = current.text + "\n" * max(0, gap) + span.text[max(0, -gap):]
+            else:
+                text = current.text  # 整段已包含在 current 裡
+            current = Span(
+                filename=current.filename,
+                text=text,
+                score=max(current.score, span.score),
+                doc_ids=current.doc_ids + span.doc_ids,
+                start=current.start,
+                page=current.page,
+                parent=span.parent,
+            )
+        merged.append(current)
+    merged.sort(key=lambda s: -s.score)
+    return merged
+
+
+# ----------------------------------------------------------------------
+# 3. 展開父段落
+# ----------------------------------------------------------------------
+def expand_parents(
+    store,
+    hits: Sequence[Tuple[int, float, str]],
+    entries: Dict[int, dict],
+    min_hits: int,
+    max_expansions: int | None = None,
+) -> List[Tuple[int, float, str]]:
+    """
+    同一父段落有 min_hits 個以上子片段被選中時，補上該段落其餘的子片段
+
+    :param hits: 已選的片段 [(doc_id, 相似度, 檔名), ...]
+    :param entries: hits 的 metadata（會就地加入補上的子片段）
+    :param max_expansions: 最多展開幾個父段落（依命中數）
+    :return: hits 加上補上的子片段（分數取該段落命中片段中的最高者）
+    """
+    by_parent: Counter = Counter()
+    best: Dict[Tuple[int, int], float] = {}
+    for doc_id, score, _ in hits:
+        parent = entries.get(doc_id, {}).get("parent")
+        if parent is not None:
+            parent = tuple(parent)
+            by_parent[parent] += 1
+            best[parent] = max(best.get(parent, score), score)
+    parents = [parent for parent, count in by_parent.most_common(max_expansions) if count >= min_hits]
+    missing = [doc_id for first, end in parents for doc_id in range(first, end) if doc_id not in entries]
+    if not missing:
+        return list(hits)
+    with tracing.span("fetch_parents", parents=len(parents), chunks=len(missing)):
+        entries.update(store.get_entries(missing))
+    siblings = [
+        (doc_id, best[tuple(entries[doc_id]["parent"])], entries[doc_id]["filename"])
+        for doc_id in missing
+        if doc_id in entries and "parent" in entries[doc_id]
+    ]
+    return [*hits, *siblings]
+
+
+# ----------------------------------------------------------------------
+# 4. 去重
+# ----------------------------------------------------------------------
+def _normalized(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def dedup(spans: Sequence[Span]) -> List[Span]:
+    """
+    去掉與前面某段相同、或完全包含在前面某段中的片段（依輸入順序保留）
+    """
+    kept: List[Span] = []
+    kept_texts: List[str] = []
+    for span in spans:
+        text = _normalized(span.text)
+        if any(text in other for other in kept_texts):
+            continue
+        kept.append(span)
+        kept_texts.append(text)
+    return kept
+
+
+# ----------------------------------------------------------------------
+# 5. 整體流程
+# ----------------------------------------------------------------------
+def select_context(
+    store,
+    query_vector: np.ndarray,
+    hits: Sequence[Tuple[int, float, str]],
+    max_chunks: int,
+    mmr_lambda: float | None = 0.7,
+    boost_file: str | None = None,
+    relevance: Sequence[float] | None = None,
+    expand_min_hits: int | None = None,
+    max_expansions: int | None = None,
+) -> List[Span]:
+    """
+    從搜尋結果挑出放進 prompt 的片段
+
+    :param store: VectorStoreManager（本地或索引服務客戶端）
+    :param hits: store.search 的結果 [(doc_id, 相似度, 檔名), ...]
+    :param max_chunks: 最多使用幾個片段（合併前）
+    :param mmr_lambda: MMR 的 λ；None 時不做 MMR，直接取前 max_chunks 個
+    :param boost_file: 這個檔案的片段優先（使用者提到「this file」時）
+    :param relevance: MMR 用的相關度（例如多查詢的融合分數）；預設為 hits 的相似度
+    :param expand_min_hits: 同一父段落選中這麼多個子片段時展開成整段；None 不展開
+    :param max_expansions: 最多展開幾個父段落
+    :return: 依分數排序的 Span；boost_file 的片段排在最前面
+    """
+    with tracing.span("select_context", candidates=len(hits)) as attrs:
+        if not hits:
+            return []
+        hits = list(hits)
+        if mmr_lambda is not None and len(hits) > 1:
+            if relevance is None:
+                relevance = [score for _, score, _ in hits]
+            relevance = np.array(relevance, dtype=np.float32)
+            if boost_file is not None:
+                # 相似度不超過 1，加 1 讓指定檔案的片段先被挑，但彼此之間仍考慮多樣性
+                relevance += np.array([filename == boost_file for _, _, filename in hits], dtype=np.float32)
+            vectors = store.get_vectors([doc_id for doc_id, _, _ in hits])
+            order = mmr(query_vector, vectors, max_chunks, mmr_lambda, relevance=relevance)
+            hits = [hits[i] for i in order]
+        else:
+            hits = hits[:max_chunks]
+
+        # 一次取回所有片段（使用索引服務時只需一次往返）
+        with tracing.span("fetch_chunks", chunks=len(hits)):
+            entries = store.get_entries([doc_id for doc_id, _, _ in hits])
+        selected = len(hits)
+        if expand_min_hits:
+            hits = expand_parents(store, hits, entries, expand_min_hits, max_expansions)
+        spans = [
+            Span(filename=filename, text=entries[doc_id]["text"], score=score, doc_ids=[doc_id],
+                 start=entries[doc_id].get("start"), page=entries[doc_id].get("page"),
+                 parent=tuple(entries[doc_id]["parent"]) if "parent" in entries[doc_id] else None)
+            for doc_id, score, filename in hits
+            if doc_id in entries and "text" in entries[doc_id]
+        ]
+        chars_in = sum(len(span.text) for span in spans)
+        spans = dedup(merge_adjacent(spans))
+        if boost_file is not None:
+            spans.sort(key=lambda s: s.filename != boost_file)  # 穩定排序：組內仍依分數
+        attrs.update(chunks=selected, expanded_chunks=len(hits) - selected, spans=len(spans), chars_in=chars_in, chars_out=sum(len(s.text) for s in spans))
+        return spans
@@ -0,0 +1,143 @@
+# app/rag/document_store.py
+"""
+原文文件庫（content‑addressed，memory‑mapped）
+
+Chunk metadata used to carry a full copy of every chunk's text, and the
+sidebar kept another copy of every uploaded file in st.session_state. Here
+each decoded document (a text file, or one page of a PDF / DOCX) is written
+once to <root>/<sha256>.txt as UTF‑8; a chunk only records
+[document key, byte offset, byte length], and its text is decoded straight
+out of the memory map when it is read. The documents live in the OS page
+cache instead of the Python heap, and identical documents are stored once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 擷取出的文字可能含單獨的 surrogate（例如 PDF），編碼與解碼用同一個處理方式
+_ERRORS = "surrogatepass"
+
+# 整個行程同時保持開啟的 memory map 數（每個 mmap 佔一個檔案描述符；超過時關掉最久沒用的）
+MAX_OPEN_MAPS = 64
+
+# 所有 DocumentStore 共用的 LRU：檔案路徑 → memory map（空檔案無法 mmap，存 b""）
+_maps: OrderedDict[Path, mmap.mmap | bytes] = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def encode(text: str) -> bytes:
+    return text.encode("utf-8", _ERRORS)
+
+
+def byte_ranges(text: str, ranges: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    把字元範圍換算成 text 以 UTF‑8 編碼後的 byte 範圍（依起點排序後只掃過一次）
+
+    :param ranges: [(字元位置, 字元數), ...]
+    :return: [(byte 位置, byte 數), ...]，順序同 ranges
+    """
+    if text.isascii():
+        return [(start, length) for start, length in ranges]
+    result: List[Tuple[int, int]] = [(0, 0)] * len(ranges)
+    char_pos = byte_pos = 0
+    for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+        start, length = ranges[i]
+        byte_pos += len(encode(text[char_pos:start]))
+        char_pos = start
+        result[i] = (byte_pos, len(encode(text[start:start + length])))
+    return result
+
+
+class DocumentStore:
+    """
+    以內容雜湊為 key 的原文儲存（每份文件一個檔案，讀取時 memory‑map）
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        """
+        :param root: 文件存放的資料夾（不存在時於第一次寫入時建立）
+        """
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.txt"
+
+    def put(self, text: str) -> str:
+        """
+        寫入一份文件（內容相同的文件只存一次）
+
+        :return: 文件 key（UTF‑8 內容的 sha256）
+        """
+        data = encode(text)
+        key = hashlib.sha256(data).hexdigest()
+        path = self.path(key)
+        if not path.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            # 先寫到暫存檔再改名，其他執行緒 / 行程不會讀到寫一半的檔案
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return key
+
+    def read(self, key: str, offset: int = 0, length: int | None = None) -> str:
+        """
+        從 memory map 切出一段文字（只解碼這一段）；length 為 None 時讀整份文件（不 mmap）
+
+        :param offset: byte 位置
+        :param length: byte 數；None 讀到文件結尾
+        """
+        if length is None:
+            return str(self.path(key).read_bytes()[offset:], "utf-8", _ERRORS)
+        # 持有鎖切片與解碼，map 不會在使用中被另一個執行緒淘汰關閉
+        with _maps_lock:
+            data = self._map(key)
+            with memoryview(data)[offset:offset + length] as view:
+                return str(view, "utf-8", _ERRORS)
+
+    def _map(self, key: str) -> mmap.mmap | bytes:
+        # 呼叫端需持有 _maps_lock
+        path = self.path(key)
+        data = _maps.get(path)
+        if data is not None:
+            _maps.move_to_end(path)
+            return data
+        with open(path, "rb") as f:
+            # 長度 0 的檔案無法 mmap
+            size = os.fstat(f.fileno()).st_size
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        _maps[path] = data
+        while len(_maps) > MAX_OPEN_MAPS:
+            _, evicted = _maps.popitem(last=False)
+            if isinstance(evicted, mmap.mmap):
+                evicted.close()
+        return data
+
+    def close(self) -> None:
+        """
+        關閉此文件庫的 memory map（檔案仍留在磁碟上，下次讀取時重開）
+        """
+        with _maps_lock:
+            for path in [path for path in _maps if path.parent == self.root]:
+                data = _maps.pop(path)
+                if isinstance(data, mmap.mmap):
+                    data.close()
+
+    def clear(self) -> None:
+        """
+        關閉 memory map 並刪除所有文件
+        """
+        self.close()
+        if self.root.exists():
+            shutil.rmtree(self.root, ignore_errors=True)
+            logger.info(f"[文件庫] 已刪除：{self.root}")
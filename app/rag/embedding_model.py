@@ -3,16 +3,36 @@
 嵌入模型管理模組
 
 本模組負責載入 sentence‑transformers 的嵌入模型，並提供單一句子或多句子
-的向量化函式。
+的向量化函式。模型先從本機模型登錄（rag.model_registry）解析，
+已登錄的模型離線載入。
+
+backend 決定 CPU 上的推論方式：
+  * "torch"：原本的 PyTorch 模型（參考實作）
+  * "torch-int8"：對 nn.Linear 做動態 int8 量化（只需 torch）
+  * "onnx"：sentence‑transformers 的 ONNX Runtime 後端（需要 optimum / onnxruntime）
+換後端後可用 cosine_parity() 確認向量與 "torch" 參考模型夠接近。
 """
 
 from __future__ import annotations
 
+import hashlib
+import logging
+import re
+import threading
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, List
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+import config as default_config
+
+if TYPE_CHECKING:
+    # sentence_transformers 會拉進 torch，只在 load() 時才真正匯入
+    from sentence_transformers import SentenceTransformer
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+logger = logging.getLogger(__name__)
 
 
 class EmbeddingModel:
@@ -20,21 +40,92 @@ class EmbeddingModel:
     嵌入模型封裝類別
     """
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2") -> None:
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        backend: str = "torch",
+        num_threads: int | None = None,
+        max_seq_length: int | None = None,
+    ) -> None:
         """
         建構子
 
         :param model_name: 要載入的模型名稱
+        :param backend: "torch"、"torch-int8" 或 "onnx"
+        :param num_threads: 推論用的 CPU 執行緒數（None = 函式庫預設）
+        :param max_seq_length: token 長度上限；超過模型本身上限時以模型為準
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的 embedding backend：{backend}")
         self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
+        self.max_seq_length = max_seq_length
         self.model: SentenceTransformer | None = None
+        # 背景暖機與上傳流程可能同時呼叫 load()，避免重複載入
+        self._load_lock = threading.Lock()
 
     def load(self) -> None:
         """
-        載入模型（只執行一次）
+        載入模型（只執行一次，執行緒安全）
+        """
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is None:
+                self.model = self._load_backend()
+
+    def _load_backend(self) -> "SentenceTransformer":
+        from sentence_transformers import SentenceTransformer
+
+        from .model_registry import model_registry
+
+        # 已登錄的模型從本機 safetensors 載入，完全不連網
+        local_dir = model_registry.resolve(self.model_name)
+        if local_dir is not None:
+            name_or_path, local_only = str(local_dir), True
+        elif default_config.MODEL_REGISTRY_REQUIRED:
+            raise RuntimeError(
+                f"模型 {self.model_name} 尚未登錄，請先執行 installation/register-models.py"
+            )
+        else:
+            name_or_path, local_only = self.model_name, False
+            logger.info(f"[模型] {self.model_name} 未登錄，改從 Hugging Face Hub 載入")
+
+        if self.num_threads and self.backend != "onnx":
+            import torch
+            torch.set_num_threads(self.num_threads)
+
+        if self.backend == "onnx":
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+            if self.num_threads:
+                import onnxruntime
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = self.num_threads
+                model_kwargs["session_options"] = options
+            model = SentenceTransformer(
+                name_or_path, backend="onnx", model_kwargs=model_kwargs, local_files_only=local_only
+            )
+        else:
+            model = SentenceTransformer(name_or_path, device="cpu", local_files_only=local_only)
+            if self.backend == "torch-int8":
+                import torch
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        # 注意力成本隨長度平方成長；encode() 已依長度排序並只 pad 到批次內最長，
+        # 這裡再把上限壓到設定值，過長的片段直接截斷
+        if self.max_seq_length and model.max_seq_length:
+            model.max_seq_length = min(model.max_seq_length, self.max_seq_length)
+        return model
+
+    @property
+    def dimension(self) -> int:
+        """
+        向量維度（需先 load()）
         """
         if self.model is None:
-            self.model = SentenceTransformer(self.model_name)
+            raise RuntimeError("Embedding model 尚未載入，請先呼叫 load()")
+        return self.model.get_sentence_embedding_dimension()
 
     def embed_text(self, text: str) -> np.ndarray:
         """
@@ -47,17 +138,79 @@ class EmbeddingModel:
             raise RuntimeError("Embedding model 尚未載入，請先呼叫 load()")
         return self.model.encode(text, convert_to_numpy=True)
 
-    def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+    def embed_chunks(self, chunks: List[str], batch_size: int = 32) -> np.ndarray:
         """
         批次嵌入多個文字片段
 
         :param chunks: 文字片段清單
+        :param batch_size: 每批送進模型的片段數
         :return: 形狀 (len(chunks), 512) 的 numpy 陣列
         """
         if self.model is None:
             raise RuntimeError("Embedding model 尚未載入，請先呼叫 load()")
-        return self.model.encode(chunks, convert_to_numpy=True)
+        return self.model.encode(chunks, batch_size=batch_size, convert_to_numpy=True)
+
+
+class HashEmbeddingModel:
+    """
+    不需下載模型的確定性假嵌入（feature hashing 的詞袋向量，已正規化）
+
+    介面與 EmbeddingModel 相同，供 benchmarks 與無模型環境使用；
+    共用詞彙越多的文字 cosine 越高，所以 recall 仍有意義。
+    """
+
+    def __init__(self, dim: int = 384) -> None:
+        self.model_name = f"hash-{dim}"
+        self.backend = "hash"
+        self._dim = dim
+        self.model = self  # 與 EmbeddingModel 一樣以 model 是否為 None 判斷已載入
+
+    def load(self) -> None:
+        pass
+
+    @property
+    def dimension(self) -> int:
+        return self._dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self._dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self._dim] += 1.0 if (digest >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self._embed(text)
+
+    def embed_chunks(self, chunks: List[str], batch_size: int = 32) -> np.ndarray:
+        if not chunks:
+            return np.zeros((0, self._dim), dtype=np.float32)
+        return np.vstack([self._embed(chunk) for chunk in chunks])
+
+
+def cosine_parity(candidate: EmbeddingModel, reference: EmbeddingModel, texts: List[str]) -> np.ndarray:
+    """
+    比較兩個模型對同一批文字的向量
+
+    :param candidate: 要驗證的模型（例如 onnx / torch-int8 後端）
+    :param reference: 參考模型（通常是 "torch" 後端）
+    :param texts: 驗證用的文字
+    :return: 每段文字兩個向量間的 cosine 相似度
+    """
+    candidate.load()
+    reference.load()
+    a = candidate.embed_chunks(texts)
+    b = reference.embed_chunks(texts)
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
 
 
 # 單例實例（供其他模組直接 import）
-embedding_model = EmbeddingModel()
\ No newline at end of file
+embedding_model = EmbeddingModel(
+    model_name=default_config.EMBEDDING_MODEL_NAME,
+    backend=default_config.EMBEDDING_BACKEND,
+    num_threads=default_config.EMBEDDING_NUM_THREADS,
+    max_seq_length=default_config.EMBEDDING_MAX_SEQ_LENGTH,
+)
@@ -0,0 +1,468 @@
+# app/rag/extraction.py
+"""
+多格式文件的文字擷取（PDF、DOCX、HTML、Markdown、純文字）
+
+Runs in front of chunking (rag.ingest). PDF page ranges, DOCX and HTML files
+are extracted in a process pool, so several documents (and the pages of a long
+PDF) are parsed in parallel without holding the GIL of the Streamlit process;
+plain text, CSV and Markdown are only decoded, in the calling process.
+
+extract_files() yields Page objects as soon as they are ready: each file's
+pages come out in page order, but files are interleaved in completion order,
+so the caller can chunk and embed the first pages of a long PDF while the
+rest is still being parsed. Page numbers (1-based) travel with the text and
+end up in the chunk metadata as provenance.
+
+A PDF is written once to a temporary file and the page-range tasks receive
+its path, so the bytes are not pickled into every task and each worker only
+loads the pages it extracts. The first task also counts the pages (the rest
+of the ranges are submitted when it returns), so not even the page tree is
+parsed in the calling Streamlit thread.
+
+Extracted pages are cached on disk by the SHA-256 of the file bytes
+(EXTRACTION_CACHE_DIR), so uploading the same document again skips parsing.
+The cache holds document text, so it is pruned on every call: entries older
+than EXTRACTION_CACHE_MAX_AGE_SECONDS are removed, then the least recently
+used until it fits in EXTRACTION_CACHE_MAX_MB.
+
+PDF support needs pypdf (pip install pypdf), imported only when a PDF is
+extracted; DOCX and HTML use the standard library.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import html
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+from xml.etree import ElementTree
+
+import config as default_config
+from utils import tracing
+
+from .ingest import decode_bytes
+
+logger = logging.getLogger(__name__)
+
+PAGE_SEPARATOR = "\n\n"  # 組回整份文字時頁與頁之間的分隔
+PDF_PAGES_PER_TASK = 8  # 每個行程池工作處理的 PDF 頁數
+_PDF_HEAD = -1  # 工作索引：PDF 的第一個工作（回傳頁數與前幾頁）
+CACHE_VERSION = 1  # 擷取方式改變時加一，讓舊快取失效
+
+_PDF = (".pdf",)
+_DOCX = (".docx",)
+_HTML = (".html", ".htm", ".xhtml")
+_MARKDOWN = (".md", ".markdown")
+
+
+@dataclass
+class Page:
+    """
+    擷取出的一頁文字
+    """
+
+    filename: str
+    number: int | None  # 從 1 起算的頁碼；沒有分頁的格式為 None
+    text: str
+    start: int = 0  # 在整份文字（各頁以 PAGE_SEPARATOR 相接）中的字元位置
+    error: str | None = None  # 擷取失敗時的原因（此時 text 為空，該檔案之後不再有 Page）
+
+
+def join_pages(pages: Sequence[Page]) -> str:
+    """
+    同一檔案的各頁組回整份文字（Page.start 以此為準）
+    """
+    return PAGE_SEPARATOR.join(page.text for page in pages)
+
+
+# ----------------------------------------------------------------------
+# 1. 各格式的擷取（在行程池中執行，必須是模組層級函式）
+# ----------------------------------------------------------------------
+def _pdf_reader(stream):
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise RuntimeError("PDF 擷取需要 pypdf：pip install pypdf") from e
+    return PdfReader(stream)
+
+
+def _pdf_pages(reader, first: int, last: int) -> List[Tuple[int | None, str]]:
+    return [(number + 1, reader.pages[number].extract_text() or "") for number in range(first, last)]
+
+
+def _extract_pdf_head(path: str) -> Tuple[int, List[Tuple[int | None, str]]]:
+    """
+    PDF 的第一個工作：解析頁數，並擷取前 PDF_PAGES_PER_TASK 頁
+
+    :param path: PDF 暫存檔
+    :return: (頁數, [(頁碼, 文字), ...])
+    """
+    with open(path, "rb") as f:
+        reader = _pdf_reader(f)
+        count = len(reader.pages)
+        return count, _pdf_pages(reader, 0, min(count, PDF_PAGES_PER_TASK))
+
+
+def _extract_pdf_pages(path: str, first: int, last: int) -> List[Tuple[int | None, str]]:
+    """
+    :param path: PDF 暫存檔（pypdf 只讀取用到的物件，不必把整個檔案傳進工作行程）
+    :return: [(頁碼, 文字), ...]，頁碼 first+1 … last
+    """
+    with open(path, "rb") as f:
+        return _pdf_pages(_pdf_reader(f), first, last)
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _extract_docx(data: bytes) -> List[Tuple[int | None, str]]:
+    """
+    讀 word/document.xml；頁碼依 Word 存檔時記下的分頁位置（w:lastRenderedPageBreak），
+    沒有時依手動分頁符號
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+    rendered_breaks = root.find(f".//{_W}lastRenderedPageBreak") is not None
+    pages: List[List[str]] = [[]]
+    for paragraph in root.iter(f"{_W}p"):
+        parts: List[str] = []
+        for node in paragraph.iter():
+            if node.tag == f"{_W}t":
+                parts.append(node.text or "")
+            elif node.tag == f"{_W}tab":
+                parts.append("\t")
+            elif node.tag == f"{_W}br" and node.get(f"{_W}type") != "page":
+                parts.append("\n")
+            elif (node.tag == f"{_W}lastRenderedPageBreak") if rendered_breaks else (
+                node.tag == f"{_W}br" and node.get(f"{_W}type") == "page"
+            ):
+                if pages[-1] or parts:
+                    pages[-1].append("".join(parts))
+                    pages.append([])
+                    parts = []
+        pages[-1].append("".join(parts))
+    texts = ["\n".join(p for p in page).strip() for page in pages]
+    if len(texts) == 1:
+        return [(None, texts[0])]
+    return [(number, text) for number, text in enumerate(texts, start=1)]
+
+
+class _HTMLText(HTMLParser):
+    """
+    HTML → 純文字：略過 script / style，區塊元素換行
+    """
+
+    _SKIP = {"script", "style", "noscript", "template", "svg"}
+    _BLOCK = {
+        "p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article",
+        "header", "footer", "blockquote", "pre", "table", "ul", "ol", "dt", "dd", "title",
+    }
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in self._SKIP:
+            self._skipping += 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self._SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data: str) -> None:
+        if not self._skipping:
+            self.parts.append(data)
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in "".join(self.parts).splitlines())
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def _extract_html(data: bytes) -> List[Tuple[int | None, str]]:
+    text, _ = decode_bytes(data)
+    if text is None:
+        raise ValueError("無法解碼")
+    parser = _HTMLText()
+    parser.feed(text)
+    parser.close()
+    return [(None, parser.text())]
+
+
+def _markdown_text(text: str) -> str:
+    """
+    Markdown 本身就是可讀的文字，只去掉 front matter、HTML 註解、圖片與連結網址
+    """
+    text = re.sub(r"\A---\n.*?\n---\n", "", text, flags=re.S)
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.S)
+    text = re.sub(r"!\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"\[([^\]]+)\]\([^)]*\)", r"\1", text)
+    return html.unescape(text)
+
+
+# ----------------------------------------------------------------------
+# 2. 快取
+# ----------------------------------------------------------------------
+def _cache_path(cache_dir: str | Path | None, digest: str) -> Path | None:
+    return Path(cache_dir) / f"{digest}.json" if cache_dir else None
+
+
+def _cache_load(path: Path | None) -> List[Tuple[int | None, str]] | None:
+    if path is None or not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [(number, text) for number, text in json.load(f)["pages"]]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"[擷取] 快取損毀，重新擷取：{path}（{e}）")
+        return None
+
+
+def _cache_touch(path: Path) -> None:
+    # 命中時更新修改時間，_cache_prune 依此判斷最近使用
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _cache_prune(cache_dir: str | Path | None) -> None:
+    """
+    刪除過期的快取，再依最近使用時間刪到總大小不超過上限
+    """
+    if not cache_dir or not Path(cache_dir).is_dir():
+        return
+    entries = []
+    for path in Path(cache_dir).glob("*.json"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    cutoff = time.time() - default_config.EXTRACTION_CACHE_MAX_AGE_SECONDS
+    budget = default_config.EXTRACTION_CACHE_MAX_MB * 1024 * 1024
+    total = 0
+    for mtime, size, path in sorted(entries, reverse=True):  # 最近使用的排前面
+        if mtime >= cutoff and total + size <= budget:
+            total += size
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def _cache_store(path: Path | None, pages: List[Tuple[int | None, str]]) -> None:
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"[擷取] 無法寫入快取 {path}：{e}")
+
+
+# ----------------------------------------------------------------------
+# 3. 行程池
+# ----------------------------------------------------------------------
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = default_config.EXTRACTION_MAX_WORKERS or min(4, os.cpu_count() or 1)
+            # spawn：Streamlit 行程有許多執行緒，fork 之後的子行程可能卡在被複製的鎖上
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    """
+    關閉行程池（下次擷取時重新建立）
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _submit(fn: Callable, *args: Any) -> Future:
+    try:
+        return _get_pool().submit(fn, *args)
+    except BrokenProcessPool:
+        # 某個工作行程異常結束（例如記憶體不足被終止）後整個池都不能再用，換一個新的
+        shutdown()
+        return _get_pool().submit(fn, *args)
+
+
+def _run_inline(fn: Callable, *args: Any) -> Future:
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+# ----------------------------------------------------------------------
+# 4. 整體流程
+# ----------------------------------------------------------------------
+@dataclass
+class _Document:
+    filename: str
+    cache_path: Path | None
+    temp_path: str | None = None  # PDF 暫存檔（所有頁都擷取完後刪除）
+    parts: List[List[Tuple[int | None, str]] | None] = field(default_factory=list)
+    released: int = 0  # 已送出的 parts 數
+    offset: int = 0
+    pages_out: int = 0
+    error: str | None = None
+
+    def release(self) -> Iterator[Page]:
+        """
+        依頁序送出已完成的部分
+        """
+        if self.error is not None:
+            if self.released >= 0:
+                self.released = -1
+                self.remove_temp()
+                yield Page(self.filename, None, "", error=self.error)
+            return
+        while 0 <= self.released < len(self.parts) and self.parts[self.released] is not None:
+            for number, text in self.parts[self.released]:
+                if self.pages_out:
+                    self.offset += len(PAGE_SEPARATOR)
+                yield Page(self.filename, number, text, start=self.offset)
+                self.offset += len(text)
+                self.pages_out += 1
+            self.released += 1
+        if self.released == len(self.parts):
+            self.remove_temp()
+            pages = [page for part in self.parts for page in part]
+            if pages:
+                _cache_store(self.cache_path, pages)
+            self.released = -1
+
+    def remove_temp(self) -> None:
+        if self.temp_path is not None:
+            try:
+                os.remove(self.temp_path)
+            except OSError:
+                pass
+            self.temp_path = None
+
+
+def extract_files(
+    files: Sequence[Tuple[str, bytes]],
+    cache_dir: str | Path | None = default_config.EXTRACTION_CACHE_DIR,
+) -> Iterator[Page]:
+    """
+    擷取多個檔案的文字
+
+    :param files: [(檔名, 原始內容), ...]
+    :param cache_dir: 擷取結果的快取資料夾；None 不使用快取
+    :return: 逐頁產生 Page；同一檔案的頁依序，不同檔案依完成順序交錯。
+        無法擷取的檔案產生一個 error 不為 None 的 Page
+    """
+    _cache_prune(cache_dir)
+    documents: List[_Document] = []
+    tasks: List[Tuple[_Document, int, Callable, tuple]] = []  # i 為 _PDF_HEAD 時是 PDF 的第一個工作
+    for filename, data in files:
+        digest = hashlib.sha256(data).hexdigest()
+        document = _Document(filename, _cache_path(cache_dir, f"{digest}-v{CACHE_VERSION}"))
+        documents.append(document)
+        suffix = Path(filename).suffix.lower()
+        cached = _cache_load(document.cache_path)
+        # 空的結果不算命中（舊版會快取沒有頁的 PDF）
+        if cached:
+            tracing.count("extraction_cache_hits")
+            _cache_touch(document.cache_path)
+            document.parts = [cached]
+            document.cache_path = None  # 已在快取中
+            continue
+        try:
+            if suffix in _PDF:
+                # 寫一次暫存檔，各工作只傳路徑；頁數由第一個工作解析，其餘頁段等它回來再送出
+                fd, document.temp_path = tempfile.mkstemp(suffix=".pdf", prefix="extract-")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                document.parts = [None]
+                tasks.append((document, _PDF_HEAD, _extract_pdf_head, (document.temp_path,)))
+            elif suffix in _DOCX or suffix in _HTML:
+                document.parts = [None]
+                tasks.append((document, 0, _extract_docx if suffix in _DOCX else _extract_html, (data,)))
+            else:
+                # 純文字、CSV、Markdown：只需解碼，不值得送進行程池
+                text, _ = decode_bytes(data)
+                if text is None:
+                    raise ValueError("無法解碼，可能是不支援的編碼或格式")
+                document.parts = [[(None, _markdown_text(text) if suffix in _MARKDOWN else text)]]
+                document.cache_path = None
+        except Exception as e:
+            document.error = str(e)
+
+    # 只有一個工作時不必啟動行程池（PDF 除外：頁數未知，後續頁段還要送進行程池）
+    pending: Dict[Future, Tuple[_Document, int]] = {}
+    inline = len(tasks) <= 1 and all(i != _PDF_HEAD for _, i, _, _ in tasks)
+    for document, i, fn, args in tasks:
+        future = _run_inline(fn, *args) if inline else _submit(fn, *args)
+        pending[future] = (document, i)
+
+    try:
+        for document in documents:
+            yield from document.release()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                document, i = pending.pop(future)
+                try:
+                    if i == _PDF_HEAD:
+                        count, document.parts[0] = future.result()
+                        if not count:
+                            raise ValueError("PDF 沒有任何頁（空白文件或頁面結構損壞）")
+                        for first in range(PDF_PAGES_PER_TASK, count, PDF_PAGES_PER_TASK):
+                            document.parts.append(None)
+                            last = min(first + PDF_PAGES_PER_TASK, count)
+                            pending[_submit(_extract_pdf_pages, document.temp_path, first, last)] = (document, len(document.parts) - 1)
+                    else:
+                        document.parts[i] = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        shutdown()
+                    logger.warning(f"[擷取] {document.filename} 失敗：{e}")
+                    document.error = document.error or f"{type(e).__name__}: {e}"
+                yield from document.release()
+    finally:
+        # 呼叫端提前停止時，取消還沒開始的工作；已在執行的工作結束前暫存檔還不能刪
+        for future in pending:
+            future.cancel()
+        if pending:
+            wait(pending)
+        for document in documents:
+            document.remove_temp()
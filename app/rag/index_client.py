@@ -0,0 +1,158 @@
+# app/rag/index_client.py
+"""
+向量索引服務的客戶端與通訊協定
+
+Frames on the Unix socket are a 4-byte big-endian length followed by a UTF-8
+JSON body. A request frame carries a list of operations, so several calls
+(e.g. add + save, or a batch of searches) cost one round-trip:
+
+    {"requests": [{"op": "search", "namespace": "...", "vectors": {...}, "k": 5}, ...]}
+    {"responses": [{"ok": true, "result": ...}, ...]}
+
+Vectors travel as {"shape": [n, d], "data": <base64 float32>}.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import select
+import socket
+import struct
+import threading
+from typing import Any, Dict, List
+
+import numpy as np
+
+_HEADER = struct.Struct(">I")
+
+
+class IndexServerError(RuntimeError):
+    """
+    索引服務回傳錯誤
+    """
+
+
+def encode_vectors(vectors: np.ndarray) -> Dict[str, Any]:
+    array = np.ascontiguousarray(vectors, dtype=np.float32)
+    if array.ndim == 1:
+        array = array.reshape(1, -1)
+    return {"shape": list(array.shape), "data": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def decode_vectors(payload: Dict[str, Any]) -> np.ndarray:
+    data = base64.b64decode(payload["data"])
+    return np.frombuffer(data, dtype=np.float32).reshape(payload["shape"])
+
+
+def send_frame(sock: socket.socket, message: Dict[str, Any]) -> None:
+    body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("index server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+class IndexClient:
+    """
+    索引服務客戶端（每個執行緒一條連線；連線失效時自動重連）
+
+    請求送出後就不會重送：add 之類的操作不是冪等的，重送一次就會讓
+    FAISS 位置與 doc id 對不上。只有在請求還沒送出時才換一條新連線。
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 60.0) -> None:
+        """
+        建構子
+
+        :param socket_path: 索引服務的 Unix socket 路徑
+        :param timeout: 單次請求逾時秒數
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+            self._local.sock = None
+
+    def _cached(self) -> socket.socket | None:
+        """
+        目前執行緒的連線；服務端已關閉（例如重啟過）的連線先丟掉
+        """
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            return None
+        try:
+            # 閒置的連線不該有資料可讀；可讀且讀到 EOF 表示對方已關閉
+            readable, _, _ = select.select([sock], [], [], 0)
+            if readable and not sock.recv(1, socket.MSG_PEEK):
+                raise ConnectionError("stale connection")
+        except (ConnectionError, OSError, ValueError):
+            self._close()
+            return None
+        return sock
+
+    def call_batch(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """
+        一次送出多個操作，回傳各操作的結果
+
+        :param requests: [{"op": ..., "namespace": ..., ...}, ...]
+        :return: 與 requests 對應的結果清單
+        """
+        message = {"requests": requests}
+        sock = self._cached()
+        try:
+            if sock is None:
+                sock = self._connect()
+                send_frame(sock, message)
+            else:
+                try:
+                    send_frame(sock, message)
+                except OSError:
+                    # 送出失敗：服務端收不到完整的 frame，不會執行，可以換條連線重送
+                    self._close()
+                    sock = self._connect()
+                    send_frame(sock, message)
+            reply = recv_frame(sock)
+        except (ConnectionError, OSError):
+            # 請求可能已經執行，不重送
+            self._close()
+            raise
+        results = []
+        for response in reply["responses"]:
+            if not response.get("ok"):
+                raise IndexServerError(response.get("error", "unknown error"))
+            results.append(response.get("result"))
+        return results
+
+    def call(self, op: str, **params: Any) -> Any:
+        """
+        送出單一操作
+        """
+        return self.call_batch([{"op": op, **params}])[0]
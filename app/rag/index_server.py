@@ -0,0 +1,173 @@
+# app/rag/index_server.py
+"""
+共用向量索引服務
+
+With several Streamlit worker processes behind a load balancer, each worker
+used to hold its own FAISS index and metadata. In index-server mode a single
+process owns every store (one VectorStoreRegistry, with its memory cap and
+idle spilling) and the workers talk to it over a Unix socket, so RAM stays
+flat as workers are added and every worker sees the same data.
+
+Run it from the app directory:
+
+    python -m rag.index_server --socket /tmp/localllm-index.sock
+
+and set INDEX_SERVER_SOCKET in config.py to the same path. The wire protocol
+is described in rag.index_client.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import socketserver
+from typing import Any, Callable, Dict
+
+import config as default_config
+
+from .index_client import decode_vectors, encode_vectors, recv_frame, send_frame
+from .store_registry import VectorStoreRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def _op_init(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    registry.get(request["namespace"]).init_vector_store(dim=request["dim"])
+
+
+def _op_add(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    registry.get(request["namespace"]).add_documents(
+        request["ids"],
+        decode_vectors(request["vectors"]),
+        request["texts"],
+        request["filenames"],
+        request.get("starts"),
+        request.get("pages"),
+        request.get("parents"),
+        request.get("sources"),
+    )
+
+
+def _op_put_document(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    return registry.get(request["namespace"]).put_document(request["text"])
+
+
+def _op_get_document(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    return registry.get(request["namespace"]).get_document(request["key"])
+
+
+def _op_search(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    manager = registry.get(request["namespace"])
+    vectors = decode_vectors(request["vectors"])
+    return manager.search_batch(vectors, k=request["k"])
+
+
+def _op_get_entries(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    entries = registry.get(request["namespace"]).get_entries(request["ids"])
+    # JSON 的 key 只能是字串
+    return {str(doc_id): entry for doc_id, entry in entries.items()}
+
+
+def _op_get_vectors(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    return encode_vectors(registry.get(request["namespace"]).get_vectors(request["ids"]))
+
+
+def _op_save(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    registry.get(request["namespace"]).save_metadata()
+
+
+def _op_clear(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    registry.get(request["namespace"]).clear_index()
+
+
+def _op_release(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    registry.release(request["namespace"])
+
+
+def _op_exists(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    return registry.get(request["namespace"]).exists()
+
+
+def _op_stats(registry: VectorStoreRegistry, request: Dict[str, Any]) -> Any:
+    return registry.memory_usage()
+
+
+OPERATIONS: Dict[str, Callable[[VectorStoreRegistry, Dict[str, Any]], Any]] = {
+    "init": _op_init,
+    "add": _op_add,
+    "put_document": _op_put_document,
+    "get_document": _op_get_document,
+    "search": _op_search,
+    "get_entries": _op_get_entries,
+    "get_vectors": _op_get_vectors,
+    "save": _op_save,
+    "clear": _op_clear,
+    "release": _op_release,
+    "exists": _op_exists,
+    "stats": _op_stats,
+}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        registry: VectorStoreRegistry = self.server.registry  # type: ignore[attr-defined]
+        while True:
+            try:
+                message = recv_frame(self.connection)
+            except ConnectionError:
+                return
+            responses = []
+            for request in message.get("requests", []):
+                op = OPERATIONS.get(request.get("op"))
+                if op is None:
+                    responses.append({"ok": False, "error": f"unknown op {request.get('op')!r}"})
+                    continue
+                try:
+                    responses.append({"ok": True, "result": op(registry, request)})
+                except Exception as e:  # 回傳給客戶端，不要讓整條連線掛掉
+                    logger.exception(f"index op {request.get('op')} failed")
+                    responses.append({"ok": False, "error": str(e)})
+            send_frame(self.connection, {"responses": responses})
+
+
+class IndexServer(socketserver.ThreadingUnixStreamServer):
+    """
+    以 Unix socket 提供向量索引服務（每條連線一個執行緒）
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, registry: VectorStoreRegistry) -> None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # 上次沒清掉的 socket 檔
+        super().__init__(socket_path, _Handler)
+        self.registry = registry
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shared FAISS index server for multi-worker deployments.")
+    parser.add_argument("--socket", default=default_config.INDEX_SERVER_SOCKET or "/tmp/localllm-index.sock")
+    parser.add_argument("--root", default=default_config.VECTOR_STORE_ROOT)
+    parser.add_argument("--memory-cap-mb", type=int, default=default_config.VECTOR_STORE_MEMORY_CAP_MB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    registry = VectorStoreRegistry(
+        root=args.root,
+        memory_cap_bytes=args.memory_cap_mb * 1024 * 1024,
+        idle_seconds=default_config.VECTOR_STORE_IDLE_SECONDS,
+        delete_after_seconds=default_config.VECTOR_STORE_DELETE_AFTER_SECONDS,
+        index_options=default_config.VECTOR_STORE_INDEX_OPTIONS,
+    )
+    registry.purge_orphans()
+    with IndexServer(args.socket, registry) as server:
+        logger.info(f"index server listening on {args.socket}")
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
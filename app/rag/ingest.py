@@ -0,0 +1,347 @@
+# app/rag/ingest.py
+"""
+上傳檔案的 RAG 前處理模組（解碼 → 切片 → 嵌入 → 建索引）
+
+These steps used to live inside sidebar.process_uploaded_files, mixed with
+Streamlit calls. Keeping them here lets benchmarks/bench_rag.py (and any
+other headless caller) run exactly the code the UI runs.
+
+Text files are chunked one file at a time, so every chunk keeps its own
+filename and its character offset in that file; CSV files become one chunk
+per row.
+
+Text is chunked on two levels ("small-to-big"): the file is cut into parent
+sections of PARENT_CHUNK_SIZE characters, and each section into child chunks
+of CHUNK_SIZE without overlap. Only the children are embedded and searched
+(precise matches, embedding cost at the child level); each child records the
+doc-id range of its section, and rag.context_selection pastes the whole
+section when several of its children are retrieved.
+
+The decoded text itself goes to the store's document store (one document per
+text file or per page, see rag.document_store); chunks cut from it are indexed
+as [document key, byte offset, byte length] instead of a copy of their text.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from utils import tracing
+
+from .document_store import byte_ranges
+
+# 依序嘗試的編碼
+ENCODINGS = ("utf-8", "big5", "gbk", "gb2312", "latin-1")
+
+CHUNK_SIZE = 400  # 子片段的字元數（嵌入與檢索的單位）；較小的片段檢索較精準
+CHUNK_OVERLAP = 0  # 上下文由父段落在查詢時補上，不再靠重疊（重疊會重複儲存與重複放進 prompt）
+PARENT_CHUNK_SIZE = 2000  # 父段落的字元數；None 時不分層（單層切片，建議搭配重疊）
+EMBED_BATCH_SIZE = 64
+
+
+@dataclass
+class Chunk:
+    """
+    一個要嵌入的片段
+    """
+
+    text: str
+    filename: str
+    start: int | None = 0  # 在原檔（解碼後文字）中的字元位置；CSV 列為 None
+    row: int | None = None  # CSV 的列號
+    page: int | None = None  # PDF / DOCX 的頁碼（rag.extraction）
+    parent: int | None = None  # 所屬父段落在原檔中的起始位置（同檔案內唯一）；None 表示不分層
+    source: Tuple[str, int, int] | None = None  # 在文件庫中的位置（文件 key, byte 位置, byte 長度）；None 時存文字
+
+
+class Embedder(Protocol):
+    def load(self) -> None: ...
+
+    @property
+    def dimension(self) -> int: ...
+
+    def embed_chunks(self, chunks: List[str], batch_size: int = 32) -> np.ndarray: ...
+
+
+# ----------------------------------------------------------------------
+# 1. 解碼
+# ----------------------------------------------------------------------
+def decode_bytes(raw: bytes) -> Tuple[str | None, str | None]:
+    """
+    依 ENCODINGS 順序嘗試解碼
+
+    :param raw: 檔案內容
+    :return: (文字, 使用的編碼)；全部失敗時為 (None, None)
+    """
+    for encoding in ENCODINGS:
+        try:
+            return raw.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    return None, None
+
+
+# ----------------------------------------------------------------------
+# 2. 切片
+# ----------------------------------------------------------------------
+def csv_chunks(filename: str, text: str) -> List[Chunk] | None:
+    """
+    CSV 每一列轉成一個片段（以 JSON 呈現欄位）
+
+    :return: 片段清單；沒有標題列時為 None（呼叫端改當純文字處理）
+    """
+    reader = csv.reader(io.StringIO(text))
+    headers = next(reader, None)
+    if not headers:
+        return None
+    chunks = []
+    for row_idx, row in enumerate(reader):
+        row_number = row_idx + 2  # +2：標題列與從 0 起算
+        row_dict = {header: row[i] for i, header in enumerate(headers) if i < len(row)}
+        formatted_row = f"--- File: {filename} (Row {row_number}) ---\n" + json.dumps(
+            row_dict, ensure_ascii=False, indent=2
+        )
+        chunks.append(Chunk(text=formatted_row, filename=filename, start=None, row=row_number))
+    return chunks
+
+
+# 子片段優先在段落、換行、句尾切開（句子不被切斷，不需要重疊也能完整命中）
+_SENTENCE_SEPARATORS = ["\n\n", "\n", r"(?<=[.!?])\s+", r"(?<=[。！？])", " ", ""]
+
+
+def _text_splitter(chunk_size: int, chunk_overlap: int, sentences: bool = False):
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    if sentences:
+        options = {"separators": _SENTENCE_SEPARATORS, "is_separator_regex": True, "keep_separator": "end"}
+    else:
+        options = {}
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,  # 以字元數計算長度
+        add_start_index=True,
+        **options,
+    )
+
+
+def text_chunks(
+    filename: str,
+    text: str,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    parent_size: int | None = PARENT_CHUNK_SIZE,
+) -> List[Chunk]:
+    """
+    把單一文字檔切成片段，保留檔名與起始位置
+
+    :param parent_size: 父段落大小；先切成父段落再切成子片段（子片段記下 parent）。
+        None 時直接切成 chunk_size 的片段
+    """
+    if parent_size is None:
+        splitter = _text_splitter(chunk_size, chunk_overlap)
+        return [
+            Chunk(text=doc.page_content, filename=filename, start=doc.metadata.get("start_index", 0))
+            for doc in splitter.create_documents([text])
+        ]
+    splitter = _text_splitter(chunk_size, chunk_overlap, sentences=True)
+    chunks = []
+    for section in _text_splitter(parent_size, 0).create_documents([text]):
+        parent = section.metadata.get("start_index", 0)
+        chunks.extend(
+            Chunk(text=doc.page_content, filename=filename, start=parent + doc.metadata.get("start_index", 0), parent=parent)
+            for doc in splitter.create_documents([section.page_content])
+        )
+    return chunks
+
+
+def page_chunks(page, **split_options) -> List[Chunk]:
+    """
+    把 rag.extraction 擷取出的一頁切成片段；起始位置換算成整份文字中的位置，並記下頁碼
+    """
+    if page.number is None and page.filename.lower().endswith(".csv"):
+        rows = csv_chunks(page.filename, page.text)
+        if rows is not None:
+            return rows
+    chunks = text_chunks(page.filename, page.text, **split_options)
+    for chunk in chunks:
+        chunk.start += page.start
+        chunk.page = page.number
+        if chunk.parent is not None:
+            chunk.parent += page.start
+    return chunks
+
+
+def build_chunks(files: Iterable[Tuple[str, str]], **split_options) -> List[Chunk]:
+    """
+    依檔案類型切片（CSV 逐列，其餘依長度切）
+
+    :param files: [(檔名, 解碼後文字), ...]
+    :param split_options: 傳給 text_chunks（chunk_size、chunk_overlap、parent_size）
+    """
+    chunks: List[Chunk] = []
+    with tracing.span("chunk") as attrs:
+        for filename, text in files:
+            rows = csv_chunks(filename, text) if filename.lower().endswith(".csv") else None
+            chunks.extend(rows if rows is not None else text_chunks(filename, text, **split_options))
+        attrs["chunks"] = len(chunks)
+    return chunks
+
+
+# ----------------------------------------------------------------------
+# 3. 嵌入 + 建索引
+# ----------------------------------------------------------------------
+def embed_chunks(embedder: Embedder, chunks: Sequence[Chunk], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """
+    批次嵌入所有片段
+
+    :return: 形狀 (len(chunks), dim) 的 float32 陣列
+    """
+    if not chunks:
+        return np.zeros((0, embedder.dimension), dtype=np.float32)
+    with tracing.span("embed", chunks=len(chunks)):
+        vectors = embedder.embed_chunks([chunk.text for chunk in chunks], batch_size=batch_size)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def store_source(store, chunks: Sequence[Chunk], text: str, base: int = 0, key: str | None = None) -> str | None:
+    """
+    把片段所在的原文存進向量庫的文件庫，並在片段上記下位置（Chunk.source）
+
+    :param chunks: 從 text 切出的片段（CSV 列等沒有起始位置的片段維持存文字）
+    :param text: 整個文字檔或一頁的文字
+    :param base: text 在原檔中的起始位置（頁面的 Page.start；Chunk.start 以原檔為準）
+    :param key: text 已以 store.put_document 存入時的 key
+    :return: 文件 key；沒有片段需要參照原文時不寫入，回傳 key 參數
+    """
+    located = [
+        chunk for chunk in chunks
+        if chunk.start is not None and text[chunk.start - base:chunk.start - base + len(chunk.text)] == chunk.text
+    ]
+    if not located:
+        return key
+    if key is None:
+        key = store.put_document(text)
+    ranges = byte_ranges(text, [(chunk.start - base, len(chunk.text)) for chunk in located])
+    for chunk, (offset, length) in zip(located, ranges):
+        chunk.source = (key, offset, length)
+    return key
+
+
+def store_sources(store, chunks: Sequence[Chunk], files: Iterable[Tuple[str, str]]) -> None:
+    """
+    build_chunks 的片段逐檔套用 store_source
+
+    :param files: 傳給 build_chunks 的 [(檔名, 解碼後文字), ...]
+    """
+    by_file: Dict[str, List[Chunk]] = {}
+    for chunk in chunks:
+        by_file.setdefault(chunk.filename, []).append(chunk)
+    with tracing.span("store_documents", files=len(by_file)):
+        for filename, text in files:
+            store_source(store, by_file.get(filename, []), text)
+
+
+def _parent_ranges(chunks: Sequence[Chunk], first_id: int) -> List[List[int] | None]:
+    """
+    每個子片段所屬父段落的 doc id 範圍 [first, end)（同一父段落的子片段 id 連續）；
+    只有一個子片段的父段落不需要展開，記為 None
+    """
+    ranges: List[List[int] | None] = [None] * len(chunks)
+    i = 0
+    while i < len(chunks):
+        j = i + 1
+        if chunks[i].parent is not None:
+            while j < len(chunks) and (chunks[j].filename, chunks[j].parent) == (chunks[i].filename, chunks[i].parent):
+                j += 1
+            if j - i > 1:
+                ranges[i:j] = [[first_id + i, first_id + j]] * (j - i)
+        i = j
+    return ranges
+
+
+def index_chunks(store, chunks: Sequence[Chunk], vectors: np.ndarray, first_id: int = 0, save: bool = True) -> int:
+    """
+    一次加入向量庫並寫出 metadata
+
+    :param store: VectorStoreManager（本地或索引服務客戶端）
+    :param save: 是否寫出 metadata（分批加入時只在最後一批寫）
+    :return: 加入的片段數
+    """
+    with tracing.span("index", chunks=len(chunks)):
+        if chunks:
+            store.add_documents(
+                list(range(first_id, first_id + len(chunks))),
+                vectors,
+                # 有原文位置的片段不傳文字
+                [chunk.text if chunk.source is None else None for chunk in chunks],
+                [chunk.filename for chunk in chunks],
+                [chunk.start for chunk in chunks],
+                [chunk.page for chunk in chunks],
+                _parent_ranges(chunks, first_id),
+                [list(chunk.source) if chunk.source is not None else None for chunk in chunks],
+            )
+        if save:
+            store.save_metadata()
+    return len(chunks)
+
+
+def ingest(store, embedder: Embedder, files: Iterable[Tuple[str, str]], batch_size: int = EMBED_BATCH_SIZE) -> List[Chunk]:
+    """
+    清空向量庫，並把 files 切片、嵌入、加入
+
+    :param store: VectorStoreManager
+    :param embedder: EmbeddingModel（或測試用的 HashEmbeddingModel）
+    :param files: [(檔名, 解碼後文字), ...]
+    :return: 已加入的片段（doc id 即清單索引）
+    """
+    embedder.load()
+    store.clear_index()
+    store.init_vector_store(dim=embedder.dimension)
+    files = list(files)
+    chunks = build_chunks(files)
+    store_sources(store, chunks, files)
+    index_chunks(store, chunks, embed_chunks(embedder, chunks, batch_size))
+    return chunks
+
+
+def ingest_pages(store, embedder: Embedder, pages: Iterable, batch_size: int = EMBED_BATCH_SIZE) -> List[Chunk]:
+    """
+    清空向量庫，並邊接收 rag.extraction 的頁面邊切片、嵌入、加入
+    （長文件的前幾頁在其餘頁面還在擷取時就開始嵌入）
+
+    :param pages: Page 的 iterable（例如 extraction.extract_files(...)）；error 不為 None 的略過
+    :return: 已加入的片段（doc id 即清單索引）
+    """
+    embedder.load()
+    store.clear_index()
+    store.init_vector_store(dim=embedder.dimension)
+    chunks: List[Chunk] = []
+    pending: List[Chunk] = []
+
+    def flush() -> None:
+        index_chunks(store, pending, embed_chunks(embedder, pending, batch_size), first_id=len(chunks), save=False)
+        chunks.extend(pending)
+        pending.clear()
+
+    for page in pages:
+        if page.error is not None:
+            continue
+        with tracing.span("chunk", page=page.number) as attrs:
+            new_chunks = page_chunks(page)
+            attrs["chunks"] = len(new_chunks)
+        store_source(store, new_chunks, page.text, base=page.start)
+        pending.extend(new_chunks)
+        if len(pending) >= batch_size:
+            flush()
+    flush()
+    store.save_metadata()
+    return chunks
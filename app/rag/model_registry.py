@@ -0,0 +1,196 @@
+# app/rag/model_registry.py
+"""
+本機模型登錄模組
+
+Models live under MODEL_REGISTRY_DIR (one folder per model) and are listed in
+its manifest.json:
+
+    {"models": {"all-MiniLM-L6-v2": {
+        "path": "all-MiniLM-L6-v2",
+        "kind": "sentence-transformers",
+        "source": "sentence-transformers/all-MiniLM-L6-v2",
+        "files": {"model.safetensors": {"size": 90868376, "sha256": "..."}, ...}}}}
+
+resolve() returns the local folder of a registered model after checking every
+file against the manifest. Hashing is done once per file and stamped by
+(size, mtime) in .verified.json, so later loads only stat the files. Weights
+are stored as safetensors, which load without unpickling (no code runs from
+the weight file), and load time does not depend on the network.
+
+installation/register-models.py downloads, converts and registers models.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+import config as default_config
+from utils.write_behind import atomic_write_json
+
+MANIFEST_FILE = "manifest.json"
+_STAMP_FILE = ".verified.json"
+# 不應出現在登錄資料夾中的權重格式（pickle，載入慢且不安全）
+_PICKLE_WEIGHTS = (".bin", ".pt", ".pth", ".ckpt")
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistryError(RuntimeError):
+    """
+    模型不存在、檔案缺漏或 checksum 不符
+    """
+
+
+def check_weights(model_dir: str | Path) -> None:
+    """
+    確認資料夾中沒有 pickle 格式的權重（登錄前、複製前先檢查）
+
+    :raises ModelRegistryError: 有 .bin / .pt / .pth / .ckpt 檔
+    """
+    for path in sorted(Path(model_dir).rglob("*")):
+        if path.is_file() and not path.name.startswith(".") and path.suffix in _PICKLE_WEIGHTS:
+            raise ModelRegistryError(f"{path} 不是 safetensors，請以 safe_serialization=True 重新儲存")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    本機模型登錄類別
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        """
+        建構子
+
+        :param root: 模型資料夾（含 manifest.json）
+        """
+        self.root = Path(root)
+        self._verified: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 1. 讀取 manifest
+    # ------------------------------------------------------------------
+    def manifest(self) -> Dict[str, Any]:
+        path = self.root / MANIFEST_FILE
+        if not path.exists():
+            return {"models": {}}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def entry(self, name: str) -> Dict[str, Any] | None:
+        """
+        :param name: 模型名稱（與 hub 名稱相同，例如 "all-MiniLM-L6-v2"）
+        :return: manifest 中的項目，未登錄時為 None
+        """
+        return self.manifest()["models"].get(name)
+
+    # ------------------------------------------------------------------
+    # 2. 解析 / 驗證
+    # ------------------------------------------------------------------
+    def resolve(self, name: str) -> Path | None:
+        """
+        取得已登錄模型的本機資料夾（第一次會驗證 checksum）
+
+        :param name: 模型名稱
+        :return: 模型資料夾；未登錄時為 None
+        :raises ModelRegistryError: 檔案缺漏或內容與 manifest 不符
+        """
+        with self._lock:
+            if name in self._verified:
+                return self._verified[name]
+            entry = self.entry(name)
+            if entry is None:
+                return None
+            model_dir = self.root / entry["path"]
+            self._verify(name, model_dir, entry["files"])
+            self._verified[name] = model_dir
+            return model_dir
+
+    def _verify(self, name: str, model_dir: Path, files: Dict[str, Dict[str, Any]]) -> None:
+        stamp_path = self.root / _STAMP_FILE
+        stamps: Dict[str, Any] = {}
+        if stamp_path.exists():
+            with open(stamp_path, "r", encoding="utf-8") as f:
+                stamps = json.load(f)
+
+        changed = False
+        for relative, expected in files.items():
+            path = model_dir / relative
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                raise ModelRegistryError(f"{name}: 缺少檔案 {path}") from None
+            if stat.st_size != expected["size"]:
+                raise ModelRegistryError(f"{name}: {relative} 大小不符（{stat.st_size} ≠ {expected['size']}）")
+            key = f"{entry_key(model_dir, self.root)}/{relative}"
+            stamp = [stat.st_size, stat.st_mtime_ns, expected["sha256"]]
+            if stamps.get(key) == stamp:
+                continue
+            if _sha256(path) != expected["sha256"]:
+                raise ModelRegistryError(f"{name}: {relative} checksum 不符，請重新執行 register-models.py")
+            stamps[key] = stamp
+            changed = True
+
+        if changed:
+            atomic_write_json(str(stamp_path), stamps)
+            logger.info(f"[模型] 已驗證 {name}（{len(files)} 個檔案）")
+
+    # ------------------------------------------------------------------
+    # 3. 登錄
+    # ------------------------------------------------------------------
+    def register(self, name: str, model_dir: str | Path, kind: str, source: str | None = None) -> Dict[str, Any]:
+        """
+        把已存好的模型資料夾寫進 manifest（計算每個檔案的大小與 sha256）
+
+        :param name: 模型名稱
+        :param model_dir: 模型資料夾，必須在 root 底下
+        :param kind: "sentence-transformers"、"question-answering"…
+        :param source: 原始 hub 名稱（僅供記錄）
+        :return: 寫入的 manifest 項目
+        """
+        model_dir = Path(model_dir).resolve()
+        check_weights(model_dir)
+        files: Dict[str, Dict[str, Any]] = {}
+        for path in sorted(model_dir.rglob("*")):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            files[path.relative_to(model_dir).as_posix()] = {"size": path.stat().st_size, "sha256": _sha256(path)}
+
+        entry = {
+            "path": entry_key(model_dir, self.root.resolve()),
+            "kind": kind,
+            "source": source or name,
+            "files": files,
+        }
+        with self._lock:
+            manifest = self.manifest()
+            manifest["models"][name] = entry
+            self.root.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(str(self.root / MANIFEST_FILE), manifest)
+            self._verified.pop(name, None)
+        return entry
+
+
+def entry_key(model_dir: Path, root: Path) -> str:
+    """
+    模型資料夾相對於登錄根目錄的路徑（manifest 中的 "path"）
+    """
+    return Path(os.path.relpath(model_dir, root)).as_posix()
+
+
+# 單例實例（供其他模組直接 import）
+model_registry = ModelRegistry(default_config.MODEL_REGISTRY_DIR)
@@ -1,43 +1,222 @@
 # app/rag/retriever.py
 """
-檢索器模組
+檢索器模組（多查詢檢索 + 排名融合 + context 篩選）
 
-本模組負責把使用者提問轉成向量，並從向量儲存庫中取得最相近的片段。
+本模組把使用者提問轉成向量，從向量儲存庫取得候選片段，再交給
+rag.context_selection 挑出放進 prompt 的文字。UI（ui.chat_area）與無介面
+流程（engine.pipeline）都只透過這裡檢索。
+
+A follow-up such as "and what about the second one?" matches nothing on its
+own, so besides the raw question the retriever searches with formulations
+that carry the recent conversation:
+
+    question                                   weight 1.0
+    recent user turns + question               RETRIEVAL_HISTORY_WEIGHT
+    start of the last answer + question        RETRIEVAL_ANSWER_WEIGHT
+
+All formulations are embedded in one EmbeddingModel batch and searched with
+one VectorStoreManager.search_batch call (one FAISS search, one index-server
+round-trip), and the rankings are merged with weighted reciprocal rank
+fusion, so the extra queries cost neither extra model calls nor extra
+round-trips.
 """
 
 from __future__ import annotations
 
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
 
 import numpy as np
 
-from .embedding_model import embedding_model
-from .vector_store_manager import vector_store_manager
+import config as default_config
+from utils import tracing
+
+from . import context_compression, context_selection
+from .context_compression import Compression
+from .context_selection import Span
 
+RRF_K = 60  # reciprocal rank fusion 的平滑常數（常用值）
 
-def retrieve_chunks(
-    query: str,
-    k: int = 5,
-) -> List[str]:
+# 使用者以這些字眼指「最後上傳的檔案」時，優先使用該檔案的片段
+_LAST_FILE_PHRASES = ("this file", "the last file")
+
+
+@dataclass
+class Retrieval:
     """
-    根據使用者提問取得最相關的文字片段
+    一次檢索的結果
+    """
+
+    hits: List[Tuple[int, float, str]] = field(default_factory=list)  # 選進 context 的片段 [(doc_id, 相似度, 檔名), ...]
+    spans: List[Span] = field(default_factory=list)  # 合併、去重後放進 prompt 的文字
+    prioritized_file: str | None = None  # 依提問優先使用的檔案
+    query_vector: np.ndarray | None = None  # 提問向量（壓縮時重用）
+    queries: List[str] = field(default_factory=list)  # 實際搜尋的查詢（第一個是提問本身）
+    compression: Compression | None = None  # 有壓縮時的統計
 
-    :param query: 使用者的問題文字
-    :param k: 取前 k 個最相近的片段
-    :return: 相關片段文字清單
+    @property
+    def texts(self) -> List[str]:
+        return [
+            f"--- File: {span.filename} ({'' if span.page is None else f'Page {span.page}, '}Score: {span.score:.4f}) ---\n{span.text}"
+            for span in self.spans
+        ]
+
+    @property
+    def context(self) -> str | None:
+        return "\n\n---\n\n".join(self.texts) if self.spans else None
+
+
+# ----------------------------------------------------------------------
+# 1. 查詢改寫
+# ----------------------------------------------------------------------
+def formulate_queries(
+    question: str,
+    history: Sequence | None = None,
+    history_turns: int | None = None,
+    answer_chars: int | None = None,
+) -> List[Tuple[str, float]]:
     """
-    # 1️⃣ 先把提問嵌入成向量
-    query_vec = embedding_model.embed_text(query)
+    提問加上近期對話的查詢版本
 
-    # 2️⃣ 在向量儲存庫中搜尋
-    hits = vector_store_manager.search(query_vec, k=k)
+    :param history: 這次提問之前的對話（LangChain 訊息，不含這次提問）
+    :param history_turns: 併入的先前使用者提問數，預設 RETRIEVAL_HISTORY_TURNS；0 只用提問本身
+    :param answer_chars: 併入上一則回覆的字元數，預設 RETRIEVAL_ANSWER_CHARS；0 不併入
+    :return: [(查詢, 權重), ...]；第一個一定是提問本身
+    """
+    if history_turns is None:
+        history_turns = default_config.RETRIEVAL_HISTORY_TURNS
+    if answer_chars is None:
+        answer_chars = default_config.RETRIEVAL_ANSWER_CHARS
+    queries = [(question, 1.0)]
+    if not history or history_turns <= 0:
+        return queries
 
-    # 3️⃣ 取出對應的文字
-    metadata = vector_store_manager.metadata
-    results: List[str] = []
-    for doc_id, _score in hits:
-        text = metadata.get(doc_id)
-        if text is not None:
-            results.append(text)
+    # LangChain 訊息的 type："human" / "ai"
+    previous_questions = [m.content for m in history if m.type == "human"][-history_turns:]
+    if previous_questions:
+        queries.append(("\n".join([*previous_questions, question]), default_config.RETRIEVAL_HISTORY_WEIGHT))
+    last_answer = next((m.content for m in reversed(history) if m.type == "ai"), None)
+    if last_answer and answer_chars > 0:
+        queries.append((f"{last_answer[:answer_chars]}\n{question}", default_config.RETRIEVAL_ANSWER_WEIGHT))
+    return queries
+
+
+# ----------------------------------------------------------------------
+# 2. 排名融合
+# ----------------------------------------------------------------------
+def fuse(
+    rankings: Sequence[Sequence[Tuple[int, float, str]]],
+    weights: Sequence[float] | None = None,
+    k: int = RRF_K,
+) -> List[Tuple[Tuple[int, float, str], float]]:
+    """
+    加權 reciprocal rank fusion：score(d) = Σ w_q / (k + rank_q(d))
 
-    return results
\ No newline at end of file
+    :param rankings: 每個查詢的搜尋結果 [(doc_id, 相似度, 檔名), ...]（依相似度排序）
+    :param weights: 每個查詢的權重（預設皆為 1）
+    :return: [((doc_id, 最高相似度, 檔名), 融合分數), ...]，依融合分數由高到低
+    """
+    if weights is None:
+        weights = [1.0] * len(rankings)
+    fused: Dict[int, float] = {}
+    best: Dict[int, Tuple[int, float, str]] = {}
+    for hits, weight in zip(rankings, weights):
+        for rank, hit in enumerate(hits, start=1):
+            doc_id = hit[0]
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+            if doc_id not in best or hit[1] > best[doc_id][1]:
+                best[doc_id] = hit
+    return sorted(((best[doc_id], score) for doc_id, score in fused.items()), key=lambda item: -item[1])
+
+
+# ----------------------------------------------------------------------
+# 3. 檢索
+# ----------------------------------------------------------------------
+def retrieve(
+    store,
+    embedder,
+    question: str,
+    history: Sequence | None = None,
+    last_filename: str | None = None,
+    k: int | None = None,
+    max_chunks: int | None = None,
+    query_vector: np.ndarray | None = None,
+) -> Retrieval:
+    """
+    搜尋與提問相關的片段，再以 rag.context_selection 篩選（MMR、合併相鄰片段、去重）；
+    提到「this file」或最後上傳的檔名時，該檔案的片段排在前面
+
+    :param store: VectorStoreManager（本地或索引服務客戶端）
+    :param embedder: EmbeddingModel（已載入）
+    :param history: 這次提問之前的對話（見 formulate_queries）；None 只用提問本身
+    :param last_filename: 最後上傳的檔案名稱
+    :param k: 每個查詢搜尋的候選數，預設 CONTEXT_FETCH_K
+    :param max_chunks: 最多使用的片段數，預設 CONTEXT_MAX_CHUNKS
+    :param query_vector: 已算好的提問向量（批次處理時一次嵌入所有提問）
+    """
+    k = k or default_config.CONTEXT_FETCH_K
+    queries = formulate_queries(question, history)
+    texts = [text for text, _ in queries]
+
+    # 一批嵌入所有查詢（提問向量已算好時只嵌入其餘的）
+    with tracing.span("embed_query", queries=len(queries)):
+        if query_vector is None:
+            vectors = np.asarray(embedder.embed_chunks(texts), dtype=np.float32).reshape(len(texts), -1)
+        elif len(texts) > 1:
+            others = np.asarray(embedder.embed_chunks(texts[1:]), dtype=np.float32).reshape(len(texts) - 1, -1)
+            vectors = np.vstack([np.asarray(query_vector, dtype=np.float32).reshape(1, -1), others])
+        else:
+            vectors = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+    retrieval = Retrieval(query_vector=vectors[0], queries=texts)
+
+    # 一次搜尋所有查詢
+    rankings = store.search_batch(vectors, k=k)
+    if len(rankings) == 1:
+        hits, relevance = rankings[0], None
+    else:
+        fused = fuse(rankings, [weight for _, weight in queries])[:k]
+        hits = [hit for hit, _ in fused]
+        # MMR 的相關度改用融合分數（縮放到 0–1，與相似度同一尺度）
+        scores = np.array([score for _, score in fused], dtype=np.float32)
+        spread = float(scores.max() - scores.min()) if len(scores) else 0.0
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+    if not hits:
+        return retrieval
+
+    question_lower = question.lower()
+    if last_filename and (
+        any(phrase in question_lower for phrase in _LAST_FILE_PHRASES) or last_filename.lower() in question_lower
+    ):
+        retrieval.prioritized_file = last_filename
+    retrieval.spans = context_selection.select_context(
+        store,
+        vectors[0],
+        hits,
+        max_chunks=max_chunks or default_config.CONTEXT_MAX_CHUNKS,
+        mmr_lambda=default_config.CONTEXT_MMR_LAMBDA,
+        boost_file=retrieval.prioritized_file,
+        relevance=relevance,
+        expand_min_hits=default_config.CONTEXT_PARENT_MIN_HITS,
+        max_expansions=default_config.CONTEXT_PARENT_MAX_EXPANSIONS,
+    )
+    # 展開父段落補上的子片段沒有自己的相似度，沿用所屬 span 的分數
+    by_id = {doc_id: (doc_id, score, filename) for doc_id, score, filename in hits}
+    retrieval.hits = [
+        by_id.get(doc_id, (doc_id, span.score, span.filename)) for span in retrieval.spans for doc_id in span.doc_ids
+    ]
+    return retrieval
+
+
+def compress(retrieval: Retrieval, embedder, question: str, ratio: float) -> Retrieval:
+    """
+    只保留 context 中與提問最相關的句子（rag.context_compression），就地更新 retrieval
+
+    :param ratio: 保留的字元比例
+    :return: retrieval（spans 已壓縮，compression 記錄省下的 token 數）
+    """
+    if retrieval.spans:
+        retrieval.compression = context_compression.compress(
+            embedder, question, retrieval.spans, ratio, query_vector=retrieval.query_vector
+        )
+        retrieval.spans = retrieval.compression.spans
+    return retrieval
@@ -0,0 +1,189 @@
+# app/rag/store_registry.py
+"""
+向量庫登錄模組（每個 session / workspace 一個向量庫）
+
+The module-level vector_store_manager used to be shared by every Streamlit
+session in the process, so one user's upload wiped another user's index.
+The registry hands out one VectorStoreManager per store id (the UI uses a
+per-session id), all sharing the single embedding model, and keeps the total
+resident size under a global cap:
+
+* stores idle longer than idle_seconds are spilled to disk;
+* when the total exceeds memory_cap_bytes, least recently used stores are
+  spilled until it fits;
+* stores idle longer than delete_after_seconds are deleted from disk.
+
+A spilled store is reloaded transparently on its next access (see
+VectorStoreManager.spill).
+
+With server_address set (INDEX_SERVER_SOCKET), the managers are thin clients
+of rag.index_server, which runs its own registry and does the accounting.
+"""
+
+from __future__ import annotations
+
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict
+
+import config as default_config
+
+from .vector_store_manager import VectorStoreManager
+
+
+@dataclass
+class _Slot:
+    manager: VectorStoreManager
+    last_access: float
+
+
+class VectorStoreRegistry:
+    """
+    向量庫登錄類別
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        memory_cap_bytes: int,
+        idle_seconds: float,
+        delete_after_seconds: float,
+        server_address: str | None = None,
+        index_options: Dict[str, Any] | None = None,
+    ) -> None:
+        """
+        建構子
+
+        :param root: 各向量庫資料夾的上層目錄
+        :param memory_cap_bytes: 所有向量庫合計的記憶體上限
+        :param idle_seconds: 閒置多久後 spill 到磁碟
+        :param delete_after_seconds: 閒置多久後從磁碟刪除
+        :param server_address: 索引服務的 Unix socket；設定後所有向量庫都在服務端
+        :param index_options: 建立新向量庫時傳給 VectorStoreManager 的編碼設定（index_type、pq_m…）
+        """
+        self.root = Path(root)
+        self.memory_cap_bytes = memory_cap_bytes
+        self.idle_seconds = idle_seconds
+        self.delete_after_seconds = delete_after_seconds
+        self.server_address = server_address
+        self.index_options = index_options or {}
+        self._slots: Dict[str, _Slot] = {}
+        self._lock = threading.Lock()
+
+    def _new_manager(self, store_id: str) -> VectorStoreManager:
+        store_dir = self.root / store_id
+        return VectorStoreManager(
+            index_path=store_dir / "faiss.index",
+            metadata_path=store_dir / "metadata.json",
+            server_address=self.server_address,
+            namespace=store_id,
+            **self.index_options,
+        )
+
+    def get(self, store_id: str) -> VectorStoreManager:
+        """
+        取得（必要時建立）store_id 的向量庫，並順便執行記憶體上限 / 閒置檢查
+
+        :param store_id: session 或 workspace 的識別字
+        """
+        now = time.monotonic()
+        with self._lock:
+            slot = self._slots.get(store_id)
+            if slot is None:
+                slot = _Slot(manager=self._new_manager(store_id), last_access=now)
+                self._slots[store_id] = slot
+            slot.last_access = now
+        self.enforce_limits(exclude=store_id)
+        return slot.manager
+
+    def release(self, store_id: str) -> None:
+        """
+        刪除 store_id 的向量庫（記憶體與磁碟）
+        """
+        with self._lock:
+            slot = self._slots.pop(store_id, None)
+        if slot is not None:
+            slot.manager.delete()
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        :return: {store_id: 估計記憶體 bytes}（已 spill 的為 0）
+        """
+        with self._lock:
+            slots = dict(self._slots)
+        return {store_id: slot.manager.memory_bytes() for store_id, slot in slots.items()}
+
+    def enforce_limits(self, exclude: str | None = None) -> None:
+        """
+        依閒置時間與全域記憶體上限 spill / 刪除向量庫
+
+        :param exclude: 不處理的向量庫（通常是目前正在使用的那一個）
+        """
+        now = time.monotonic()
+        with self._lock:
+            # 最久沒用的排前面
+            slots = sorted(
+                ((store_id, slot) for store_id, slot in self._slots.items() if store_id != exclude),
+                key=lambda item: item[1].last_access,
+            )
+
+        for store_id, slot in slots:
+            idle = now - slot.last_access
+            if idle > self.delete_after_seconds:
+                self.release(store_id)
+            elif idle > self.idle_seconds and slot.manager.is_loaded:
+                slot.manager.spill(blocking=False)
+
+        total = sum(self.memory_usage().values())
+        for store_id, slot in slots:
+            if total <= self.memory_cap_bytes:
+                break
+            size = slot.manager.memory_bytes()
+            if size and slot.manager.spill(blocking=False):
+                total -= size
+
+    def purge_orphans(self) -> None:
+        """
+        刪除磁碟上不屬於任何已知向量庫、且閒置超過 delete_after_seconds 的資料夾
+        （例如上次執行留下的 session）。其他 worker 行程共用同一個 root 時，
+        它們正在使用的向量庫最近有寫入，不會被刪
+        """
+        if self.server_address or not self.root.exists():
+            # 客戶端模式下資料夾屬於索引服務，不能動
+            return
+        with self._lock:
+            known = set(self._slots)
+        cutoff = time.time() - self.delete_after_seconds
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name not in known and _last_modified(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _last_modified(path: Path) -> float:
+    """
+    資料夾（含其中所有檔案）最後修改的時間
+    """
+    latest = path.stat().st_mtime
+    for child in path.rglob("*"):
+        try:
+            latest = max(latest, child.stat().st_mtime)
+        except OSError:  # 另一個行程剛好刪掉了
+            continue
+    return latest
+
+
+# 單例實例（供其他模組直接 import）
+store_registry = VectorStoreRegistry(
+    root=default_config.VECTOR_STORE_ROOT,
+    memory_cap_bytes=default_config.VECTOR_STORE_MEMORY_CAP_MB * 1024 * 1024,
+    idle_seconds=default_config.VECTOR_STORE_IDLE_SECONDS,
+    delete_after_seconds=default_config.VECTOR_STORE_DELETE_AFTER_SECONDS,
+    server_address=default_config.INDEX_SERVER_SOCKET,
+    index_options=default_config.VECTOR_STORE_INDEX_OPTIONS,
+)
+# Session ids are per process, so anything left on disk from a previous run is unreachable;
+# directories another worker touched recently are kept (see purge_orphans).
+store_registry.purge_orphans()
@@ -4,18 +4,42 @@
 
 本模組使用 faiss‑cpu 建立、存取、搜尋向量索引，並同步管理
 metadata（片段文字對應表）。
+
+index_type 決定向量在記憶體中的編碼：
+  * "flat"：float32 原始向量（IndexFlatIP），4·dim bytes／片段
+  * "sq8"：8‑bit scalar quantization，dim bytes／片段
+  * "pq"：product quantization，pq_m·pq_nbits/8 bytes／片段
+壓縮編碼需要先訓練：在收集到足夠向量前，向量先放在 _pending 中以精確搜尋。
+壓縮編碼同時把原始 float32 向量附加寫入磁碟（*.vectors.f32），
+rerank=True 時以 memory‑map 讀回候選向量做精確重排，RAM 中只保留壓縮碼。
+
+片段文字不放在 metadata 裡：原文存在 rag.document_store（*.documents/），
+metadata 只記 [文件 key, byte 位置, byte 長度]，get_entries 時才從
+memory‑mapped 文件切出文字。
 """
 
 from __future__ import annotations
 
 import json
+import logging
 import os
+import sys
+import threading
 from pathlib import Path
-from typing import Dict, List, Tuple, Any # Added Any for Dict value type
+from typing import TYPE_CHECKING, Dict, List, Tuple, Any # Added Any for Dict value type
 
-import faiss
 import numpy as np
-from tqdm import tqdm
+
+from utils import tracing
+
+from .document_store import DocumentStore
+from .index_client import IndexClient, decode_vectors, encode_vectors
+
+if TYPE_CHECKING:
+    # faiss 只在真正建立 / 讀取索引時才匯入
+    import faiss
+
+logger = logging.getLogger(__name__)
 
 
 class VectorStoreManager:
@@ -27,18 +51,56 @@ class VectorStoreManager:
         self,
         index_path: str | Path = "vector_store/faiss.index",
         metadata_path: str | Path = "vector_store/metadata.json",
+        server_address: str | None = None,
+        namespace: str = "default",
+        index_type: str = "flat",
+        pq_m: int | None = None,
+        pq_nbits: int = 8,
+        rerank: bool = True,
+        rerank_factor: int = 4,
     ) -> None:
         """
         建構子
 
         :param index_path: FAISS 索引檔案路徑
         :param metadata_path: metadata JSON 檔案路徑
+        :param server_address: 若提供，改為 rag.index_server 的精簡客戶端（Unix socket 路徑）
+        :param namespace: 客戶端模式下在索引服務中使用的向量庫名稱
+        :param index_type: "flat"、"sq8" 或 "pq"（只在建立新索引時使用）
+        :param pq_m: PQ 子向量數（預設 dim // 8，必須整除 dim）
+        :param pq_nbits: PQ 每個子向量的位元數
+        :param rerank: 壓縮編碼時是否用磁碟上的原始向量重排
+        :param rerank_factor: 重排時先取 k × rerank_factor 個候選
         """
+        if index_type not in ("flat", "sq8", "pq"):
+            raise ValueError(f"未知的 index_type：{index_type}")
         self.index_path = Path(index_path)
         self.metadata_path = Path(metadata_path)
+        self.vectors_path = self.index_path.with_suffix(".vectors.f32")
+        # 片段所在的原文（metadata 只記位置）
+        self.documents = DocumentStore(self.index_path.with_suffix(".documents"))
+        self.index_type = index_type
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        # 尚未訓練前暫存的 float32 向量（只有壓縮編碼會用到）
+        self._pending: np.ndarray | None = None
+        # 原始向量檔的 memory map（新增向量後失效，下次需要時重開）
+        self._exact: np.memmap | None = None
         self.index: faiss.IndexFlatIP | None = None  # Inner‑Product (cosine) 索引
-        # metadata now stores a dict: {doc_id: {'text': '...', 'filename': '...'}}
+        # metadata now stores a dict: {doc_id: {'source': [key, offset, length], 'filename': '...'}}
+        # （沒有原文位置的片段，例如 CSV 列，仍直接存 'text'）
         self.metadata: Dict[int, Dict[str, str]] = {}
+        # 估計的 metadata 記憶體用量（bytes），由 add_document 累加，避免每次重算
+        self._metadata_bytes = 0
+        # spill() 後索引只在磁碟上，下一次存取時自動載回
+        self._spilled = False
+        # 保護索引不會在使用中被 store_registry 從另一個執行緒 spill 掉
+        self._lock = threading.RLock()
+        # 客戶端模式：索引與 metadata 都在索引服務那邊，本地不佔記憶體
+        self.namespace = namespace
+        self._client = IndexClient(server_address) if server_address else None
 
     # ------------------------------------------------------------------
     # 1. 初始化 / 讀取索引
@@ -49,20 +111,33 @@ class VectorStoreManager:
 
         :param dim: 向量維度（預設 512）
         """
-        # 確保資料夾存在
-        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        if self._client is not None:
+            self._client.call("init", namespace=self.namespace, dim=dim)
+            return
 
-        if self.index_path.exists():
-            self.index = faiss.read_index(str(self.index_path))
-            # 若索引是 ID‑based，請自行調整
-            print(f"[向量庫] 讀取索引成功：{self.index_path}")
-        else:
-            # 建立一個簡單的 Inner‑Product (cosine) 索引
-            self.index = faiss.IndexFlatIP(dim)
-            print("[向量庫] 建立新索引")
+        import faiss
+
+        with self._lock:
+            # 確保資料夾存在
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # 讀 metadata
-        self.load_metadata()
+            self._pending = None
+            self._exact = None
+            if self.index_path.exists():
+                self.index = faiss.read_index(str(self.index_path))
+                # 若索引是 ID‑based，請自行調整
+                logger.info(f"[向量庫] 讀取索引成功：{self.index_path}")
+                if not self.index.is_trained and self.vectors_path.exists():
+                    # 上次還沒累積到足夠的訓練資料，尚未編碼的向量都在原始向量檔裡
+                    self._pending = np.array(self._open_exact())
+            else:
+                # 建立 Inner‑Product (cosine) 索引，編碼依 index_type
+                self.index = self._create_index(dim)
+                logger.info(f"[向量庫] 建立新索引（{self.index_type}）")
+
+            # 讀 metadata
+            self.load_metadata()
+            self._spilled = False
 
     # ------------------------------------------------------------------
     # 2. 讀寫 metadata
@@ -76,18 +151,29 @@ class VectorStoreManager:
                 loaded_data = json.load(f)
                 # json 讀回來的是 str → dict，轉成 int → dict
                 self.metadata = {int(k): v for k, v in loaded_data.items()}
-            print(f"[metadata] 載入 {len(self.metadata)} 個片段")
+            # 同一檔案 / 文件的片段共用一個檔名與 key 字串（json 讀回來每個片段各一份複本）
+            for entry in self.metadata.values():
+                entry['filename'] = sys.intern(entry['filename'])
+                if 'source' in entry:
+                    entry['source'][0] = sys.intern(entry['source'][0])
+            logger.info(f"[metadata] 載入 {len(self.metadata)} 個片段")
         else:
             self.metadata = {}
-            print("[metadata] 尚未存在，從頭開始")
+            logger.info("[metadata] 尚未存在，從頭開始")
+        self._metadata_bytes = sum(self._entry_bytes(v) for v in self.metadata.values())
 
     def save_metadata(self) -> None:
         """
         將 metadata 寫回磁碟
         """
-        with open(self.metadata_path, "w", encoding="utf-8") as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-        print("[metadata] 儲存完成")
+        if self._client is not None:
+            self._client.call("save", namespace=self.namespace)
+            return
+        with self._lock:
+            self.metadata_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.metadata_path, "w", encoding="utf-8") as f:
+                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        logger.info("[metadata] 儲存完成")
 
     # ------------------------------------------------------------------
     # 3. 增加文件（向量 + 文字）
@@ -107,14 +193,94 @@ class VectorStoreManager:
         :param text: 文字片段
         :param source_filename: 來源檔案名稱
         """
-        if self.index is None:
-            raise RuntimeError("索引尚未初始化，請先呼叫 init_vector_store()")
+        self.add_documents([doc_id], vector.reshape(1, -1), [text], [source_filename])
+
+    def add_documents(
+        self,
+        doc_ids: List[int],
+        vectors: np.ndarray,
+        texts: List[str],
+        source_filenames: List[str],
+        starts: List[int | None] | None = None,
+        pages: List[int | None] | None = None,
+        parents: List[List[int] | None] | None = None,
+        sources: List[List | None] | None = None,
+    ) -> None:
+        """
+        批次加入多個文件（一次 index.add；客戶端模式下只需一次往返）
+
+        :param doc_ids: 文件 ID 清單（必須唯一，且依序對應索引位置）
+        :param vectors: 形狀 (n, dim) 的向量
+        :param texts: 文字片段清單（有 source 的片段可為 None）
+        :param source_filenames: 來源檔案名稱清單
+        :param starts: 各片段在原檔中的字元位置（None 表示沒有，例如 CSV 的列），
+            存成 metadata 的 'start'，供 rag.context_selection 合併相鄰片段
+        :param pages: 各片段的頁碼（rag.extraction；None 表示沒有），存成 metadata 的 'page'
+        :param parents: 各子片段所屬父段落的 doc id 範圍 [first, end)（None 表示不分層），
+            存成 metadata 的 'parent'，供 rag.context_selection 展開成整段
+        :param sources: 各片段在文件庫中的位置 [文件 key, byte 位置, byte 長度]（見 put_document；
+            None 表示沒有），存成 metadata 的 'source'，取代 'text'
+        """
+        if self._client is not None:
+            self._client.call(
+                "add",
+                namespace=self.namespace,
+                ids=[int(i) for i in doc_ids],
+                vectors=encode_vectors(vectors),
+                texts=list(texts),
+                filenames=list(source_filenames),
+                starts=list(starts) if starts is not None else None,
+                pages=list(pages) if pages is not None else None,
+                parents=list(parents) if parents is not None else None,
+                sources=list(sources) if sources is not None else None,
+            )
+            return
+
+        with self._lock:
+            self._ensure_loaded()
+            if self.index is None:
+                raise RuntimeError("索引尚未初始化，請先呼叫 init_vector_store()")
+            # doc id 就是索引位置（search / get_vectors 都依賴這點），只能從目前的數量接著加
+            expected = list(range(len(self.metadata), len(self.metadata) + len(doc_ids)))
+            if [int(i) for i in doc_ids] != expected:
+                raise ValueError(
+                    f"doc ids 必須從 {len(self.metadata)} 開始連續編號，收到 {doc_ids[:1]}…（{len(doc_ids)} 個）"
+                )
 
-        # 1️⃣ 將向量加入索引
-        self.index.add(vector.reshape(1, -1))
+            # 1️⃣ 將向量加入索引（壓縮編碼另外保存原始向量，尚未訓練則先暫存）
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(doc_ids), -1)
+            if self.index_type != "flat":
+                self._append_exact(vectors)
+            if self.index.is_trained:
+                self.index.add(vectors)
+            else:
+                self._pending = vectors if self._pending is None else np.vstack([self._pending, vectors])
+                self._maybe_train()
 
-        # 2️⃣ 儲存 metadata，現在包含 filename
-        self.metadata[doc_id] = {'text': text, 'filename': source_filename}
+            # 2️⃣ 儲存 metadata，現在包含 filename
+            if starts is None:
+                starts = [None] * len(doc_ids)
+            if pages is None:
+                pages = [None] * len(doc_ids)
+            if parents is None:
+                parents = [None] * len(doc_ids)
+            if sources is None:
+                sources = [None] * len(doc_ids)
+            for doc_id, text, source_filename, start, page, parent, source in zip(
+                doc_ids, texts, source_filenames, starts, pages, parents, sources
+            ):
+                if source is not None:
+                    entry = {'source': [str(source[0]), int(source[1]), int(source[2])], 'filename': source_filename}
+                else:
+                    entry = {'text': text, 'filename': source_filename}
+                if start is not None:
+                    entry['start'] = int(start)
+                if page is not None:
+                    entry['page'] = int(page)
+                if parent is not None:
+                    entry['parent'] = [int(parent[0]), int(parent[1])]
+                self.metadata[doc_id] = entry
+                self._metadata_bytes += self._entry_bytes(entry)
 
     # ------------------------------------------------------------------
     # 4. 搜尋
@@ -131,22 +297,135 @@ class VectorStoreManager:
         :param k: 取前 k 個
         :return: [(doc_id, 相似度, 來源檔案名稱), ...]
         """
-        if self.index is None:
-            raise RuntimeError("索引尚未初始化，請先呼叫 init_vector_store()")
+        return self.search_batch(query_vector.reshape(1, -1), k=k)[0]
+
+    def search_batch(
+        self,
+        query_vectors: np.ndarray,
+        k: int = 5,
+    ) -> List[List[Tuple[int, float, str]]]:
+        """
+        一次搜尋多個查詢向量（單一 FAISS 呼叫 / 單一往返）
 
-        distances, indices = self.index.search(
-            query_vector.reshape(1, -1), k
-        )  # distances: (1, k), indices: (1, k)
+        :param query_vectors: 形狀 (n, dim) 的查詢向量
+        :param k: 每個查詢取前 k 個
+        :return: 每個查詢一個 [(doc_id, 相似度, 來源檔案名稱), ...]
+        """
+        with tracing.span("vector_search", queries=len(query_vectors), k=k):
+            return self._search_batch(query_vectors, k)
 
-        results: List[Tuple[int, float, str]] = []
-        for idx, dist in zip(indices[0], distances[0]):
-            if idx == -1:  # FAISS 會回傳 -1 代表無資料
-                continue
-            # Retrieve filename from metadata
-            metadata_entry = self.metadata.get(int(idx))
-            filename = metadata_entry['filename'] if metadata_entry else "unknown"
-            results.append((int(idx), float(dist), filename))
-        return results
+    def _search_batch(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+    ) -> List[List[Tuple[int, float, str]]]:
+        if self._client is not None:
+            batches = self._client.call(
+                "search", namespace=self.namespace, vectors=encode_vectors(query_vectors), k=k
+            )
+            return [[(int(i), float(d), f) for i, d, f in hits] for hits in batches]
+
+        with self._lock:
+            self._ensure_loaded()
+            if self.index is None:
+                raise RuntimeError("索引尚未初始化，請先呼叫 init_vector_store()")
+
+            queries = np.ascontiguousarray(query_vectors, dtype=np.float32).reshape(-1, self.index.d)
+            use_rerank = self.rerank and self.index_type != "flat" and self.index.is_trained
+            k_search = k * self.rerank_factor if use_rerank else k
+            if self.index.is_trained:
+                distances, indices = self.index.search(
+                    queries, k_search
+                )  # distances: (n, k), indices: (n, k)
+            else:
+                distances, indices = self._search_pending(queries, k)
+            if use_rerank:
+                distances, indices = self._rerank(queries, indices, k)
+
+            all_results: List[List[Tuple[int, float, str]]] = []
+            for row_indices, row_distances in zip(indices, distances):
+                results: List[Tuple[int, float, str]] = []
+                for idx, dist in zip(row_indices, row_distances):
+                    if idx == -1:  # FAISS 會回傳 -1 代表無資料
+                        continue
+                    # Retrieve filename from metadata
+                    metadata_entry = self.metadata.get(int(idx))
+                    filename = metadata_entry['filename'] if metadata_entry else "unknown"
+                    results.append((int(idx), float(dist), filename))
+                all_results.append(results)
+        return all_results
+
+    def get_entry(self, doc_id: int) -> Dict[str, str] | None:
+        """
+        取得單一片段的 metadata（若索引已 spill 到磁碟會先載回）
+
+        :param doc_id: 文件 ID
+        :return: {'text': ..., 'filename': ...} 或 None
+        """
+        return self.get_entries([doc_id]).get(doc_id)
+
+    def get_entries(self, doc_ids: List[int]) -> Dict[int, Dict[str, str]]:
+        """
+        批次取得多個片段的 metadata
+
+        :param doc_ids: 文件 ID 清單
+        :return: {doc_id: {'text': ..., 'filename': ...}}（不存在的 ID 不會出現）
+        """
+        if self._client is not None:
+            entries = self._client.call("get_entries", namespace=self.namespace, ids=[int(i) for i in doc_ids])
+            return {int(doc_id): entry for doc_id, entry in entries.items()}
+
+        with self._lock:
+            self._ensure_loaded()
+            return {doc_id: self._resolve(self.metadata[doc_id]) for doc_id in doc_ids if doc_id in self.metadata}
+
+    def _resolve(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        # 有 source 的片段從文件庫切出文字（回傳新的 dict，metadata 本身不存文字）
+        if 'source' not in entry:
+            return entry
+        key, offset, length = entry['source']
+        return {**entry, 'text': self.documents.read(key, offset, length)}
+
+    def put_document(self, text: str) -> str:
+        """
+        把一份原文（整個文字檔或一頁）存進文件庫，供 add_documents 的 sources 參照
+
+        :return: 文件 key
+        """
+        if self._client is not None:
+            return self._client.call("put_document", namespace=self.namespace, text=text)
+        return self.documents.put(text)
+
+    def get_document(self, key: str) -> str:
+        """
+        讀回 put_document 存入的整份原文
+        """
+        if self._client is not None:
+            return self._client.call("get_document", namespace=self.namespace, key=key)
+        return self.documents.read(key)
+
+    def get_vectors(self, doc_ids: List[int]) -> np.ndarray:
+        """
+        取得已加入片段的向量（供 MMR 等需要比較片段彼此相似度的步驟）
+
+        壓縮編碼讀 memory‑mapped 原始向量，flat 索引直接從索引重建
+
+        :param doc_ids: 文件 ID 清單（即索引位置）
+        :return: 形狀 (len(doc_ids), dim) 的 float32 陣列
+        """
+        if self._client is not None:
+            return decode_vectors(self._client.call("get_vectors", namespace=self.namespace, ids=[int(i) for i in doc_ids]))
+
+        with self._lock:
+            self._ensure_loaded()
+            if self.index is None:
+                raise RuntimeError("索引尚未初始化，請先呼叫 init_vector_store()")
+            ids = np.asarray(doc_ids, dtype=np.int64)
+            if not len(ids):
+                return np.zeros((0, self.index.d), dtype=np.float32)
+            if self.index_type != "flat":
+                return np.array(self._open_exact()[ids])
+            return self.index.reconstruct_batch(ids)
 
     # ------------------------------------------------------------------
     # 5. 清除索引
@@ -155,29 +434,216 @@ class VectorStoreManager:
         """
         清除現有的 FAISS 索引和 metadata，並刪除磁碟上的檔案。
         """
+        if self._client is not None:
+            self._client.call("clear", namespace=self.namespace)
+            return
+        with self._lock:
+            self._clear_index_locked()
+
+    def _clear_index_locked(self) -> None:
+        self._spilled = False
+        self._pending = None
+        self._exact = None
+        if self.vectors_path.exists():
+            os.remove(self.vectors_path)
         if self.index is not None:
             self.index.reset()  # Reset the FAISS index
             self.index = None
-            print("[向量庫] 索引已重置。")
+            logger.info("[向量庫] 索引已重置。")
         else:
-            print("[向量庫] 索引尚未初始化，無需重置。")
+            logger.info("[向量庫] 索引尚未初始化，無需重置。")
 
         self.metadata = {}  # Clear the in-memory metadata
-        print("[metadata] metadata 已清除。")
+        self._metadata_bytes = 0
+        logger.info("[metadata] metadata 已清除。")
+        self.documents.clear()
 
         # 刪除磁碟上的索引檔案
         if self.index_path.exists():
             os.remove(self.index_path)
-            print(f"[檔案] 已刪除索引檔案：{self.index_path}")
+            logger.info(f"[檔案] 已刪除索引檔案：{self.index_path}")
         else:
-            print(f"[檔案] 索引檔案不存在：{self.index_path}")
+            logger.info(f"[檔案] 索引檔案不存在：{self.index_path}")
 
         # 刪除磁碟上的 metadata 檔案
         if self.metadata_path.exists():
             os.remove(self.metadata_path)
-            print(f"[檔案] 已刪除 metadata 檔案：{self.metadata_path}")
+            logger.info(f"[檔案] 已刪除 metadata 檔案：{self.metadata_path}")
         else:
-            print(f"[檔案] metadata 檔案不存在：{self.metadata_path}")
+            logger.info(f"[檔案] metadata 檔案不存在：{self.metadata_path}")
+
+
+    # ------------------------------------------------------------------
+    # 6. 記憶體用量 / spill 到磁碟
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _entry_bytes(entry: Dict[str, Any]) -> int:
+        return sum(len(str(v)) for v in entry.values()) + 200  # dict / str 物件本身的大約開銷
+
+    def memory_bytes(self) -> int:
+        """
+        估計此向量庫目前佔用的記憶體（向量 + metadata），spill 後為 0
+        """
+        with self._lock:
+            if self.index is None:
+                return 0
+            pending_bytes = self._pending.nbytes if self._pending is not None else 0
+            return self.index.ntotal * self.index.sa_code_size() + pending_bytes + self._metadata_bytes
+
+    @property
+    def is_loaded(self) -> bool:
+        # 客戶端模式的記憶體由索引服務管理，這裡永遠視為已載入、0 bytes
+        return self._client is not None or self.index is not None
+
+    def exists(self) -> bool:
+        """
+        向量庫是否已初始化且仍在（記憶體中或已 spill 到磁碟）；
+        被 store_registry 刪除（閒置過久）後重新取得的向量庫為 False
+        """
+        if self._client is not None:
+            return self._client.call("exists", namespace=self.namespace)
+        with self._lock:
+            return self.index is not None or self._spilled or self.index_path.exists()
+
+    def save_index(self) -> None:
+        """
+        將 FAISS 索引寫回磁碟
+        """
+        import faiss
+
+        with self._lock:
+            if self.index is None:
+                return
+            # 能訓練就先訓練，避免存下一個空的未訓練索引
+            self._maybe_train(force=True)
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            faiss.write_index(self.index, str(self.index_path))
+
+    def spill(self, blocking: bool = True) -> bool:
+        """
+        把索引與 metadata 寫到磁碟並釋放記憶體；下次存取時自動載回
+
+        :param blocking: False 時若向量庫正被使用則直接放棄
+        :return: 是否真的釋放了記憶體
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        try:
+            if self.index is None:
+                return False
+            self.save_index()
+            self.save_metadata()
+            self.index = None
+            self.metadata = {}
+            self._metadata_bytes = 0
+            self._pending = None
+            self._exact = None
+            self.documents.close()
+            self._spilled = True
+            logger.info(f"[向量庫] 已 spill 到磁碟：{self.index_path}")
+            return True
+        finally:
+            self._lock.release()
+
+    # ------------------------------------------------------------------
+    # 7. 壓縮編碼（SQ8 / PQ）
+    # ------------------------------------------------------------------
+    def _create_index(self, dim: int):
+        import faiss
+
+        if self.index_type == "sq8":
+            return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        if self.index_type == "pq":
+            m = self.pq_m or max(1, dim // 8)
+            if dim % m:
+                raise ValueError(f"pq_m={m} 無法整除向量維度 {dim}")
+            return faiss.IndexPQ(dim, m, self.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        return faiss.IndexFlatIP(dim)
+
+    def _train_sizes(self) -> Tuple[int, int]:
+        """
+        :return: (建議的訓練樣本數, 最少可訓練的樣本數)
+        """
+        if self.index_type == "pq":
+            centroids = 2 ** self.pq_nbits
+            return centroids * 39, centroids  # faiss 建議每個 centroid 約 39 個樣本
+        return 1000, 1  # sq8 只需要每一維的 min / max
+
+    def _maybe_train(self, force: bool = False) -> None:
+        # 呼叫端需持有 self._lock
+        if self.index.is_trained or self._pending is None:
+            return
+        wanted, minimum = self._train_sizes()
+        if len(self._pending) < (minimum if force else wanted):
+            return
+        self.index.train(self._pending)
+        self.index.add(self._pending)
+        logger.info(f"[向量庫] 以 {len(self._pending)} 個向量訓練 {self.index_type} 編碼")
+        self._pending = None
+
+    def _search_pending(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        尚未訓練時，直接對暫存的原始向量做精確搜尋（格式同 faiss search）
+        """
+        n = len(queries)
+        distances = np.full((n, k), -np.inf, dtype=np.float32)
+        indices = np.full((n, k), -1, dtype=np.int64)
+        if self._pending is None or not len(self._pending):
+            return distances, indices
+        scores = queries @ self._pending.T
+        top = min(k, scores.shape[1])
+        order = np.argsort(-scores, axis=1)[:, :top]
+        distances[:, :top] = np.take_along_axis(scores, order, axis=1)
+        indices[:, :top] = order
+        return distances, indices
+
+    def _append_exact(self, vectors: np.ndarray) -> None:
+        self.vectors_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        self._exact = None
+
+    def _open_exact(self) -> np.memmap:
+        if self._exact is None:
+            self._exact = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.index.d)
+        return self._exact
+
+    def _rerank(self, queries: np.ndarray, indices: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        以 memory‑mapped 原始向量重新計算候選的精確分數，取前 k 個
+        """
+        exact = self._open_exact()
+        out_distances = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, candidates) in enumerate(zip(queries, indices)):
+            # 依位置排序再讀，memory map 的存取比較連續
+            candidates = np.sort(candidates[candidates >= 0])
+            if not len(candidates):
+                continue
+            scores = exact[candidates] @ query
+            order = np.argsort(-scores)[:k]
+            out_distances[row, :len(order)] = scores[order]
+            out_indices[row, :len(order)] = candidates[order]
+        return out_distances, out_indices
+
+    def _ensure_loaded(self) -> None:
+        # 呼叫端需持有 self._lock
+        if self._spilled:
+            self.init_vector_store()
+
+    def delete(self) -> None:
+        """
+        清除索引並刪除整個向量庫資料夾（session 結束 / 過期時使用）
+        """
+        if self._client is not None:
+            self._client.call("release", namespace=self.namespace)
+            return
+        with self._lock:
+            self._clear_index_locked()
+            try:
+                self.index_path.parent.rmdir()
+            except OSError:
+                pass
 
 
 # 單例實例（供其他模組直接 import）
@@ -1,13 +1,17 @@
 import streamlit as st
+import functools
 import json
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from utils import persistence, ollama_client, prompt_builder
+from utils import persistence, ollama_client, stream_render, tracing, warmup
 import config as default_config
-import pyperclip
+from engine import pipeline # Headless retrieval / prompt / generation steps
+from rag import extraction, retriever # Page joining; multi-query retrieval and context selection
 from rag.embedding_model import embedding_model # Import embedding_model
-from rag.vector_store_manager import vector_store_manager # Import vector_store_manager
+from rag.store_registry import store_registry # Per-session vector stores
+from rag.index_client import IndexServerError # Raised by stores served by rag.index_server
 
-top_k = 20
+# Long messages show this much (cut at a paragraph break) until "Show full message" is clicked
+_PREVIEW_CHARS = 1500
 
 def _get_unique_id() -> int:
 	"""
@@ -41,7 +45,8 @@ def _copy_button(text: str, idx: int) -> None:
 	# Handle the actual copy action via JavaScript
 	if session_state_key in st.session_state:
 		try:
-			# Try the built-in clipboard support first.
+			# Try the built-in clipboard support first (imported on first use).
+			import pyperclip
 			pyperclip.copy(st.session_state[session_state_key])
 			# Clean up the unique session state key after copying.
 			del st.session_state[session_state_key]
@@ -49,160 +54,313 @@ def _copy_button(text: str, idx: int) -> None:
 			st.toast(f"Error when copying text: {e}")
 			del st.session_state[session_state_key]
 
+_WARMUP_LABELS = {
+	warmup.PENDING: "⚪ waiting",
+	warmup.LOADING: "🟡 loading…",
+	warmup.READY: "🟢 ready",
+	warmup.FAILED: "🔴 failed",
+}
+
+def _readiness_caption() -> str:
+	"""Model readiness from utils.warmup, e.g. 'LLM: 🟢 ready · Embeddings: 🟡 loading…'."""
+	status = warmup.status()
+	parts = []
+	for component, label in (("llm", "LLM"), ("embedding", "Embeddings")):
+		info = status[component]
+		text = _WARMUP_LABELS[info["state"]]
+		if info["state"] == warmup.READY and info["seconds"] is not None:
+			text += f" ({info['seconds']:.1f}s)"
+		parts.append(f"{label}: {text}")
+	return " · ".join(parts)
+
+def _warmup_settled() -> bool:
+	return all(info["state"] in (warmup.READY, warmup.FAILED) for info in warmup.status().values())
+
+def _render_readiness() -> None:
+	# Once both models are ready (or failed) the caption cannot change; render it without a timer.
+	if _warmup_settled():
+		st.caption(_readiness_caption())
+	else:
+		_render_readiness_live()
+
+@st.fragment(run_every=2)
+def _render_readiness_live() -> None:
+	# A fragment re-runs on its own timer, so the caption updates while models load.
+	st.caption(_readiness_caption())
+	if _warmup_settled():
+		st.rerun() # One full rerun replaces this timed fragment with the static caption
+
+@functools.lru_cache(maxsize=1024)
+def _split_message(text: str, preview_chars: int) -> tuple:
+	"""
+	(preview, rest) of a message longer than CHAT_COLLAPSE_CHARS, cut at the first paragraph
+	break after preview_chars that is outside a code fence (so the preview renders as valid
+	Markdown); rest is "" for shorter messages. Cached per text, so a rerun does not re-scan
+	every long answer.
+	"""
+	if len(text) <= default_config.CHAT_COLLAPSE_CHARS:
+		return text, ""
+	length = 0
+	in_fence = False
+	paragraphs = text.split("\n\n")
+	for i, paragraph in enumerate(paragraphs):
+		length += len(paragraph) + 2
+		if paragraph.count("```") % 2:
+			in_fence = not in_fence
+		if length >= preview_chars and not in_fence:
+			rest = "\n\n".join(paragraphs[i + 1:])
+			return ("\n\n".join(paragraphs[:i + 1]), rest) if rest else (text, "")
+	return text, ""
+
+def _render_message(msg, idx: int) -> None:
+	"""One history message; long ones stay collapsed to a preview until expanded."""
+	if isinstance(msg, (HumanMessage, AIMessage)):
+		text = msg.content
+	else:
+		# 其他可能的訊息類型（若有）
+		text = json.dumps(msg.__dict__, indent=2)
+	with st.chat_message("user" if isinstance(msg, HumanMessage) else "assistant"):
+		preview, rest = _split_message(text, _PREVIEW_CHARS)
+		expanded_key = f"{idx}:{len(text)}" # Index alone would carry over to another loaded conversation
+		if rest and expanded_key not in st.session_state.expanded_messages:
+			st.write(preview + "\n\n…")
+			if st.button(f"Show full message ({len(text):,} characters)", key=f"more_{idx}"):
+				st.session_state.expanded_messages.add(expanded_key)
+				st.rerun()
+		else:
+			st.write(text)
+		_copy_button(text, idx)
+
+def _timings_table(trace) -> list:
+	"""Rows for st.dataframe: one per stage, in the order the stages started."""
+	first_start = {}
+	for span in trace.spans:
+		first_start.setdefault(span.name, span.start_ms)
+	totals = trace.stage_totals()
+	rows = [
+		{"stage": name, "ms": round(totals[name], 1), "share": f"{totals[name] / trace.duration_ms:.0%}" if trace.duration_ms else ""}
+		for name in sorted(totals, key=first_start.get)
+	]
+	rows.append({"stage": f"total ({trace.name})", "ms": round(trace.duration_ms or 0, 1), "share": "100%"})
+	return rows
+
+def _render_timings() -> None:
+	"""Per-stage timings of the last upload and the last answer (see utils.tracing)."""
+	with st.expander("⏱ Timings", expanded=True):
+		for label, key in (("Last answer", "last_turn_trace"), ("Last upload", "last_upload_trace")):
+			trace = st.session_state.get(key)
+			if trace is not None and trace.duration_ms is not None:
+				st.caption(label)
+				st.dataframe(_timings_table(trace), hide_index=True, use_container_width=True)
+		if st.session_state.get("last_turn_trace") is None and st.session_state.get("last_upload_trace") is None:
+			st.caption("Nothing timed yet.")
+
 # --------------------------------------------------------------------------- #
 #  Main: 渲染整個聊天介面
 # --------------------------------------------------------------------------- #
 def render_chatarea() -> None:
 	st.title("Private AI Playground")
 	st.caption(f"Model: {default_config.MODEL_NAME}")
+	if default_config.WARMUP_ENABLED:
+		_render_readiness()
 
 	# Initialize last_uploaded_filename if not present
 	if 'last_uploaded_filename' not in st.session_state:
 		st.session_state.last_uploaded_filename = None
 
-	# 迭代聊天歷史，並在每條訊息下方放置「複製」按鈕
-	for idx, msg in enumerate(st.session_state.chat_history):
-		if isinstance(msg, HumanMessage):
-			with st.chat_message("user"):
-				st.write(msg.content)
-				_copy_button(msg.content, idx)
-		elif isinstance(msg, AIMessage):
-			with st.chat_message("assistant"):
-				st.write(msg.content)
-				_copy_button(msg.content, idx)
-		else:
-			# 其他可能的訊息類型（若有）
-			with st.chat_message("assistant"):
-				st.write(json.dumps(msg.__dict__, indent=2))
-				_copy_button(json.dumps(msg.__dict__, indent=2), idx)
+	# The previous run was interrupted by the Stop button (see _answer)
+	if st.session_state.pop("stopped_answer_pending", False):
+		st.toast("Generation stopped; the partial answer was kept.")
+		if st.session_state.auto_save:
+			persistence.save_current_conversation()
+
+	# 只畫最近 CHAT_RENDER_WINDOW 則訊息（每則下方一個「複製」按鈕），較早的按需載入
+	history = st.session_state.chat_history
+	start = max(0, len(history) - default_config.CHAT_RENDER_WINDOW - st.session_state.chat_window_extra)
+	if start:
+		if st.button(f"⬆ Show earlier messages ({start} hidden)", key="show_earlier"):
+			st.session_state.chat_window_extra += default_config.CHAT_RENDER_WINDOW
+			st.rerun()
+	for idx in range(start, len(history)):
+		_render_message(history[idx], idx)
 
 	user_input = st.chat_input("You:")
 	if user_input:
-		# This is the message that will be displayed to the user
-		display_input = user_input
-		# This is the context that will be passed to the LLM via the system prompt
-		context_for_llm = None 
-		
-		# If RAG is enabled, perform a search based on the user's query
-		if st.session_state.rag_enabled:
-			st.info("Searching RAG context...")
-			# Embed the user's query
-			query_vector = embedding_model.embed_text(user_input)
-			# Search the vector store for relevant chunks
-			# The search results now include filename: (doc_id, score, filename)
-			results = vector_store_manager.search(query_vector, k=10) # Retrieve more chunks to allow for prioritization
-			
-			if results:
-				# Prioritization Logic:
-				# If user mentions "this file", "last file", or the specific last uploaded filename,
-				# prioritize chunks from that file.
-				prioritized_results = []
-				other_results = []
-				
-				# Keywords to detect intent for the last uploaded file
-				user_input_lower = user_input.lower()
-				referring_to_last_file = False
-				if st.session_state.last_uploaded_filename:
-					if "this file" in user_input_lower or \
-					   "the last file" in user_input_lower or \
-					   st.session_state.last_uploaded_filename.lower() in user_input_lower:
-						referring_to_last_file = True
-
-				if referring_to_last_file:
-					st.info(f"Prioritizing content from '{st.session_state.last_uploaded_filename}' based on your query.")
-					for doc_id, score, filename in results:
-						if filename == st.session_state.last_uploaded_filename:
-							prioritized_results.append((doc_id, score, filename))
-						else:
-							other_results.append((doc_id, score, filename))
-					# Combine prioritized results first, then other results, up to k
-					# Ensure unique doc_ids if there's overlap (though unlikely with distinct lists)
-					final_results = prioritized_results + other_results
-				else:
-					final_results = results # No specific prioritization, use original search results
-
-				# Limit to top K chunks for the LLM context
-				final_results = final_results[:top_k]
-
-				retrieved_texts = []
-				for doc_id, score, filename in final_results: # Iterate through prioritized results
-					# Retrieve the actual text content from metadata
-					metadata_entry = vector_store_manager.metadata.get(doc_id)
-					if metadata_entry and 'text' in metadata_entry:
-						text_content = metadata_entry['text']
-						retrieved_texts.append(f"--- File: {filename} (Score: {score:.4f}) ---\n{text_content}")
-				
-				if retrieved_texts:
-					formatted_rag_context = "\n\n---\n\n".join(retrieved_texts)
-					display_input += "\n\n[Relevant Context from Uploaded Files]:\n" + formatted_rag_context
-					context_for_llm = formatted_rag_context
-					st.session_state.rag_context = retrieved_texts # Store for potential future display/debug if needed
-					st.success("RAG context found and added to prompt.")
-				else:
-					st.warning("No relevant RAG context found for your query after prioritization.")
-					context_for_llm = None # Ensure it's None if no relevant context
+		with tracing.trace("turn", rag=bool(st.session_state.rag_enabled)) as turn_trace:
+			try:
+				_answer(user_input)
+			finally:
+				# st.rerun() (auto-save) and the Stop button end _answer with an exception; the trace
+				# object is finished by the enclosing block, so storing it here still shows the full timings
+				st.session_state.last_turn_trace = turn_trace
+
+	if st.session_state.show_timings:
+		_render_timings()
+
+
+def _drop_expired_uploads() -> None:
+	"""The registry deletes a session's store after VECTOR_STORE_DELETE_AFTER_SECONDS idle; forget the uploads it held."""
+	if not (st.session_state.rag_enabled or st.session_state.uploaded_file_data):
+		return
+	if store_registry.get(st.session_state.vector_store_id).exists():
+		return
+	st.session_state.rag_enabled = False
+	st.session_state.rag_context = []
+	st.session_state.uploaded_file_data = []
+	st.session_state.file_token_counts = {}
+	st.session_state.last_uploaded_filename = None
+	st.session_state.file_uploader_id = st.session_state.file_uploader_id + 1 # Clear the uploader so the files can be re-added
+	st.warning("Your uploaded files were removed after a period of inactivity. Please upload them again to use them as context.")
+
+
+def _answer(user_input: str) -> None:
+	"""Runs one question through RAG retrieval, prompt building and the streamed answer."""
+	try:
+		_drop_expired_uploads()
+	except (IndexServerError, OSError) as e:
+		st.error(f"The vector store is unavailable, answering without uploaded files: {e}")
+		st.session_state.rag_enabled = False
+		st.session_state.uploaded_file_data = []
+	# This is the message that will be displayed to the user
+	display_input = user_input
+	# This is the context that will be passed to the LLM via the system prompt
+	context_for_llm = None 
+	context_label = None # Heading of the context block in display_input
+	
+	# If RAG is enabled, perform a search based on the user's query
+	if st.session_state.rag_enabled:
+		st.info("Searching RAG context...")
+		vector_store_manager = store_registry.get(st.session_state.vector_store_id)
+		# Searches with the question and with recent turns folded in (one embedding batch, one search),
+		# and puts chunks from the last uploaded file first when the question refers to it
+		try:
+			retrieval = retriever.retrieve(
+				vector_store_manager, embedding_model, user_input,
+				history=st.session_state.chat_history,
+				last_filename=st.session_state.last_uploaded_filename,
+			)
+		except (IndexServerError, OSError) as e:
+			st.error(f"RAG search failed: {e}")
+			retrieval = retriever.Retrieval()
+		if retrieval.hits and st.session_state.compress_context:
+			# Keep only the sentences closest to the question (rag.context_compression)
+			retriever.compress(retrieval, embedding_model, user_input, st.session_state.compression_ratio)
+		if retrieval.hits:
+			if retrieval.prioritized_file:
+				st.info(f"Prioritizing content from '{retrieval.prioritized_file}' based on your query.")
+			if retrieval.texts:
+				context_label = "Relevant Context from Uploaded Files"
+				display_input += f"\n\n[{context_label}]:\n" + retrieval.context
+				context_for_llm = retrieval.context
+				st.session_state.rag_context = retrieval.texts # Store for potential future display/debug if needed
+				st.success("RAG context found and added to prompt.")
+				if retrieval.compression is not None:
+					compression = retrieval.compression
+					st.caption(
+						f"✂ Context compressed: {compression.tokens_in:,} → {compression.tokens_out:,} tokens "
+						f"({compression.tokens_saved:,} saved, {compression.sentences_out}/{compression.sentences_in} sentences kept)"
+					)
 			else:
-				st.warning("No RAG index available or no results found. Using raw uploaded content if available.")
-				context_for_llm = None # Ensure it's None if no results
-
-		# If RAG was NOT enabled OR no RAG context was found, check for raw uploaded file data
-		# and pass it as context. This acts as a fallback or for smaller files.
-		if not context_for_llm and st.session_state.uploaded_file_data:
-			formatted_file_contents = []
-			for file_name, file_content in st.session_state.uploaded_file_data:
-				formatted_file_contents.append(f"--- File: {file_name} ---\n{file_content}")
-			
+				st.warning("No relevant RAG context found for your query after prioritization.")
+		else:
+			st.warning("No RAG index available or no results found. Using raw uploaded content if available.")
+
+	# If RAG was NOT enabled OR no RAG context was found, check for raw uploaded file data
+	# and pass it as context. This acts as a fallback or for smaller files.
+	if not context_for_llm and st.session_state.uploaded_file_data:
+		# uploaded_file_data holds document-store keys (one per page); read the text back from disk
+		vector_store_manager = store_registry.get(st.session_state.vector_store_id)
+		formatted_file_contents = []
+		for file_name, page_keys in st.session_state.uploaded_file_data:
+			try:
+				file_content = extraction.PAGE_SEPARATOR.join(vector_store_manager.get_document(key) for key in page_keys)
+			except (IndexServerError, OSError) as e:
+				st.error(f"Could not read '{file_name}': {e}")
+				continue
+			formatted_file_contents.append(f"--- File: {file_name} ---\n{file_content}")
+		
+		if formatted_file_contents:
 			all_file_contents = "\n\n".join(formatted_file_contents)
-			display_input += "\n\n[Uploaded File Contents]:\n" + all_file_contents
+			context_label = "Uploaded File Contents"
+			display_input += f"\n\n[{context_label}]:\n" + all_file_contents
 			context_for_llm = all_file_contents # This will be the context for the LLM
 			st.session_state.rag_context = [] # Clear RAG context if raw files are used
 
 
-		# Display the combined input to the user
-		st.chat_message("user").write(display_input)
-		new_idx = _get_unique_id() # Get unique ID before appending
-		_copy_button(display_input, new_idx)
+	# Display the question, with the (often multi-KB) context collapsed below it
+	with st.chat_message("user"):
+		st.write(user_input)
+		if context_label:
+			with st.expander(f"{context_label} ({len(context_for_llm):,} characters)"):
+				st.write(context_for_llm)
+	new_idx = _get_unique_id() # Get unique ID before appending
+	_copy_button(display_input, new_idx)
 
-		# Append ONLY the original user_input to chat_history for LLM's conversational memory
-		st.session_state.chat_history.append(HumanMessage(content=user_input))
+	# Append ONLY the original user_input to chat_history for LLM's conversational memory
+	st.session_state.chat_history.append(HumanMessage(content=user_input))
+
+	# Clear the uploaded file data after use, regardless of RAG
+	st.session_state.uploaded_file_data = []
+	st.session_state.file_uploader_id = st.session_state.file_uploader_id + 1 # Increment to clear uploader visually
 
-		# Clear the uploaded file data after use, regardless of RAG
-		st.session_state.uploaded_file_data = []
-		st.session_state.file_uploader_id = st.session_state.file_uploader_id + 1 # Increment to clear uploader visually
-
-
-		with st.chat_message("assistant"):
-			with st.spinner("思考中…"):
-				# Construct prompt using the prompt_builder module
-				# Pass the separate context_for_llm to prompt_builder
-				prompt = prompt_builder.build_prompt(
-					st.session_state.system_prompt,
-					st.session_state.selected_language,
-					st.session_state.show_cot,
-					st.session_state.reasoning_effort,
-					st.session_state.chat_history, # This now contains ONLY clean chat turns
-					rag_context=context_for_llm # This is the retrieved RAG or raw file content
-				)
 
-				PARAMS_BY_EFFORT = {
-					"low":	{"temperature": 0.2,  "top_p": 0.95, "frequency_penalty": 0.7, "presence_penalty": 0.7,  "max_tokens": 350},
-					"medium": {"temperature": 0.5,  "top_p": 0.90, "frequency_penalty": 0.4, "presence_penalty": 0.4,  "max_tokens": 2000},
-					"high":   {"temperature": 0.8,  "top_p": 0.80, "frequency_penalty": 0.2, "presence_penalty": 0.2,  "max_tokens": 20000},
-				}
-				params = PARAMS_BY_EFFORT[st.session_state.reasoning_effort]
-				extra_body = {"reasoning_effort": st.session_state.reasoning_effort, **params}
-				
-				if not default_config.USE_STREAM:
-					response = ollama_client.get_ollama_response(default_config.MODEL_NAME, user_input, extra_body=extra_body)
-					st.write(response)
-					#st.session_state.chat_history.append(AIMessage(content=response))
-				else:
-					response_placeholder = st.empty()
-					full_text = ""
-					for token in ollama_client.get_ollama_stream(default_config.MODEL_NAME, prompt, extra_body=extra_body):
-						full_text += token
-						response_placeholder.write(full_text)
-					st.session_state.chat_history.append(AIMessage(content=full_text))
-				
-				if st.session_state.auto_save:
+	with st.chat_message("assistant"):
+		with st.spinner("思考中…"):
+			settings = pipeline.Settings(
+				model_name=default_config.MODEL_NAME,
+				system_prompt=st.session_state.system_prompt,
+				language=st.session_state.selected_language,
+				reasoning_effort=st.session_state.reasoning_effort,
+				show_cot=st.session_state.show_cot,
+				history_length=st.session_state.history_length,
+				use_response_cache=st.session_state.use_response_cache and not st.session_state.get("fresh_answer_next", False),
+			)
+			# The one-shot bypass only applies to this question
+			st.session_state.fresh_answer_next = False
+			st.session_state.fresh_answer_id = st.session_state.fresh_answer_id + 1
+			# Pass the separate context_for_llm (retrieved RAG or raw file content) to the prompt
+			prompt = pipeline.build_prompt(settings, st.session_state.chat_history, context_for_llm)
+
+			if not default_config.USE_STREAM:
+				response = ollama_client.get_ollama_response(default_config.MODEL_NAME, user_input, extra_body=settings.extra_body())
+				st.write(response)
+				#st.session_state.chat_history.append(AIMessage(content=response))
+			else:
+				stop_slot = st.empty()
+				# A click reruns the script, which interrupts it at its next write to the page: on_queue
+				# (every poll while queued), the heartbeat (chunks without text) or render_stream
+				stop_slot.button("⏹ Stop", key="stop_generation")
+				response_placeholder = st.empty()
+				stats = stream_render.StreamStats()
+				tokens = pipeline.stream_answer(
+					settings, user_input, prompt, context_for_llm,
+					on_cache_hit=lambda: st.caption("⚡ Replayed from the response cache"),
+					# Shown in the answer's place until the first token overwrites it
+					on_queue=lambda position: response_placeholder.caption(f"⏳ Waiting for the model: position {position} in the queue"),
+					on_degraded=lambda: st.caption("🐢 The model is busy, so this answer uses the short \"low\" effort settings"),
+					on_heartbeat=stream_render.heartbeat(response_placeholder, stats),
+				)
+				finished = False
+				try:
+					# Re-renders at most every STREAM_RENDER_INTERVAL seconds, not once per token
+					stream_render.render_stream(response_placeholder, tokens, stats=stats)
+					finished = True
+				finally:
+					# Closes the HTTP stream, so Ollama stops decoding too (counted as llm_cancelled)
+					tokens.close()
+					if not finished and stats.text:
+						# Stopped: keep the partial answer; it is saved at the start of the next run
+						st.session_state.chat_history.append(AIMessage(content=stats.text))
+						st.session_state.stopped_answer_pending = True
+					elif not finished:
+						# Stopped before the first token: drop the unanswered question, so the history
+						# never has two user turns in a row
+						history = st.session_state.chat_history
+						if history and isinstance(history[-1], HumanMessage) and history[-1].content == user_input:
+							history.pop()
+				stop_slot.empty()
+				st.session_state.chat_history.append(AIMessage(content=stats.text))
+			
+			if st.session_state.auto_save:
+				with tracing.span("save_conversation"):
 					persistence.save_current_conversation()
@@ -1,55 +1,55 @@
 import streamlit as st
-from utils import persistence
-import tiktoken
+from utils import persistence, search_index, tracing
 import json
 import streamlit.components.v1 as components
+# Both modules defer torch/sentence-transformers and faiss until first use.
 from rag.embedding_model import embedding_model
-from rag.vector_store_manager import vector_store_manager
-# Assuming a simple text chunking strategy for demonstration
-from langchain.text_splitter import RecursiveCharacterTextSplitter 
-import tqdm
-import csv # Import the csv module
-import io # Import io for string-based file handling
-
-
-def _process_csv_file(uploaded_file, file_content_raw, all_content_for_rag_processing):
-	"""
-	Processes a single CSV file, extracts rows, and formats them for RAG.
-	Appends formatted rows to all_content_for_rag_processing.
-	"""
-	st.info(f"Processing '{uploaded_file.name}' as CSV...")
-	csv_file = io.StringIO(file_content_raw)
-	csv_reader = csv.reader(csv_file)
-	
-	headers = next(csv_reader, None) # Read header row
-	if headers:
-		for row_idx, row in enumerate(csv_reader):
-			# Create a formatted string for each row
-			formatted_row = f"--- File: {uploaded_file.name} (Row {row_idx + 2}) ---\n" # +2 for header and 0-index
-			row_dict = {}
-			for i, header in enumerate(headers):
-				if i < len(row): # Ensure row has data for this header
-					row_dict[header] = row[i]
-			formatted_row += json.dumps(row_dict, ensure_ascii=False, indent=2) # Use JSON for structured row
-			
-			all_content_for_rag_processing.append({
-				'text': formatted_row,
-				'filename': uploaded_file.name,
-				'original_content': formatted_row # Store the formatted row as the content to be embedded
-			})
-	else:
-		st.warning(f"CSV file '{uploaded_file.name}' appears to be empty or missing headers. Treating as plain text.")
-		# If no headers, treat as plain text for chunking
-		all_content_for_rag_processing.append({
-			'text': f"--- File: {uploaded_file.name} ---\n{file_content_raw}",
-			'filename': uploaded_file.name,
-			'original_content': file_content_raw # Store raw content for embedding if not CSV
-		})
+from rag.store_registry import store_registry
+from rag import extraction, ingest
+from rag.index_client import IndexServerError
+
+
+def _get_token_encoder():
+	"""tiktoken is only imported (and its BPE file loaded) once a file is actually uploaded."""
+	if "token_encoder" not in st.session_state:
+		import tiktoken
+		st.session_state.token_encoder = tiktoken.get_encoding("cl100k_base")
+	return st.session_state.token_encoder
+
+
+def _session_store():
+	"""This session's vector store (see rag.store_registry); never shared with other sessions."""
+	return store_registry.get(st.session_state.vector_store_id)
+
+
+def _upload_signature(uploaded_files):
+	"""Identifies the uploader's current file set, so unchanged uploads aren't re-processed on every rerun."""
+	return tuple(
+		(getattr(f, "file_id", None), f.name, f.size) for f in (uploaded_files or [])
+	)
 
 
 def process_uploaded_files(uploaded_files):
 	"""Processes uploaded text files, calculates token counts, and updates session state.
 	If total token count exceeds a threshold, it processes them with RAG."""
+	signature = _upload_signature(uploaded_files)
+	if st.session_state.get("processed_upload_signature") == signature:
+		return # Same files as the last rerun; index and session state are already up to date
+	st.session_state.processed_upload_signature = signature
+
+	with tracing.trace("upload", files=len(uploaded_files or [])) as upload_trace:
+		try:
+			_ingest_uploaded_files(uploaded_files)
+		except (IndexServerError, OSError) as e: # Index server down or rejected the upload (see rag.index_client)
+			st.error(f"Could not index the uploaded files: {e}")
+			st.session_state.rag_enabled = False
+			st.session_state.uploaded_file_data = []
+			st.session_state.processed_upload_signature = None # Retry on the next rerun
+	st.session_state.last_upload_trace = upload_trace
+
+
+def _ingest_uploaded_files(uploaded_files):
+	vector_store_manager = _session_store()
 	if not uploaded_files:
 		st.session_state.uploaded_file_data = []
 		st.session_state.file_token_counts = {}
@@ -64,58 +64,61 @@ def process_uploaded_files(uploaded_files):
 	st.session_state.rag_context = [] # Reset RAG context for new uploads
 	
 	# Initialize RAG components (embedding model only)
-	embedding_model.load()
-	
-	doc_id_counter = 0 # Unique ID for each chunk
+	with tracing.span("load_embedding_model"):
+		embedding_model.load()
 
 	# Clear existing vector store before adding new chunks from current upload
 	vector_store_manager.clear_index() 
 	# Re-initialize the vector store after clearing it and before adding documents
-	vector_store_manager.init_vector_store(dim=embedding_model.model.get_sentence_embedding_dimension())
-
-	all_content_for_rag_processing = [] # List to hold formatted chunks (rows/text) for RAG
-	current_uploaded_filenames = [] # To keep track of files in the current upload batch
+	vector_store_manager.init_vector_store(dim=embedding_model.dimension)
 
+	# Read all files first, then extract their text in parallel (rag.extraction: PDF, DOCX,
+	# HTML, Markdown, plain text); pages arrive as soon as each one is parsed
+	raw_files = [] # (filename, bytes)
 	for uploaded_file in uploaded_files:
 		try:
-			file_content_raw = None
-			encodings_to_try = ['utf-8', 'big5', 'gbk', 'gb2312', 'latin-1']
-
-			for encoding in encodings_to_try:
-				try:
-					uploaded_file.seek(0)
-					file_content_raw = uploaded_file.read().decode(encoding)
-					break  # Exit the loop if decoding is successful
-				except UnicodeDecodeError:
-					continue  # Try the next encoding
-
-			if file_content_raw is not None:
-				tokens = st.session_state.token_encoder.encode(file_content_raw)
-				token_count = len(tokens)
-
-				st.session_state.uploaded_file_data.append((uploaded_file.name, file_content_raw))
-				st.session_state.file_token_counts[uploaded_file.name] = token_count
-				current_uploaded_filenames.append(uploaded_file.name) # Add to current batch
-				st.success(f"File '{uploaded_file.name}' uploaded successfully! Tokens: **{token_count}**")
-
-				# --- Conditional processing based on file type ---
-				if uploaded_file.name.lower().endswith('.csv'):
-					_process_csv_file(uploaded_file, file_content_raw, all_content_for_rag_processing)
-				else: # --- Plain text processing ---
-					# For non-CSV files, prepend filename and store raw content
-					all_content_for_rag_processing.append({
-						'text': f"--- File: {uploaded_file.name} ---\n{file_content_raw}",
-						'filename': uploaded_file.name,
-						'original_content': file_content_raw # Store raw content for embedding
-					})
-			else:
-				st.error(f"Could not decode file '{uploaded_file.name}'. The encoding may be unsupported.")
+			uploaded_file.seek(0)
+			raw_files.append((uploaded_file.name, uploaded_file.read()))
 		except Exception as e:
 			st.error(f"Error reading file '{uploaded_file.name}': {e}")
 
+	# Pages are buffered per file rather than chunked as they arrive: whether RAG is used at all depends on
+	# the total token count of the upload (RAG_THRESHOLD below), known only once every file is extracted.
+	# Headless ingestion (rag.ingest.ingest_pages) embeds pages as they stream in.
+	pages_by_file = {} # filename -> [Page, ...] in page order
+	failed_files = set()
+	progress = st.empty()
+	with tracing.span("extract", files=len(raw_files)) as attrs:
+		for page in extraction.extract_files(raw_files):
+			if page.error is not None:
+				failed_files.add(page.filename)
+				st.error(f"Could not extract text from '{page.filename}': {page.error}")
+				continue
+			pages_by_file.setdefault(page.filename, []).append(page)
+			progress.caption(f"Extracting '{page.filename}'" + (f": page {page.number}" if page.number else "") + "…")
+		attrs["pages"] = sum(len(pages) for pages in pages_by_file.values())
+	progress.empty()
+
+	decoded_files = [] # (filename, text) for every file whose text could be extracted
+	page_keys = {} # filename -> document-store key of every page (text is kept on disk, not in session state)
+	for file_name, _ in raw_files:
+		if file_name in failed_files or file_name not in pages_by_file:
+			continue
+		file_content_raw = extraction.join_pages(pages_by_file[file_name])
+		with tracing.span("count_tokens", file=file_name):
+			tokens = _get_token_encoder().encode(file_content_raw)
+		token_count = len(tokens)
+
+		page_keys[file_name] = [vector_store_manager.put_document(page.text) for page in pages_by_file[file_name]]
+		st.session_state.uploaded_file_data.append((file_name, page_keys[file_name]))
+		st.session_state.file_token_counts[file_name] = token_count
+		decoded_files.append((file_name, file_content_raw))
+		page_count = sum(page.number is not None for page in pages_by_file[file_name])
+		st.success(f"File '{file_name}' uploaded successfully! " + (f"Pages: **{page_count}**, " if page_count else "") + f"Tokens: **{token_count}**")
+
 	# Update last_uploaded_filename only if files were actually uploaded in this batch
-	if current_uploaded_filenames:
-		st.session_state.last_uploaded_filename = current_uploaded_filenames[-1]
+	if decoded_files:
+		st.session_state.last_uploaded_filename = decoded_files[-1][0]
 	else:
 		st.session_state.last_uploaded_filename = None # No files uploaded in this batch
 
@@ -126,52 +129,22 @@ def process_uploaded_files(uploaded_files):
 
 	if total_token_count > RAG_THRESHOLD:
 		st.warning(f"Total tokens ({total_token_count}) exceed the RAG threshold ({RAG_THRESHOLD}). Processing files with RAG...")
-		
-		# For CSVs, chunks are already formed per row. For text files, we still need text_splitter.
-		# Combine all content that needs to be chunked by RecursiveCharacterTextSplitter
-		content_for_text_splitter = ""
-		for entry in all_content_for_rag_processing:
-			# Only add if it's not a CSV row (which is already a "chunk")
-			if not entry['filename'].lower().endswith('.csv'):
-				content_for_text_splitter += entry['original_content'] + "\n\n"
-		
-		final_chunks_to_embed = []
-		if content_for_text_splitter: # If there's non-CSV text to chunk
-			text_splitter = RecursiveCharacterTextSplitter(
-				chunk_size=500,  # Smaller chunks for more precise retrieval
-				chunk_overlap=100,
-				length_function=len, # Use character length for splitting
-			)
-			chunks_from_text = text_splitter.split_text(content_for_text_splitter)
-			for chunk_text in chunks_from_text:
-				# We lose specific filename for these chunks if multiple text files were combined.
-				# A more advanced solution would track filename per text chunk.
-				# For now, assign "multiple_text_files" or similar.
-				final_chunks_to_embed.append({
-					'text': chunk_text,
-					'filename': "multiple_text_files" if len(uploaded_files) > 1 and not uploaded_files[0].name.lower().endswith('.csv') else uploaded_files[0].name
-				})
-			st.info(f"Splitting non-CSV content into {len(chunks_from_text)} chunks for RAG.")
-
-		# Add the pre-formatted CSV rows as chunks
-		for entry in all_content_for_rag_processing:
-			if entry['filename'].lower().endswith('.csv'):
-				final_chunks_to_embed.append({
-					'text': entry['text'], # This is the formatted row string
-					'filename': entry['filename']
-				})
-		
+
+		# CSV files become one chunk per row; other files are split per page, keeping page numbers (see rag.ingest)
+		# Chunks point into the stored pages instead of carrying their own copy of the text
+		with tracing.span("chunk") as attrs:
+			final_chunks_to_embed = []
+			for file_name, _ in decoded_files:
+				for page, key in zip(pages_by_file[file_name], page_keys[file_name]):
+					page_chunks = ingest.page_chunks(page)
+					ingest.store_source(vector_store_manager, page_chunks, page.text, base=page.start, key=key)
+					final_chunks_to_embed.extend(page_chunks)
+			attrs["chunks"] = len(final_chunks_to_embed)
 		st.info(f"Total RAG chunks to embed: {len(final_chunks_to_embed)}")
 
-		for i, chunk_info in enumerate(tqdm.tqdm(final_chunks_to_embed, desc="Embedding chunks")): 
-			# Embed the content (which is the formatted chunk text)
-			vector = embedding_model.embed_text(chunk_info['text'])
-			
-			# Add to vector store, passing the correct filename
-			vector_store_manager.add_document(doc_id_counter, vector, chunk_info['text'], source_filename=chunk_info['filename'])
-			doc_id_counter += 1
-		
-		vector_store_manager.save_metadata()
+		vectors = ingest.embed_chunks(embedding_model, final_chunks_to_embed)
+		# Add to vector store in one batch (one round-trip when the index server is used)
+		ingest.index_chunks(vector_store_manager, final_chunks_to_embed, vectors)
 		st.success(f"All {len(final_chunks_to_embed)} chunks processed and added to vector store for RAG.")
 
 		st.session_state.rag_enabled = True # Indicate that RAG is active
@@ -189,10 +162,6 @@ def render_sidebar():
 
 	st.subheader("File Upload")
 
-	# Initialize token encoder in session state if it doesn't exist
-	if "token_encoder" not in st.session_state:
-		st.session_state.token_encoder = tiktoken.get_encoding("cl100k_base")
-
 	# Initialize rag_context and rag_enabled if not present
 	if "rag_context" not in st.session_state:
 		st.session_state.rag_context = []
@@ -204,7 +173,7 @@ def render_sidebar():
 
 	# The file uploader widget
 	uploaded_files = st.file_uploader(
-		"Upload text files (content will be used as context for the next query):",
+		"Upload files: text, PDF, Word, HTML, Markdown (content will be used as context for the next query):",
 		accept_multiple_files=True,
 		key=f"file_uploader_{st.session_state.file_uploader_id}"
 	)
@@ -292,6 +261,8 @@ def render_sidebar():
 		persistence.save_config()
 
 	st.subheader("Previous Conversations")
+	# Swap in any background-generated titles that finished since the last rerun.
+	persistence.apply_generated_titles()
 	col_save, col_new = st.columns(2)
 	with col_save:
 		if st.button("Save Current", key="save_conv_btn", use_container_width=True):
@@ -303,10 +274,24 @@ def render_sidebar():
 			st.session_state.uploaded_file_data = []
 			st.session_state.rag_context = [] # Clear RAG context on new chat
 			st.session_state.rag_enabled = False # Disable RAG on new chat
-			vector_store_manager.clear_index() # Clear RAG index on new chat
+			_session_store().clear_index() # Clear RAG index on new chat
 			st.session_state.last_uploaded_filename = None # Clear last uploaded filename
 			st.rerun()
 
+	search_query = st.text_input("Search conversations:", key="conversation_search_input")
+	if search_query.strip():
+		results = search_index.search(search_query)
+		if results:
+			for result_idx, result in enumerate(results):
+				role = "You" if result['role'] == 'human' else "AI"
+				st.markdown(f"**{result['title']}** · {role}: {result['snippet']}")
+				if result['title'] in st.session_state.conversation_titles:
+					if st.button("Open", key=f"search_open_{result_idx}", use_container_width=True):
+						persistence.load_conversation(result['title'])
+		else:
+			st.info("No matching messages.")
+		st.markdown("---")
+
 	if st.session_state.rename_mode:
 		with st.form("rename_form", clear_on_submit=False):
 			st.write(f"Rename conversation: **{st.session_state.conversation_to_rename}**")
@@ -347,7 +332,7 @@ def render_sidebar():
 			st.session_state.uploaded_file_data = []
 			st.session_state.rag_context = [] # Clear RAG context on clearing all conversations
 			st.session_state.rag_enabled = False # Disable RAG on clearing all conversations
-			vector_store_manager.clear_index() # Clear RAG index on clearing all conversations
+			_session_store().clear_index() # Clear RAG index on clearing all conversations
 			st.session_state.last_uploaded_filename = None # Clear last uploaded filename
 			persistence.save_conversations()
 			st.toast("All conversations cleared!")
@@ -413,6 +398,53 @@ def render_sidebar():
 
 	st.markdown("---")
 
+	st.subheader("Response Cache")
+	st.session_state.use_response_cache = st.checkbox(
+		"Reuse cached answers for repeated questions",
+		value=st.session_state.use_response_cache,
+		key="response_cache_checkbox",
+		help="Applies to every question while ticked.",
+	)
+	# One-shot bypass: the key changes after each answer (see chat_area), which resets the box
+	st.session_state.fresh_answer_next = st.checkbox(
+		"Fresh answer for the next question",
+		value=False,
+		key=f"fresh_answer_checkbox_{st.session_state.fresh_answer_id}",
+		disabled=not st.session_state.use_response_cache,
+		help="Skips the cache for one question only, then unticks itself.",
+	)
+
+	st.markdown("---")
+
+	st.subheader("Context Compression")
+	st.session_state.compress_context = st.checkbox(
+		"Keep only the most relevant sentences",
+		value=st.session_state.compress_context,
+		key="compress_context_checkbox",
+		help="Shortens the retrieved RAG context to the sentences closest to your question, so the model reads less before answering.",
+	)
+	if st.session_state.compress_context:
+		st.session_state.compression_ratio = st.slider(
+			"Share of the context to keep:",
+			min_value=0.1,
+			max_value=0.9,
+			value=float(st.session_state.compression_ratio),
+			step=0.1,
+			key="compression_ratio_slider",
+		)
+
+	st.markdown("---")
+
+	st.subheader("Timings")
+	st.session_state.show_timings = st.checkbox(
+		"Show per-stage timings",
+		value=st.session_state.show_timings,
+		key="show_timings_checkbox",
+		help="Shows where the last upload and the last answer spent their time.",
+	)
+
+	st.markdown("---")
+
 	st.subheader("Chain-of-Thought")
 	show_cot_from_ui = st.checkbox(
 		"Show chain‑of‑thought", value=st.session_state.show_cot, key="cot_checkbox"
@@ -1,18 +1,155 @@
 # ollama_client.py
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
 import streamlit as st
 from langchain_core.messages import SystemMessage, HumanMessage
-from openai import OpenAI
-from openai.types.chat import ChatCompletionMessageParam
-
-# ---------- 版本兼容處理 ----------
-# 新版 (>=0.3.1) 使用 langchain_ollama
-# 舊版則使用 langchain_community.chat_models
-try:
-    # 新版匯入
-    from langchain_ollama import ChatOllama
-except ImportError:
-    # 舊版備援
-    from langchain_community.chat_models import ChatOllama
+import config as default_config
+from utils import tracing
+from utils.response_cache import response_cache, CacheKey
+
+# openai 與 ChatOllama 都在第一次呼叫時才匯入，縮短 app 啟動時間
+
+# 每種 reasoning effort 對應的生成參數（佇列過長時降級為 "low"）
+PARAMS_BY_EFFORT = {
+    "low": {"temperature": 0.2, "top_p": 0.95, "frequency_penalty": 0.7, "presence_penalty": 0.7, "max_tokens": 350},
+    "medium": {"temperature": 0.5, "top_p": 0.90, "frequency_penalty": 0.4, "presence_penalty": 0.4, "max_tokens": 2000},
+    "high": {"temperature": 0.8, "top_p": 0.80, "frequency_penalty": 0.2, "presence_penalty": 0.2, "max_tokens": 20000},
+}
+
+# ---------- 排程器 ----------
+# 所有 session（以及背景的標題產生）共用同一個本機模型。排程器限制同時送給
+# Ollama 的請求數，其餘依優先權排隊：互動的對話先於背景工作。
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class QueueFull(RuntimeError):
+    """
+    佇列已超過 OLLAMA_MAX_QUEUE，請求被拒絕
+    """
+
+
+class Ticket:
+    """
+    一個排隊中（或執行中）的請求
+    """
+
+    def __init__(self, priority: int, seq: int, degraded: bool) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.degraded = degraded  # 佇列過長時以 "low" 參數生成
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OllamaScheduler:
+    """
+    行程內共用的請求排程器：同時執行的請求數上限、優先權與佇列上限
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, overflow: str = "degrade") -> None:
+        """
+        :param max_in_flight: 同時送給 Ollama 的請求數（與伺服器的 OLLAMA_NUM_PARALLEL 一致即可）
+        :param max_queue: 排隊中的請求數上限；超過時背景請求一律拒絕
+        :param overflow: 超過上限時互動請求的處理方式："degrade"（改用 "low" 參數）或 "reject"
+        """
+        if overflow not in ("degrade", "reject"):
+            raise ValueError(f"未知的 overflow：{overflow}")
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of Ticket
+        self._in_flight = 0
+        self._seq = itertools.count()
+
+    def _admit(self, priority: int) -> Ticket:
+        with self._cond:
+            over = self._in_flight >= self.max_in_flight and len(self._waiting) >= self.max_queue
+            if over and (priority != INTERACTIVE or self.overflow == "reject"):
+                raise QueueFull(f"The model is busy ({len(self._waiting)} requests waiting); please try again shortly.")
+            ticket = Ticket(priority, next(self._seq), degraded=over)
+            heapq.heappush(self._waiting, ticket)
+            return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        :return: 1 表示下一個執行；0 表示已不在佇列中
+        """
+        with self._cond:
+            if ticket not in self._waiting:
+                return 0
+            return 1 + sum(1 for other in self._waiting if other < ticket)
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE, on_position=None, poll_interval: float = 0.5):
+        """
+        等到輪到自己並取得執行名額，區塊結束時釋放
+
+        :param on_position: 排隊期間每 poll_interval 秒呼叫 on_position(位置)（位置從 1 起算，不變也呼叫）；
+            回呼拋出例外即放棄排隊（例如 Streamlit 在畫面更新時處理「停止」按鈕的 rerun）
+        :raises QueueFull: 佇列已滿
+        :yield: Ticket（ticket.degraded 表示應降級參數）
+        """
+        ticket = self._admit(priority)
+        started = time.perf_counter()
+        try:
+            with self._cond:
+                while self._in_flight >= self.max_in_flight or self._waiting[0] is not ticket:
+                    if on_position is not None:
+                        position = 1 + sum(1 for other in self._waiting if other < ticket)
+                        # 在鎖外呼叫（回呼可能要更新畫面）
+                        self._cond.release()
+                        try:
+                            on_position(position)
+                        finally:
+                            self._cond.acquire()
+                        # 回呼期間可能已輪到自己（錯過的 notify 不必再等一個 poll_interval）
+                        if self._in_flight < self.max_in_flight and self._waiting[0] is ticket:
+                            break
+                    self._cond.wait(poll_interval)
+                heapq.heappop(self._waiting)
+                self._in_flight += 1
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+            raise
+        tracing.record("llm_queue_wait", time.perf_counter() - started, start=started, priority=priority)
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiting),
+                "waiting_interactive": sum(1 for t in self._waiting if t.priority == INTERACTIVE),
+            }
+
+
+# 單例實例（供其他模組直接 import）
+scheduler = OllamaScheduler(
+    max_in_flight=default_config.OLLAMA_MAX_IN_FLIGHT,
+    max_queue=default_config.OLLAMA_MAX_QUEUE,
+    overflow=default_config.OLLAMA_QUEUE_OVERFLOW,
+)
+
+
+def _degrade(extra_body: dict) -> dict:
+    return {**extra_body, "reasoning_effort": "low", **PARAMS_BY_EFFORT["low"]}
+
 
 # ---------- 工具函式 ----------
 def _build_chat_model(model_name: str, extra_body: dict | None):
@@ -21,10 +158,26 @@ def _build_chat_model(model_name: str, extra_body: dict | None):
     作為關鍵字參數傳給建構子。若新版不支援該參數，
     則會被忽略 (因為 **kwargs 會忽略不存在的參數)。
     """
+    # ---------- 版本兼容處理 ----------
+    # 新版 (>=0.3.1) 使用 langchain_ollama
+    # 舊版則使用 langchain_community.chat_models
+    try:
+        # 新版匯入
+        from langchain_ollama import ChatOllama
+    except ImportError:
+        # 舊版備援
+        from langchain_community.chat_models import ChatOllama
+
     kwargs = extra_body or {}
     # 新版建構子通常使用 `model_kwargs`，舊版使用 `extra_body`
     # 為了簡化，直接把所有 key 當成關鍵字參數傳遞即可
-    return ChatOllama(model=model_name, **kwargs)
+    # keep_alive 讓模型在請求之間常駐記憶體（見 utils.warmup）
+    return ChatOllama(
+        model=model_name,
+        base_url=default_config.OLLAMA_BASE_URL,
+        keep_alive=default_config.OLLAMA_KEEP_ALIVE,
+        **kwargs,
+    )
 
 def convert_messages_to_string_simple(messages):
     return "\n".join([f"{msg.type.capitalize()}: {msg.content}" for msg in messages])
@@ -46,26 +199,28 @@ def get_ollama_response(model_name: str, user_input: str, extra_body: dict | Non
         str: Chunks of the generated response content.
     """
     try:
-        client = OpenAI(
-            base_url="http://localhost:11434/v1",
-            api_key="ollama"  # Ollama doesn't require a real API key; this is a placeholder.
-        )
+        with scheduler.slot(INTERACTIVE):
+            from openai import OpenAI
+            client = OpenAI(
+                base_url=f"{default_config.OLLAMA_BASE_URL}/v1",
+                api_key="ollama"  # Ollama doesn't require a real API key; this is a placeholder.
+            )
 
-        # Call the chat completions API
-        stream = client.completions.create(
-            model=model_name,
-            prompt=user_input,
-            max_tokens=16384,
-            temperature=0.6,
-            top_p=0.95,
-            stream=True,
-            extra_body=extra_body or {}
-        )
+            # Call the chat completions API
+            stream = client.completions.create(
+                model=model_name,
+                prompt=user_input,
+                max_tokens=16384,
+                temperature=0.6,
+                top_p=0.95,
+                stream=True,
+                extra_body=extra_body or {}
+            )
 
-        for chunk in stream:
-            # Access the 'text' attribute instead of 'delta'.
-            if chunk.choices and chunk.choices[0].text:
-                yield chunk.choices[0].text
+            for chunk in stream:
+                # Access the 'text' attribute instead of 'delta'.
+                if chunk.choices and chunk.choices[0].text:
+                    yield chunk.choices[0].text
     except Exception as e:
         # Using st.error and st.warning assumes a Streamlit environment
         st.error(f"Error communicating with Ollama: {e}")
@@ -78,21 +233,101 @@ def get_ollama_response(model_name: str, user_input: str, extra_body: dict | Non
 
 
 
-def get_ollama_stream(model_name: str, messages, extra_body: dict | None = None):
+def get_ollama_stream(
+    model_name: str,
+    messages,
+    extra_body: dict | None = None,
+    cache_key: CacheKey | None = None,
+    on_cache_hit=None,
+    raise_errors: bool = False,
+    priority: int = INTERACTIVE,
+    on_queue=None,
+    on_degraded=None,
+    on_heartbeat=None,
+):
     """
     逐塊串流回覆。回傳的內容只包含純文字。
+
+    若提供 cache_key（見 utils.response_cache.make_key），先查回覆快取：
+    命中時立即重播快取的片段（並呼叫 on_cache_hit），否則照常串流，
+    完整結束後寫入快取。傳入 None 即可略過快取。
+
+    要中途停止，呼叫端對回傳的 generator 呼叫 close()：HTTP 連線隨即關閉
+    （Ollama 停止解碼），並計入 llm_cancelled。
+
+    快取未命中的請求經過 scheduler 排隊：排隊期間以 on_queue(位置) 回報，
+    佇列過長時改用 "low" 參數（呼叫 on_degraded）或拒絕（QueueFull）。
+
+    模型送出沒有文字的片段時（例如 gpt-oss 的推理階段）呼叫 on_heartbeat()：
+    Streamlit 只在下一次 st.* 呼叫時處理「停止」按鈕，回呼讓呼叫端有機會更新畫面。
+    回呼拋出的例外（例如 Streamlit 的 rerun）同樣關閉串流並計入 llm_cancelled。
+
+    發生錯誤時預設以 st.error 顯示並產生一段錯誤訊息；無介面的呼叫端
+    （engine.pipeline）傳入 raise_errors=True 直接取得例外。
     """
     if extra_body is None:
         extra_body = {}
 
+    if cache_key is not None:
+        with tracing.span("response_cache_lookup"):
+            cached_chunks = response_cache.get(cache_key)
+        if cached_chunks is not None:
+            tracing.count("response_cache_hits")
+            if on_cache_hit is not None:
+                on_cache_hit()
+            yield from cached_chunks
+            return
+
+    chunks = []
     try:
-        chat_model = _build_chat_model(model_name, extra_body)
-        stream = chat_model.stream(messages)
-        for chunk in stream:
-            # 兼容多種 chunk 物件結構
-            content = getattr(chunk, "content", None)
-            if content:
-                yield content
-    except Exception as e:
-        st.error(f"Error streaming from Ollama: {e}")
-        yield "An error occurred while streaming the response."
\ No newline at end of file
+        with scheduler.slot(priority, on_position=on_queue) as ticket:
+            if ticket.degraded:
+                tracing.count("llm_degraded")
+                extra_body = _degrade(extra_body)
+                if on_degraded is not None:
+                    on_degraded()
+            started = time.perf_counter()
+            stream = None
+            try:
+                chat_model = _build_chat_model(model_name, extra_body)
+                stream = chat_model.stream(messages)
+                for chunk in stream:
+                    # 兼容多種 chunk 物件結構
+                    content = getattr(chunk, "content", None)
+                    if content:
+                        if not chunks:
+                            # time-to-first-token：從送出請求到第一個片段
+                            tracing.record("llm_first_token", time.perf_counter() - started, start=started)
+                        chunks.append(content)
+                        yield content
+                    elif on_heartbeat is not None:
+                        on_heartbeat()
+            except Exception as e:
+                tracing.count("llm_errors")
+                if raise_errors:
+                    raise
+                st.error(f"Error streaming from Ollama: {e}")
+                yield "An error occurred while streaming the response."
+                return
+            except BaseException:
+                # 呼叫端關閉了 generator，或回呼中斷了串流（使用者按下停止）：計入被浪費的生成
+                tracing.count("llm_cancelled")
+                tracing.count("llm_cancelled_chunks", len(chunks))
+                raise
+            finally:
+                # 關閉底層的 HTTP 串流，Ollama 偵測到斷線後就停止生成
+                if stream is not None:
+                    stream.close()
+                # 包含呼叫端在兩個片段之間的處理時間（例如畫面更新）
+                tracing.record("llm_stream", time.perf_counter() - started, start=started, chunks=len(chunks))
+    except QueueFull as e:
+        tracing.count("llm_rejected")
+        if raise_errors:
+            raise
+        st.warning(str(e))
+        yield str(e)
+        return
+
+    # 只快取完整結束的回覆（中途被關閉的 generator 不會執行到這裡）；降級的簡短回覆不快取
+    if cache_key is not None and chunks and not ticket.degraded:
+        response_cache.put(cache_key, chunks)
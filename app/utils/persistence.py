@@ -1,12 +1,20 @@
 import streamlit as st
+import copy
 import json
 import os
 from langchain_core.messages import HumanMessage, AIMessage
 import config as default_config
+from utils import state_cache, title_generator, search_index
+from utils.write_behind import writer, atomic_write_json
 
 # ---- config ----
 def load_config(file_path: str=default_config.CONFIG_FILE):
-	"""Loads application configuration from a JSON file."""
+	"""Loads application configuration, served from the process-wide state cache."""
+	# Callers mutate the result (e.g. profiles), so never hand out the cached object.
+	return copy.deepcopy(state_cache.get(file_path, _read_config))
+
+def _read_config(file_path: str):
+	"""Reads application configuration from a JSON file."""
 	if os.path.exists(file_path):
 		with open(file_path, "r") as f:
 			config = json.load(f)
@@ -36,11 +44,11 @@ def load_config(file_path: str=default_config.CONFIG_FILE):
 		"auto_save": default_config.DEFAULT_AUTO_SAVE,
 		"use_search": default_config.DEFAULT_USE_SEARCH,
 		"profiles": default_config.DEFAULT_PROFILES,
-		"file_uploader_id": default_config.DEFAULT_FILE_UPLOADER_ID
+		"file_uploader_id": default_config.DEFAULT_INIT_FILE_UPLOADER_ID
 	}
 
 def save_config(file_path: str=default_config.CONFIG_FILE):
-	"""Saves current application configuration to a JSON file."""
+	"""Saves current application configuration to a JSON file (debounced, written in the background)."""
 	config = {
 		"system_prompt": st.session_state.system_prompt,
 		"selected_language": st.session_state.selected_language,
@@ -53,14 +61,24 @@ def save_config(file_path: str=default_config.CONFIG_FILE):
 		"profiles": st.session_state.profiles,
 		"file_uploader_id": st.session_state.file_uploader_id
 	}
-	with open(file_path, "w") as f:
-		json.dump(config, f, indent=4)
+	# Snapshot now: session_state keeps changing while the write is pending.
+	# The snapshot is only ever read (load_config hands out copies), so cache and writer share it.
+	config = copy.deepcopy(config)
+	state_cache.put(file_path, config)
+	writer.schedule(file_path, lambda: atomic_write_json(file_path, config))
 	st.toast("Configuration saved!")
 
 # ---- conversations ----
 
 def load_conversations(file_path: str=default_config.CONVERSATIONS_FILE):
-	"""Loads conversation history from a separate JSON file."""
+	"""Loads conversation history, served from the process-wide state cache."""
+	# Sessions add/remove titles and append to histories; copy the dict and each list.
+	cached = state_cache.get(file_path, _read_conversations)
+	_prime_search_index(cached)
+	return {title: list(history) for title, history in cached.items()}
+
+def _read_conversations(file_path: str):
+	"""Reads conversation history from a separate JSON file."""
 	if os.path.exists(file_path):
 		with open(file_path, "r") as f:
 			serialized_conversations = json.load(f)
@@ -76,17 +94,38 @@ def load_conversations(file_path: str=default_config.CONVERSATIONS_FILE):
 			return deserialized_conversations
 	return {}
 
-def save_conversations(file_path: str=default_config.CONVERSATIONS_FILE):
-	"""Saves conversation history to a separate JSON file."""
+def _serialize_conversations(conversations):
 	serialized_conversations = {}
-	for title, history in st.session_state.conversation_titles.items():
+	for title, history in conversations.items():
 		serialized_history = [
 			{'type': 'human' if isinstance(msg, HumanMessage) else 'ai', 'content': msg.content}
 			for msg in history
 		]
 		serialized_conversations[title] = serialized_history
-	with open(file_path, "w") as f:
-		json.dump(serialized_conversations, f, indent=4)
+	return serialized_conversations
+
+_search_index_primed = False
+
+def _prime_search_index(conversations):
+	"""Indexes the archive in the background once per process (cheap if the index is already current)."""
+	global _search_index_primed
+	if _search_index_primed:
+		return
+	_search_index_primed = True
+	serialized_conversations = _serialize_conversations(conversations)
+	writer.schedule(default_config.SEARCH_INDEX_FILE, lambda: search_index.sync(serialized_conversations))
+
+def save_conversations(file_path: str=default_config.CONVERSATIONS_FILE):
+	"""Saves conversation history to a separate JSON file (debounced, written in the background)."""
+	serialized_conversations = _serialize_conversations(st.session_state.conversation_titles)
+	def _write():
+		atomic_write_json(file_path, serialized_conversations)
+		# Keep the full-text index in step with what is on disk.
+		search_index.sync(serialized_conversations)
+	writer.schedule(file_path, _write)
+	state_cache.put(file_path, {
+		title: list(history) for title, history in st.session_state.conversation_titles.items()
+	})
 	st.toast("Conversations saved!")
 
 def load_conversation(title):
@@ -136,45 +175,41 @@ def save_current_conversation():
 		st.session_state.conversation_titles[title_to_save] = list(st.session_state.chat_history)
 		st.toast(f"Conversation '{title_to_save}' updated!")
 	else:
-		title = generate_conversation_title(st.session_state.chat_history)
+		# Save under a local heuristic title now; the LLM title replaces it once ready.
+		title = _unique_title(title_generator.heuristic_title(st.session_state.chat_history))
 		st.session_state.conversation_titles[title] = list(st.session_state.chat_history)
 		st.session_state.current_conversation_title = title
+		st.session_state.pending_titles[title] = title_generator.request_title(st.session_state.chat_history)
 		st.toast(f"Conversation '{title}' saved!")
 	
 	save_conversations()
 	st.rerun()
 
-def generate_conversation_title(history):
-	"""Generates a concise title for a conversation based on its first few turns."""
-	if not history:
-		return "New Conversation"
-
-	first_messages = " ".join(
-		[m.content for m in history[:3] if isinstance(m, HumanMessage)]
-	)
-	if not first_messages:
-		return "New Conversation"
-
-	try:
-		title_model = ChatOllama(model="gpt-oss")
-		title_prompt = (
-			f"Summarize the following conversation snippet into a very concise title "
-			f"(under 8 words, without quotes or conversational phrases): "
-			f"'{first_messages}'"
-		)
-		title_response = title_model.invoke(
-			[
-				SystemMessage(content="You are a helpful summarizer."),
-				HumanMessage(content=title_prompt),
-			]
-		)
-		return (
-			title_response.content.strip()
-			.replace('"', "")
-			.replace(".", "")
-			.replace(":", "")
-			.split("\n")[0]
-		)
-	except Exception as e:
-		print(f"Error generating title: {e}")
-		return f"Conversation {len(st.session_state.conversation_titles) + 1}"
+def apply_generated_titles():
+	"""Renames conversations saved under a heuristic title once their background LLM title is ready."""
+	renamed = False
+	for heuristic, key in list(st.session_state.pending_titles.items()):
+		generated = title_generator.get_title(key)
+		if generated is None:
+			if title_generator.has_failed(key):
+				del st.session_state.pending_titles[heuristic] # Keeps its heuristic title; stop polling
+			continue
+		del st.session_state.pending_titles[heuristic]
+		# Skip if the user renamed/deleted it meanwhile, or the title is already taken.
+		if heuristic not in st.session_state.conversation_titles or generated in st.session_state.conversation_titles:
+			continue
+		st.session_state.conversation_titles[generated] = st.session_state.conversation_titles.pop(heuristic)
+		if st.session_state.current_conversation_title == heuristic:
+			st.session_state.current_conversation_title = generated
+		renamed = True
+	if renamed:
+		save_conversations()
+
+def _unique_title(title):
+	"""Appends a counter if title is already used by a saved conversation."""
+	candidate = title
+	counter = 2
+	while candidate in st.session_state.conversation_titles:
+		candidate = f"{title} ({counter})"
+		counter += 1
+	return candidate
@@ -1,7 +1,7 @@
 import streamlit as st
 from langchain_core.messages import SystemMessage, HumanMessage
 
-def build_prompt(system_prompt: str, selected_language: str, show_cot: bool, reasoning_effort: str, chat_history: list, rag_context: str = None) -> list:
+def build_prompt(system_prompt: str, selected_language: str, show_cot: bool, reasoning_effort: str, chat_history: list, rag_context: str = None, history_length: int | None = None) -> list:
     """
     Constructs the LLM prompt based on session state variables.
 
@@ -19,6 +19,9 @@ def build_prompt(system_prompt: str, selected_language: str, show_cot: bool, rea
         The current chat history (should contain only original user/AI messages).
     rag_context : str, optional
         The retrieved context from RAG or raw file content, if available. Defaults to None.
+    history_length : int, optional
+        How many of the latest messages to include. Defaults to
+        st.session_state.history_length; pass it explicitly outside Streamlit.
 
     Returns
     -------
@@ -48,6 +51,8 @@ def build_prompt(system_prompt: str, selected_language: str, show_cot: bool, rea
     prompt = [SystemMessage(content=full_system_prompt)]
     
     # Extend with the chat history, which now only contains clean conversational turns
-    prompt.extend(chat_history[-st.session_state.history_length:])
+    if history_length is None:
+        history_length = st.session_state.history_length
+    prompt.extend(chat_history[-history_length:])
     
     return prompt
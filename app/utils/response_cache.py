@@ -0,0 +1,164 @@
+# response_cache.py
+"""
+Response cache in front of ollama_client.get_ollama_stream.
+
+Entries are keyed on (model + generation options, system prompt, fingerprint of the
+retrieved context, normalized question). When RESPONSE_CACHE_SEMANTIC_THRESHOLD is
+set and the embedding model is already loaded, a question that misses exactly can
+still hit an entry in the same scope whose question embedding is close enough and
+whose content words (question tokens minus stopwords) are the same, so rewordings
+match but "revenue in Q1?" never replays the answer to "revenue in Q2?".
+
+Cached answers are stored as the original list of streamed chunks so they can be
+replayed through the same streaming code path.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import config as default_config
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    scope: str      # hash of model, options, system prompt and context
+    question: str   # normalized question
+
+
+@dataclass
+class _Entry:
+    chunks: list
+    created: float
+    vector: object = field(default=None)  # unit-length question embedding, if available
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases, collapses whitespace and drops trailing punctuation."""
+    text = " ".join(question.lower().split())
+    return re.sub(r"[\s?!.。？！]+$", "", text)
+
+
+# Function words ignored when comparing the content of two questions
+_STOPWORDS = frozenset(
+    "a an the of in on at to for from by with about and or is are was were be been do does did "
+    "what which who whom whose when where why how can could would should will shall may might must "
+    "i me my we our you your it its this that these those there please tell show give".split()
+)
+
+
+def content_words(question: str) -> frozenset:
+    """The question's words without stopwords (for the semantic-match guard)."""
+    return frozenset(w for w in re.findall(r"\w+", normalize_question(question)) if w not in _STOPWORDS)
+
+
+def make_key(model_name: str, system_prompt: str, context: str | None, question: str, options: dict | None = None) -> CacheKey:
+    """
+    Builds the cache key for one request.
+
+    :param model_name: Ollama model name
+    :param system_prompt: the persona/system prompt (without retrieved context)
+    :param context: retrieved RAG context or raw file contents, or None
+    :param question: the user's question as typed
+    :param options: anything else that changes the answer (language, effort params, ...)
+    """
+    context_fingerprint = hashlib.sha256((context or "").encode("utf-8")).hexdigest()
+    scope_payload = json.dumps(
+        [model_name, options or {}, system_prompt, context_fingerprint],
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    scope = hashlib.sha256(scope_payload.encode("utf-8")).hexdigest()
+    return CacheKey(scope=scope, question=normalize_question(question))
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of streamed answers. Thread-safe; one instance is shared by all sessions.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, semantic_threshold: float | None = None) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> list | None:
+        """Returns the cached chunks for key (exact, then semantic match), or None."""
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return list(entry.chunks)
+            if self.semantic_threshold is None:
+                return None
+            words = content_words(key.question)
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if k.scope == key.scope and e.vector is not None and content_words(k.question) == words
+            ]
+        if not candidates:
+            return None
+        query_vector = self._embed(key.question)
+        if query_vector is None:
+            return None
+        best_key, best_score = None, self.semantic_threshold
+        for candidate_key, entry in candidates:
+            score = float(query_vector @ entry.vector)
+            if score >= best_score:
+                best_key, best_score = candidate_key, score
+        if best_key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(best_key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return list(entry.chunks)
+
+    def put(self, key: CacheKey, chunks: list) -> None:
+        """Stores a complete answer; evicts the least recently used entries beyond max_entries."""
+        vector = self._embed(key.question) if self.semantic_threshold is not None else None
+        with self._lock:
+            self._entries[key] = _Entry(chunks=list(chunks), created=time.time(), vector=vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _evict_expired(self, now: float) -> None:
+        # Entries are in LRU order, not age order, so scan them all; the cache is small.
+        expired = [k for k, e in self._entries.items() if now - e.created > self.ttl_seconds]
+        for k in expired:
+            del self._entries[k]
+
+    @staticmethod
+    def _embed(question: str):
+        """Unit-length embedding of question, or None if the embedding model isn't loaded yet."""
+        # Never trigger a model load from the chat path; only use the model once something else loaded it.
+        from rag.embedding_model import embedding_model
+        if embedding_model.model is None:
+            return None
+        vector = embedding_model.embed_text(question)
+        norm = float((vector * vector).sum()) ** 0.5
+        return vector / norm if norm else None
+
+
+# 單例實例（供其他模組直接 import）
+response_cache = ResponseCache(
+    max_entries=default_config.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=default_config.RESPONSE_CACHE_TTL_SECONDS,
+    semantic_threshold=default_config.RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+)
@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import config as default_config
+
+logger = logging.getLogger(__name__)
+
+# ---- full-text search over saved conversations ----
+# Messages are indexed in an SQLite FTS5 table (default_config.SEARCH_INDEX_FILE).
+# unicode61 treats a run of CJK characters as one token, so CJK text is segmented
+# into single characters before indexing and querying; a CJK query then becomes a
+# phrase query ("週 報"), which matches the characters in order.
+#
+# sync() is incremental: for each conversation we keep the message count and a
+# digest of those messages, and when a save only appended turns, only the new
+# turns are inserted.
+
+_CJK_CHAR = re.compile(r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])")
+_write_lock = threading.Lock()
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_{}\[\]()#+\-.!|~<>])")
+
+# One connection per thread and file; WAL mode and the schema are set up once per file,
+# so a search is a single SELECT instead of PRAGMA + DDL + SELECT.
+_local = threading.local()
+_initialized = set()
+_init_lock = threading.Lock()
+
+# messages holds the original rows; messages_fts indexes the segmented text under the same rowid.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_conversations (
+	title TEXT PRIMARY KEY,
+	message_count INTEGER NOT NULL,
+	digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+	id INTEGER PRIMARY KEY,
+	title TEXT NOT NULL,
+	position INTEGER NOT NULL,
+	role TEXT NOT NULL,
+	content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_title ON messages (title);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+	body,
+	tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _segment(text: str) -> str:
+	"""Surrounds every CJK character with spaces so FTS5 indexes it as its own token."""
+	return _CJK_CHAR.sub(r" \1 ", text)
+
+
+def _digest(messages) -> str:
+	h = hashlib.sha1()
+	for msg in messages:
+		h.update(msg["type"].encode("utf-8"))
+		h.update(b"\0")
+		h.update(msg["content"].encode("utf-8"))
+		h.update(b"\0")
+	return h.hexdigest()
+
+
+def _connect(file_path: str):
+	"""This thread's cached connection to file_path (created, and the file initialized, on first use)."""
+	connections = getattr(_local, "connections", None)
+	if connections is None:
+		connections = _local.connections = {}
+	conn = connections.get(file_path)
+	if conn is not None and not os.path.exists(file_path):
+		_reset(file_path) # The file was deleted under the cached connection; start a new one
+		conn = None
+	if conn is None:
+		conn = sqlite3.connect(file_path, timeout=5)
+		with _init_lock:
+			if file_path not in _initialized:
+				conn.execute("PRAGMA journal_mode=WAL")
+				conn.executescript(_SCHEMA)
+				_initialized.add(file_path)
+		connections[file_path] = conn
+	return conn
+
+
+def _reset(file_path: str) -> None:
+	"""Drops this thread's connection and re-runs the setup next time (e.g. after the file was deleted)."""
+	conn = getattr(_local, "connections", {}).pop(file_path, None)
+	if conn is not None:
+		conn.close()
+	with _init_lock:
+		_initialized.discard(file_path)
+
+
+def _delete_conversation(conn, title: str) -> None:
+	conn.execute("DELETE FROM messages_fts WHERE rowid IN (SELECT id FROM messages WHERE title = ?)", (title,))
+	conn.execute("DELETE FROM messages WHERE title = ?", (title,))
+
+
+def sync(serialized_conversations: dict, file_path: str=default_config.SEARCH_INDEX_FILE) -> None:
+	"""
+	Brings the index in line with serialized_conversations ({title: [{'type', 'content'}, ...]}).
+	Only changed conversations are touched; appended turns are inserted without re-indexing the rest.
+	"""
+	with _write_lock:
+		conn = _connect(file_path)
+		try:
+			with conn:
+				indexed = {
+					title: (count, digest)
+					for title, count, digest in conn.execute(
+						"SELECT title, message_count, digest FROM indexed_conversations"
+					)
+				}
+				for title in indexed.keys() - serialized_conversations.keys():
+					_delete_conversation(conn, title)
+					conn.execute("DELETE FROM indexed_conversations WHERE title = ?", (title,))
+
+				for title, messages in serialized_conversations.items():
+					count, digest = indexed.get(title, (0, None))
+					full_digest = _digest(messages)
+					if count == len(messages) and digest == full_digest:
+						continue
+					if digest is None:
+						start = 0  # new conversation
+					elif count <= len(messages) and _digest(messages[:count]) == digest:
+						start = count  # only new turns were appended
+					else:
+						_delete_conversation(conn, title)
+						start = 0
+					for position, msg in enumerate(messages[start:], start=start):
+						cursor = conn.execute(
+							"INSERT INTO messages (title, position, role, content) VALUES (?, ?, ?, ?)",
+							(title, position, msg["type"], msg["content"]),
+						)
+						conn.execute(
+							"INSERT INTO messages_fts (rowid, body) VALUES (?, ?)",
+							(cursor.lastrowid, _segment(msg["content"])),
+						)
+					conn.execute(
+						"INSERT OR REPLACE INTO indexed_conversations (title, message_count, digest) VALUES (?, ?, ?)",
+						(title, len(messages), full_digest),
+					)
+		except sqlite3.Error:
+			_reset(file_path)
+			raise
+
+
+def _build_match_query(query: str) -> str:
+	"""Turns free text into an FTS5 MATCH expression: every term must match, the last one as a prefix."""
+	phrases = []
+	for term in query.split():
+		tokens = re.findall(r"\w+", _segment(term))
+		if tokens:
+			phrases.append('"' + " ".join(tokens) + '"')
+	if not phrases:
+		return ""
+	if not _CJK_CHAR.search(phrases[-1]):
+		phrases[-1] += " *"  # search-as-you-type on the last word
+	return " ".join(phrases)
+
+
+def _escape_markdown(text: str) -> str:
+	"""Backslash-escapes markdown syntax so stored message text renders literally."""
+	return _MARKDOWN_SPECIAL.sub(r"\\\1", text)
+
+
+def _snippet(content: str, query: str, width: int = 40) -> str:
+	"""A short excerpt of content around the first query term, with the term in bold (markdown-escaped)."""
+	flat = " ".join(content.split())
+	for term in query.split():
+		pos = flat.lower().find(term.lower())
+		if pos != -1:
+			start = max(0, pos - width)
+			end = min(len(flat), pos + len(term) + width)
+			return (
+				("…" if start > 0 else "")
+				+ _escape_markdown(flat[start:pos])
+				+ "**" + _escape_markdown(flat[pos:pos + len(term)]) + "**"
+				+ _escape_markdown(flat[pos + len(term):end])
+				+ ("…" if end < len(flat) else "")
+			)
+	return _escape_markdown(flat[:2 * width]) + ("…" if len(flat) > 2 * width else "")
+
+
+def search(query: str, limit: int = 20, file_path: str=default_config.SEARCH_INDEX_FILE) -> list:
+	"""
+	Ranked (bm25) full-text search over all indexed messages.
+	Returns [{'title', 'position', 'role', 'snippet'}, ...], best match first.
+	"""
+	match = _build_match_query(query)
+	if not match:
+		return []
+	try:
+		conn = _connect(file_path)
+	except sqlite3.Error as e:
+		logger.error(f"Search index unavailable: {e}")
+		_reset(file_path)
+		return []
+	try:
+		rows = conn.execute(
+			"SELECT m.title, m.position, m.role, m.content "
+			"FROM messages_fts JOIN messages AS m ON m.id = messages_fts.rowid "
+			"WHERE messages_fts MATCH ? ORDER BY bm25(messages_fts) LIMIT ?",
+			(match, limit),
+		).fetchall()
+	except sqlite3.OperationalError as e:
+		logger.error(f"Search query '{match}' failed: {e}")
+		if "no such table" in str(e):
+			_reset(file_path) # The index file was removed or replaced; set it up again next time
+		return []
+	except sqlite3.Error as e:
+		logger.error(f"Search query '{match}' failed: {e}")
+		return []
+	return [
+		{"title": title, "position": int(position), "role": role, "snippet": _snippet(content, query)}
+		for title, position, role, content in rows
+	]
+
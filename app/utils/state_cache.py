@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+import config as default_config
+
+# ---- process-wide file cache ----
+# Streamlit re-executes app.py on every interaction. Anything read from disk in
+# the script body (config.json, conversations.json, CSS) is therefore cached
+# here, once per process, and shared by every session.
+#
+# An entry is invalidated when:
+#   * the file's mtime changes on disk (checked at most every
+#     STATE_CACHE_STAT_INTERVAL seconds, so most reruns do not even stat), or
+#   * this process writes the file itself and records the new value via put().
+
+_lock = threading.Lock()
+_entries = {}  # abs path -> {"value": ..., "mtime": int | None, "checked": float}
+_stats = {"hits": 0, "misses": 0}
+
+
+def _key(file_path: str) -> str:
+	return os.path.abspath(file_path)
+
+
+def _mtime(path: str):
+	try:
+		return os.stat(path).st_mtime_ns
+	except OSError:
+		return None
+
+
+def get(file_path: str, loader):
+	"""Returns the cached value for file_path, calling loader(file_path) on a miss or after the file changed."""
+	path = _key(file_path)
+	now = time.monotonic()
+	with _lock:
+		entry = _entries.get(path)
+		if entry is not None:
+			if now - entry["checked"] < default_config.STATE_CACHE_STAT_INTERVAL:
+				_stats["hits"] += 1
+				return entry["value"]
+			mtime = _mtime(path)
+			entry["checked"] = now
+			if mtime == entry["mtime"]:
+				_stats["hits"] += 1
+				return entry["value"]
+		_stats["misses"] += 1
+		mtime = _mtime(path)
+		value = loader(file_path)
+		_entries[path] = {"value": value, "mtime": mtime, "checked": now}
+		return value
+
+
+def put(file_path: str, value) -> None:
+	"""Records a value this process has written (or scheduled to write) to file_path, so the next get() does not re-read it."""
+	path = _key(file_path)
+	with _lock:
+		_entries[path] = {"value": value, "mtime": _mtime(path), "checked": time.monotonic()}
+
+
+def touch(file_path: str) -> None:
+	"""Refreshes the recorded mtime after this process finished writing file_path, keeping the cached value."""
+	path = _key(file_path)
+	with _lock:
+		entry = _entries.get(path)
+		if entry is not None:
+			entry["mtime"] = _mtime(path)
+			entry["checked"] = time.monotonic()
+
+
+def invalidate(file_path: str) -> None:
+	"""Drops the cached value for file_path; the next get() reloads it."""
+	with _lock:
+		_entries.pop(_key(file_path), None)
+
+
+def read_text(file_path: str) -> str:
+	"""Cached read of a static text asset (e.g. a CSS file)."""
+	def _read(p):
+		with open(p, "r", encoding="utf-8") as f:
+			return f.read()
+	return get(file_path, _read)
+
+
+def stats() -> dict:
+	"""Returns a copy of the hit/miss counters, used for the per-rerun log line."""
+	with _lock:
+		return dict(_stats)
@@ -0,0 +1,94 @@
+import time
+from dataclasses import dataclass
+
+import config as default_config
+from utils import tracing
+
+
+@dataclass
+class StreamStats:
+	"""What render_stream delivered; bench_llm_path.py reads the timings, chat_area only the text."""
+	text: str = ""
+	tokens: int = 0
+	renders: int = 0
+	rendered_chars: int = 0 # Sum of the text length of every render (the cost that grows with the answer)
+	first_token_seconds: float | None = None
+	seconds: float = 0.0
+
+
+def render_stream(placeholder, tokens, min_interval: float | None = None, stats: StreamStats | None = None) -> StreamStats:
+	"""
+	Streams tokens into placeholder (an st.empty()), re-rendering the accumulated text at most
+	once per min_interval seconds instead of on every token, plus once at the end.
+
+	Each render re-sends and re-parses the whole answer as Markdown, so rendering per token
+	costs O(n^2) in the answer length; at a few renders per second the text still looks live.
+
+	Pass stats to keep the partial text when rendering is interrupted (e.g. by the rerun a
+	Stop click triggers); it is filled in even if an exception ends the loop.
+	"""
+	if min_interval is None:
+		min_interval = default_config.STREAM_RENDER_INTERVAL
+	if stats is None:
+		stats = StreamStats()
+	parts = []
+	started = time.perf_counter()
+	last_render = float("-inf")
+	render_seconds = 0.0
+	dirty = False
+	try:
+		for token in tokens:
+			now = time.perf_counter()
+			if stats.first_token_seconds is None:
+				stats.first_token_seconds = now - started
+			parts.append(token)
+			stats.tokens += 1
+			dirty = True
+			if now - last_render >= min_interval:
+				text = "".join(parts)
+				placeholder.write(text)
+				render_seconds += time.perf_counter() - now
+				stats.text = text # What is on the page (heartbeat() re-writes it)
+				stats.renders += 1
+				stats.rendered_chars += len(text)
+				last_render = now
+				dirty = False
+		stats.text = "".join(parts)
+		if dirty:
+			now = time.perf_counter()
+			placeholder.write(stats.text)
+			render_seconds += time.perf_counter() - now
+			stats.renders += 1
+			stats.rendered_chars += len(stats.text)
+	finally:
+		stats.text = "".join(parts)
+		stats.seconds = time.perf_counter() - started
+		tracing.record("render", render_seconds, renders=stats.renders)
+	return stats
+
+
+def heartbeat(placeholder, stats: StreamStats, min_interval: float | None = None):
+	"""
+	Returns a no-argument callback for get_ollama_stream(on_heartbeat=...), called on chunks
+	without text (e.g. gpt-oss reasoning). Streamlit only acts on a Stop click at the script's
+	next st.* call, so the callback re-writes the placeholder (what render_stream last showed in
+	it, or a "thinking" caption before the first token), at most once per min_interval seconds.
+
+	Pass the same stats object to render_stream.
+	"""
+	if min_interval is None:
+		min_interval = default_config.STREAM_RENDER_INTERVAL
+	last_touch = float("-inf")
+
+	def touch() -> None:
+		nonlocal last_touch
+		now = time.perf_counter()
+		if now - last_touch < min_interval:
+			return
+		last_touch = now
+		if stats.text:
+			placeholder.write(stats.text)
+		else:
+			placeholder.caption("💭 Thinking…")
+
+	return touch
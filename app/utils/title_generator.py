@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import SystemMessage, HumanMessage
+import config as default_config
+from utils import ollama_client
+
+logger = logging.getLogger(__name__)
+
+# ---- conversation titles ----
+# Saving a new conversation used to block on a full LLM generation just to name it.
+# Now the save uses heuristic_title() right away and the LLM title is produced here,
+# on a single background worker, with TITLE_MODEL_NAME (a small model) so it does not
+# compete with the chat model. Results are cached per conversation key. Requests go
+# through ollama_client.scheduler at BACKGROUND priority, behind every waiting chat
+# turn, and are dropped when its queue is full.
+
+_lock = threading.Lock()
+_titles = {}  # conversation key -> generated title
+_inflight = set()
+_failed = set()  # keys whose last generation failed (error, full queue, empty title)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="title-generator")
+
+HEURISTIC_MAX_WORDS = 8
+HEURISTIC_MAX_CHARS = 60
+
+
+def _first_human_messages(history) -> str:
+	return " ".join(
+		[m.content for m in history[:3] if isinstance(m, HumanMessage)]
+	)
+
+
+def conversation_key(history) -> str:
+	"""Stable identity of a conversation: a hash of its opening user messages."""
+	return hashlib.sha1(_first_human_messages(history).encode("utf-8")).hexdigest()
+
+
+def heuristic_title(history) -> str:
+	"""Cheap local title: the first few words of the first user message."""
+	text = " ".join(_first_human_messages(history).split())
+	if not text:
+		return "New Conversation"
+	words = text.split(" ")
+	title = " ".join(words[:HEURISTIC_MAX_WORDS])
+	if len(title) > HEURISTIC_MAX_CHARS:
+		# CJK text has no spaces, so also cap by characters.
+		title = title[:HEURISTIC_MAX_CHARS]
+	if title != text:
+		title += "…"
+	return title
+
+
+def request_title(history) -> str:
+	"""Starts background generation of an LLM title (unless cached or running) and returns the conversation key."""
+	key = conversation_key(history)
+	first_messages = _first_human_messages(history)
+	with _lock:
+		if key in _titles or key in _inflight or not first_messages:
+			return key
+		_failed.discard(key) # A later save retries a failed title
+		_inflight.add(key)
+	_executor.submit(_generate_and_store, key, first_messages)
+	return key
+
+
+def get_title(key: str):
+	"""Returns the generated title for key, or None if it is not ready (or generation failed)."""
+	with _lock:
+		return _titles.get(key)
+
+
+def has_failed(key: str) -> bool:
+	"""True if the last generation for key ended without a title; callers stop waiting for it."""
+	with _lock:
+		return key in _failed
+
+
+def _generate_and_store(key: str, first_messages: str) -> None:
+	title = None
+	try:
+		title = generate_title(first_messages)
+	except ollama_client.QueueFull:
+		# The conversation keeps its heuristic title.
+		logger.info("Skipped LLM title: Ollama queue is full")
+	except Exception as e:
+		logger.error(f"Error generating title: {e}")
+	finally:
+		with _lock:
+			if title:
+				_titles[key] = title
+			else:
+				_failed.add(key)
+			_inflight.discard(key)
+
+
+def generate_title(first_messages: str) -> str:
+	"""Asks TITLE_MODEL_NAME for a concise title (blocking; run from the background worker)."""
+	try:
+		from langchain_ollama import ChatOllama
+	except ImportError:
+		from langchain_community.chat_models import ChatOllama
+
+	# Same server as the chat model; keep_alive stays at the server default, so the small model can be unloaded
+	title_model = ChatOllama(model=default_config.TITLE_MODEL_NAME, base_url=default_config.OLLAMA_BASE_URL)
+	title_prompt = (
+		f"Summarize the following conversation snippet into a very concise title "
+		f"(under 8 words, without quotes or conversational phrases): "
+		f"'{first_messages}'"
+	)
+	with ollama_client.scheduler.slot(ollama_client.BACKGROUND):
+		title_response = title_model.invoke(
+			[
+				SystemMessage(content="You are a helpful summarizer."),
+				HumanMessage(content=title_prompt),
+			]
+		)
+	return re.sub(
+		r'[".:]', "", title_response.content.strip()
+	).split("\n")[0].strip()
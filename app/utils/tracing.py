@@ -0,0 +1,222 @@
+# tracing.py
+"""
+輕量的分段計時（tracing）。
+
+A trace covers one unit of work (an upload, a chat turn); spans inside it time
+the stages (decode, token counting, chunking, embedding, FAISS search, prompt
+building, Ollama time-to-first-token, streaming, rendering). The current trace
+lives in a contextvar, so library code (rag.*, ollama_client) just opens spans
+and they attach to whatever trace the UI started; outside a trace, spans only
+feed the aggregate metrics.
+
+Finished traces are kept in memory for the UI timing panel and appended to
+TRACE_JSONL_FILE. Aggregates (per-stage seconds sum / count and counters) are
+written to TRACE_PROMETHEUS_FILE in the Prometheus textfile format, for
+node_exporter's textfile collector.
+
+    with tracing.trace("turn", session=...) as t:
+        with tracing.span("build_prompt"):
+            ...
+        tracing.count("response_cache_hits")
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass, field
+
+import config as default_config
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "localllm"
+
+
+@dataclass
+class Span:
+    name: str
+    start_ms: float  # offset from the start of the trace
+    duration_ms: float
+    attrs: dict = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    name: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    started_at: float = field(default_factory=time.time)
+    duration_ms: float | None = None
+    attrs: dict = field(default_factory=dict)
+    spans: list = field(default_factory=list)
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+
+    def stage_totals(self) -> dict:
+        """{span name: total ms} (a stage can occur more than once, e.g. per file)."""
+        totals: dict = defaultdict(float)
+        for s in self.spans:
+            totals[s.name] += s.duration_ms
+        return dict(totals)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data.pop("_t0")
+        return data
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+_lock = threading.Lock()
+_recent: deque = deque(maxlen=50)
+_stage_sum: dict = defaultdict(float)  # seconds
+_stage_count: dict = defaultdict(int)
+_counters: dict = defaultdict(float)
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+def _observe(name: str, seconds: float) -> None:
+    with _lock:
+        _stage_sum[name] += seconds
+        _stage_count[name] += 1
+
+
+def record(name: str, seconds: float, start: float | None = None, **attrs) -> None:
+    """
+    記錄一段已量好的時間（例如 time-to-first-token）
+
+    :param start: time.perf_counter() at the start of the stage; defaults to now - seconds
+    """
+    if not default_config.TRACE_ENABLED:
+        return
+    _observe(name, seconds)
+    t = _current.get()
+    if t is not None:
+        if start is None:
+            start = time.perf_counter() - seconds
+        t.spans.append(Span(name, (start - t._t0) * 1000, seconds * 1000, attrs))
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    計時一個階段；yield 出的 dict 可在區塊內補上屬性（例如片段數）
+    """
+    started = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        record(name, time.perf_counter() - started, start=started, **attrs)
+
+
+def count(name: str, value: float = 1) -> None:
+    """
+    累加計數器（匯出為 <prefix>_<name>_total）
+    """
+    if not default_config.TRACE_ENABLED:
+        return
+    with _lock:
+        _counters[name] += value
+    t = _current.get()
+    if t is not None:
+        t.attrs[name] = t.attrs.get(name, 0) + value
+
+
+@contextlib.contextmanager
+def trace(name: str, **attrs):
+    """
+    開始一個 trace（巢狀呼叫時沿用外層 trace，只加一個 span）
+    """
+    if _current.get() is not None:
+        with span(name, **attrs):
+            yield _current.get()
+        return
+    t = Trace(name=name, attrs=attrs)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        t.duration_ms = (time.perf_counter() - t._t0) * 1000
+        if default_config.TRACE_ENABLED:
+            _observe(name, t.duration_ms / 1000)
+            _finish(t)
+
+
+def recent(name: str | None = None, limit: int = 10) -> list:
+    """
+    最近完成的 trace（新的在前）
+    """
+    with _lock:
+        traces = [t for t in reversed(_recent) if name is None or t.name == name]
+    return traces[:limit]
+
+
+def snapshot() -> dict:
+    """
+    目前的彙總指標：{"stages": {name: {"sum": 秒, "count": n}}, "counters": {...}}
+    """
+    with _lock:
+        return {
+            "stages": {n: {"sum": _stage_sum[n], "count": _stage_count[n]} for n in _stage_sum},
+            "counters": dict(_counters),
+        }
+
+
+# ---- export ----
+
+def _finish(t: Trace) -> None:
+    with _lock:
+        _recent.append(t)
+    try:
+        if default_config.TRACE_JSONL_FILE:
+            line = json.dumps(t.to_dict(), ensure_ascii=False)
+            with _lock, open(default_config.TRACE_JSONL_FILE, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        if default_config.TRACE_PROMETHEUS_FILE:
+            write_prometheus(default_config.TRACE_PROMETHEUS_FILE)
+    except OSError as e:
+        logger.warning(f"Could not export trace: {e}")
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text() -> str:
+    data = snapshot()
+    lines = [
+        f"# HELP {METRIC_PREFIX}_stage_seconds Time spent per traced stage.",
+        f"# TYPE {METRIC_PREFIX}_stage_seconds summary",
+    ]
+    for name, stage in sorted(data["stages"].items()):
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{name}"}} {stage["sum"]:.6f}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+    for name, value in sorted(data["counters"].items()):
+        metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str) -> None:
+    """
+    原子地寫出 Prometheus textfile（collector 不會讀到寫一半的檔案）
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
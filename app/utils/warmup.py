@@ -0,0 +1,84 @@
+# warmup.py
+"""
+啟動暖機：在背景執行緒預先載入嵌入模型與 Ollama 模型。
+
+The first upload used to pay the SentenceTransformer load and the first chat the
+Ollama model load. start() kicks off both in daemon threads once per process; the
+Ollama model is loaded with keep_alive=OLLAMA_KEEP_ALIVE so it stays resident.
+status() reports progress for the UI.
+"""
+import logging
+import threading
+import time
+
+import config as default_config
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+_lock = threading.Lock()
+_started = False
+_status = {
+    "embedding": {"state": PENDING, "seconds": None, "error": None},
+    "llm": {"state": PENDING, "seconds": None, "error": None},
+}
+
+
+def _set(component: str, state: str, seconds: float | None = None, error: str | None = None) -> None:
+    with _lock:
+        _status[component] = {"state": state, "seconds": seconds, "error": error}
+
+
+def _run(component: str, loader) -> None:
+    _set(component, LOADING)
+    started = time.perf_counter()
+    try:
+        loader()
+    except Exception as e:
+        logger.warning(f"Warm-up of {component} failed: {e}")
+        _set(component, FAILED, error=str(e))
+        return
+    seconds = time.perf_counter() - started
+    logger.info(f"Warm-up of {component} finished in {seconds:.1f}s")
+    _set(component, READY, seconds=seconds)
+
+
+def _load_embedding_model() -> None:
+    from rag.embedding_model import embedding_model
+    embedding_model.load()
+    # 第一次 encode 會初始化 tokenizer / kernels，順便做掉
+    embedding_model.embed_text("warm-up")
+
+
+def _load_llm() -> None:
+    import ollama
+    # An empty prompt makes Ollama load the model without generating anything.
+    client = ollama.Client(host=default_config.OLLAMA_BASE_URL)
+    client.generate(
+        model=default_config.MODEL_NAME,
+        prompt="",
+        keep_alive=default_config.OLLAMA_KEEP_ALIVE,
+    )
+
+
+def start() -> None:
+    """Starts the background warm-up threads (idempotent; only the first call per process does anything)."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    for component, loader in (("embedding", _load_embedding_model), ("llm", _load_llm)):
+        threading.Thread(
+            target=_run, args=(component, loader), name=f"warmup-{component}", daemon=True
+        ).start()
+
+
+def status() -> dict:
+    """Returns {'embedding': {...}, 'llm': {...}} with state/seconds/error for each component."""
+    with _lock:
+        return {component: dict(info) for component, info in _status.items()}
@@ -0,0 +1,105 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import config as default_config
+from utils import state_cache
+
+logger = logging.getLogger(__name__)
+
+# ---- atomic file writes ----
+
+def atomic_write_json(file_path: str, payload) -> None:
+	"""Writes payload as JSON via temp file + fsync + rename, so readers never see a truncated file."""
+	directory = os.path.dirname(os.path.abspath(file_path))
+	fd, tmp_path = tempfile.mkstemp(
+		dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp"
+	)
+	try:
+		with os.fdopen(fd, "w", encoding="utf-8") as f:
+			json.dump(payload, f, indent=4)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp_path, file_path)
+	except BaseException:
+		try:
+			os.remove(tmp_path)
+		except OSError:
+			pass
+		raise
+	# The cached value was recorded when the write was scheduled; just note the new mtime.
+	state_cache.touch(file_path)
+
+# ---- write-behind queue ----
+
+class WriteBehindWriter:
+	"""
+	Coalesces writes by key and runs them on a background thread after a debounce interval.
+
+	Scheduling the same key again before it is flushed replaces the pending job and
+	restarts its timer, so a burst of slider moves results in a single file write.
+	"""
+
+	def __init__(self, debounce_seconds: float):
+		self.debounce_seconds = debounce_seconds
+		self._pending = {}  # key -> (due time, job)
+		self._running = False  # the worker is executing a job (flush waits for it)
+		self._cond = threading.Condition()
+		self._thread = None
+
+	def schedule(self, key: str, job) -> None:
+		"""Queues job (a no-argument callable) to run after the debounce interval, replacing any pending job for key."""
+		with self._cond:
+			self._pending[key] = (time.monotonic() + self.debounce_seconds, job)
+			if self._thread is None or not self._thread.is_alive():
+				self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+				self._thread.start()
+			self._cond.notify()
+
+	def flush(self) -> None:
+		"""Runs every pending job now, in the calling thread, after the worker's in-progress job (if any) finishes."""
+		with self._cond:
+			# Otherwise an older snapshot being written by the worker could replace the newer one written here.
+			while self._running:
+				self._cond.wait()
+			jobs = [job for _, job in self._pending.values()]
+			self._pending.clear()
+		for job in jobs:
+			self._run_job(job)
+
+	def _run(self) -> None:
+		while True:
+			with self._cond:
+				while True:
+					if not self._pending:
+						self._cond.wait()
+						continue
+					key, (due, job) = min(self._pending.items(), key=lambda item: item[1][0])
+					delay = due - time.monotonic()
+					if delay <= 0:
+						del self._pending[key]
+						self._running = True
+						break
+					self._cond.wait(delay)
+			try:
+				self._run_job(job)
+			finally:
+				with self._cond:
+					self._running = False
+					self._cond.notify_all()
+
+	@staticmethod
+	def _run_job(job) -> None:
+		try:
+			job()
+		except Exception as e:
+			logger.error(f"Write-behind job failed: {e}")
+
+
+# 單例實例（供其他模組直接 import）
+writer = WriteBehindWriter(default_config.WRITE_BEHIND_DEBOUNCE_SECONDS)
+# Don't lose the last debounce window when the server shuts down.
+atexit.register(writer.flush)
@@ -0,0 +1,109 @@
+"""
+Throughput and parity of the EmbeddingModel CPU backends.
+
+Embeds the same corpus with each backend ("torch" is the reference) and
+reports chunks/s plus the cosine similarity of every backend's vectors to the
+reference. Exits non-zero if any backend falls below --min-cosine, so it can
+gate a change of EMBEDDING_BACKEND.
+
+The corpus is a text file split into chunks of --chunk-chars characters, or a
+synthetic one when no file is given.
+
+Usage (from the repository root):
+    python benchmarks/bench_embedding_backends.py
+    python benchmarks/bench_embedding_backends.py --corpus docs.txt --threads 4 --backends torch,onnx
+    python benchmarks/bench_embedding_backends.py --output embedding_backends.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import config  # noqa: E402
+from rag.embedding_model import BACKENDS, EmbeddingModel, cosine_parity  # noqa: E402
+
+_WORDS = (
+    "model index vector query answer document upload chunk cache latency memory "
+    "server thread search token context prompt session history file result score"
+).split()
+
+
+def load_corpus(path: str | None, n: int, chunk_chars: int, seed: int) -> list[str]:
+    if path:
+        text = Path(path).read_text(encoding="utf-8", errors="ignore")
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        return [c for c in chunks if c.strip()][:n]
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(n):
+        words = []
+        while sum(len(w) + 1 for w in words) < rng.randint(chunk_chars // 4, chunk_chars):
+            words.append(rng.choice(_WORDS))
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--corpus", help="text file to chunk (default: synthetic)")
+    parser.add_argument("--n", type=int, default=512, help="number of chunks")
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=config.EMBEDDING_NUM_THREADS)
+    parser.add_argument("--max-seq-length", type=int, default=config.EMBEDDING_MAX_SEQ_LENGTH)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="parity tolerance vs the torch backend")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write results as JSON")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.n, args.chunk_chars, args.seed)
+    models = {
+        backend: EmbeddingModel(args.model, backend, args.threads, args.max_seq_length)
+        for backend in ["torch"] + [b for b in args.backends.split(",") if b and b != "torch"]
+    }
+
+    results = {}
+    for backend, model in models.items():
+        started = time.perf_counter()
+        model.load()
+        load_seconds = time.perf_counter() - started
+        model.embed_chunks(texts[: args.batch_size], batch_size=args.batch_size)  # warm-up
+        started = time.perf_counter()
+        model.embed_chunks(texts, batch_size=args.batch_size)
+        seconds = time.perf_counter() - started
+        results[backend] = {"load_seconds": load_seconds, "chunks_per_second": len(texts) / seconds}
+
+    failed = []
+    for backend, model in models.items():
+        cosines = cosine_parity(model, models["torch"], texts)
+        results[backend].update(min_cosine=float(cosines.min()), mean_cosine=float(cosines.mean()))
+        if cosines.min() < args.min_cosine:
+            failed.append(backend)
+
+    print(f"model={args.model} chunks={len(texts)} batch={args.batch_size} threads={args.threads}")
+    print(f"{'backend':<11} {'load s':>7} {'chunks/s':>9} {'speedup':>8} {'min cos':>8} {'mean cos':>9}")
+    for backend, r in results.items():
+        print(
+            f"{backend:<11} {r['load_seconds']:>7.2f} {r['chunks_per_second']:>9.1f} "
+            f"{r['chunks_per_second'] / results['torch']['chunks_per_second']:>7.2f}x "
+            f"{r['min_cosine']:>8.4f} {r['mean_cosine']:>9.4f}"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"params": vars(args), "results": results}, indent=2))
+    if failed:
+        print(f"FAIL: below min cosine {args.min_cosine}: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
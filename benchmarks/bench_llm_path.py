@@ -0,0 +1,203 @@
+"""
+Client-side benchmark of the LLM path: prompt building, ollama_client streaming and
+the chat-area render loop, against benchmarks/stub_ollama.py instead of a real model.
+
+Because the stub's speed is known, everything measured beyond it is client cost:
+
+  prompt_build    build_prompt() time for a long history and a large RAG context
+  overhead        unthrottled stub: request setup ms and µs per token for
+                  get_ollama_stream (langchain_ollama) and get_ollama_response (openai)
+  paced           stub at --tokens-per-second with --first-token-ms: time-to-first-token
+                  minus the stub's latency, and tokens/s delivered to the UI
+                  (through utils.stream_render with a recording placeholder)
+  concurrency     the paced run from N threads at once (one per simulated session)
+
+Results are JSON (see --output), comparable with benchmarks/compare_results.py.
+
+Usage (from the repository root):
+    python benchmarks/bench_llm_path.py
+    python benchmarks/bench_llm_path.py --sessions 1,4,16 --tokens-per-second 100 --output llm.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import config  # noqa: E402
+from stub_ollama import StubOllama  # noqa: E402
+
+
+class RecordingPlaceholder:
+    """Stands in for st.empty(): counts renders and the characters each one re-sends."""
+
+    def __init__(self) -> None:
+        self.writes = 0
+        self.chars = 0
+
+    def write(self, text: str) -> None:
+        self.writes += 1
+        self.chars += len(text)
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p99": None}
+    return {"p50": float(np.percentile(values, 50)), "p99": float(np.percentile(values, 99))}
+
+
+def bench_prompt_build(history: int, context_chars: int, repeats: int) -> dict:
+    from langchain_core.messages import AIMessage, HumanMessage
+    from utils import prompt_builder
+
+    chat_history = [
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=f"message {i} " * 40) for i in range(history)
+    ]
+    context = "context " * (context_chars // 8)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        prompt_builder.build_prompt(
+            "You are a helpful AI assistant.", "en", False, "low", chat_history,
+            rag_context=context, history_length=config.DEFAULT_HISTORY_LENGTH,
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"history": history, "context_chars": context_chars, "ms": _percentiles(timings)}
+
+
+def _prompt(history: int = 4):
+    from langchain_core.messages import HumanMessage
+    from utils import prompt_builder
+
+    return prompt_builder.build_prompt(
+        "You are a helpful AI assistant.", "en", False, "low",
+        [HumanMessage(content="Tell me a story.")] * history, history_length=history,
+    )
+
+
+def one_turn(path: str, render_interval: float | None) -> dict:
+    """One question through the chosen client path and the render loop; returns timings in ms."""
+    from utils import ollama_client, stream_render
+
+    started = time.perf_counter()
+    if path == "stream":
+        tokens = ollama_client.get_ollama_stream(config.MODEL_NAME, _prompt())
+    else:
+        tokens = ollama_client.get_ollama_response(config.MODEL_NAME, "Tell me a story.")
+    placeholder = RecordingPlaceholder()
+    stats = stream_render.render_stream(placeholder, tokens, min_interval=render_interval)
+    total = time.perf_counter() - started
+    return {
+        "ttft_ms": (stats.first_token_seconds or total) * 1000,
+        "total_ms": total * 1000,
+        "tokens": stats.tokens,
+        "renders": stats.renders,
+        "rendered_chars": stats.rendered_chars,
+    }
+
+
+def bench_overhead(stub: StubOllama, path: str, requests: int, tokens: int) -> dict:
+    stub.configure(tokens=tokens, tokens_per_second=0.0, first_token_ms=0.0)
+    one_turn(path, 0.0)  # connection / import warm-up
+    setup, per_token = [], []
+    for _ in range(requests):
+        turn = one_turn(path, 0.0)
+        setup.append(turn["ttft_ms"])
+        per_token.append((turn["total_ms"] - turn["ttft_ms"]) * 1000 / max(1, turn["tokens"] - 1))
+    return {"path": path, "setup_ms": _percentiles(setup), "us_per_token": _percentiles(per_token)}
+
+
+def bench_paced(stub: StubOllama, sessions: int, turns: int, args, render_interval: float | None) -> dict:
+    stub.configure(tokens=args.tokens, tokens_per_second=args.tokens_per_second, first_token_ms=args.first_token_ms)
+    results: list[dict] = []
+    lock = threading.Lock()
+
+    def session() -> None:
+        for _ in range(turns):
+            turn = one_turn("stream", render_interval)
+            with lock:
+                results.append(turn)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    ttft = [r["ttft_ms"] for r in results]
+    delivered = [
+        (r["tokens"] - 1) / ((r["total_ms"] - r["ttft_ms"]) / 1000)
+        for r in results if r["tokens"] > 1 and r["total_ms"] > r["ttft_ms"]
+    ]
+    return {
+        "sessions": sessions,
+        "render_interval": render_interval,
+        "ttft_ms": _percentiles(ttft),
+        "ttft_overhead_ms": _percentiles([t - args.first_token_ms for t in ttft]),
+        "tokens_per_second_per_session": statistics.fmean(delivered) if delivered else None,
+        "aggregate_tokens_per_second": sum(r["tokens"] for r in results) / wall,
+        "renders_per_turn": statistics.fmean(r["renders"] for r in results),
+        "rendered_chars_per_turn": statistics.fmean(r["rendered_chars"] for r in results),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=300, help="tokens per answer")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="stub rate for the paced runs")
+    parser.add_argument("--first-token-ms", type=float, default=100.0, help="stub latency for the paced runs")
+    parser.add_argument("--requests", type=int, default=20, help="requests per overhead run")
+    parser.add_argument("--sessions", default="1,4,16", help="concurrent sessions, comma-separated")
+    parser.add_argument("--turns", type=int, default=3, help="turns per session in the paced runs")
+    parser.add_argument("--render-intervals", default=f"0,{config.STREAM_RENDER_INTERVAL}",
+                        help="stream_render intervals to compare (0 = every token)")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    stub = StubOllama().start()
+    config.OLLAMA_BASE_URL = stub.base_url  # ollama_client reads it per call
+    results: dict = {}
+    try:
+        results["prompt_build"] = bench_prompt_build(history=200, context_chars=200_000, repeats=50)
+        print(f"prompt_build   p50={results['prompt_build']['ms']['p50']:.3f} ms")
+
+        for path in ("stream", "completions"):
+            r = results[f"overhead_{path}"] = bench_overhead(stub, path, args.requests, args.tokens)
+            print(f"overhead {path:<12} setup p50={r['setup_ms']['p50']:.1f} ms  "
+                  f"per token p50={r['us_per_token']['p50']:.0f} µs")
+
+        intervals = [float(i) for i in args.render_intervals.split(",")]
+        for interval in intervals:
+            for sessions in (int(s) for s in args.sessions.split(",")):
+                r = bench_paced(stub, sessions, args.turns, args, interval)
+                results[f"paced_s{sessions}_r{interval:g}"] = r
+                print(f"paced sessions={sessions:<3} render={interval:<5g} "
+                      f"ttft p50={r['ttft_ms']['p50']:.0f} ms (+{r['ttft_overhead_ms']['p50']:.1f}) "
+                      f"p99={r['ttft_ms']['p99']:.0f} ms  "
+                      f"{r['tokens_per_second_per_session'] or 0:.0f} tok/s/session  "
+                      f"{r['aggregate_tokens_per_second']:.0f} tok/s total  "
+                      f"renders/turn={r['renders_per_turn']:.0f} chars/turn={r['rendered_chars_per_turn']:.0f}")
+        results["stub"] = stub.stats()
+    finally:
+        stub.stop()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"params": vars(args), "results": results}, indent=2))
+        print(f"wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
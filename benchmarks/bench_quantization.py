@@ -0,0 +1,122 @@
+"""
+Memory / latency / recall benchmark for VectorStoreManager index encodings.
+
+Builds one store per encoding (flat, sq8, pq with and without re-ranking) over
+the same synthetic, clustered, unit-length vectors and reports, against the
+flat (exact) baseline:
+
+  * bytes per chunk held in RAM by the index (codes + pending vectors),
+  * single-query search latency p50 / p99,
+  * recall@k of the top-k ids.
+
+Usage (from the repository root):
+    python benchmarks/bench_quantization.py --n 100000 --dim 384 --k 10
+    python benchmarks/bench_quantization.py --dim 768 --output quantization.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from rag.vector_store_manager import VectorStoreManager  # noqa: E402
+
+CONFIGS = {
+    "flat": {"index_type": "flat"},
+    "sq8": {"index_type": "sq8", "rerank": False},
+    "sq8+rerank": {"index_type": "sq8", "rerank": True},
+    "pq": {"index_type": "pq", "rerank": False},
+    "pq+rerank": {"index_type": "pq", "rerank": True},
+}
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors around random centroids, roughly like sentence embeddings of a topical corpus."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignment = rng.integers(0, clusters, n)
+    vectors = centroids[assignment] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def run(name: str, options: dict, vectors: np.ndarray, queries: np.ndarray, k: int, workdir: Path):
+    manager = VectorStoreManager(
+        index_path=workdir / name / "faiss.index",
+        metadata_path=workdir / name / "metadata.json",
+        **options,
+    )
+    manager.init_vector_store(dim=vectors.shape[1])
+    started = time.perf_counter()
+    ids = list(range(len(vectors)))
+    manager.add_documents(ids, vectors, [""] * len(ids), [""] * len(ids))
+    manager.save_index()  # trains if still pending
+    build_seconds = time.perf_counter() - started
+
+    index_bytes = manager.memory_bytes() - manager._metadata_bytes
+    latencies = []
+    results = []
+    for query in queries:
+        t = time.perf_counter()
+        hits = manager.search(query, k=k)
+        latencies.append(time.perf_counter() - t)
+        results.append([doc_id for doc_id, _, _ in hits])
+    manager.clear_index()
+    return {
+        "bytes_per_chunk": index_bytes / len(vectors),
+        "build_seconds": build_seconds,
+        "search_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "search_p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "ids": results,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50_000, help="number of chunks")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="comma-separated subset of " + ", ".join(CONFIGS))
+    parser.add_argument("--output", help="also write results as JSON")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.n, args.dim, args.clusters, args.seed)
+    queries = synthetic_vectors(args.queries, args.dim, args.clusters, args.seed)  # same centroids
+    names = ["flat"] + [c for c in args.configs.split(",") if c and c != "flat"]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            results[name] = run(name, CONFIGS[name], vectors, queries, args.k, Path(tmp))
+
+    baseline = results["flat"]["ids"]
+    print(f"n={args.n} dim={args.dim} k={args.k} queries={args.queries}")
+    print(f"{'encoding':<12} {'B/chunk':>9} {'vs flat':>8} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {'recall@k':>9}")
+    for name, r in results.items():
+        recall = np.mean([
+            len(set(got) & set(expected)) / max(1, len(expected))
+            for got, expected in zip(r.pop("ids"), baseline)
+        ])
+        r["recall_at_k"] = float(recall)
+        print(
+            f"{name:<12} {r['bytes_per_chunk']:>9.1f} {results['flat']['bytes_per_chunk'] / r['bytes_per_chunk']:>7.1f}x "
+            f"{r['build_seconds']:>8.2f} {r['search_p50_ms']:>8.3f} {r['search_p99_ms']:>8.3f} {recall:>9.3f}"
+        )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"params": vars(args), "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+Headless benchmark of the RAG upload and query path (rag.ingest + VectorStoreManager).
+
+For each corpus size, a synthetic text corpus and a synthetic CSV corpus are
+generated and run through the same decode -> chunk -> embed -> index code the
+sidebar uses. Known "needle" facts are planted in random chunks; querying for
+them gives recall@k. Every (kind, size) runs in a fresh process, so peak RSS is
+per run.
+
+Reported per run: MB/s and chunks/s per stage, search p50/p99 (ms),
+recall@k, peak RSS (MB), peak Python heap (MB, tracemalloc) and the size of
+the saved chunk metadata (MB; chunk text lives in the document store, so this
+is mostly offsets). The prompt
+context built from k chunks is measured twice, as the top-k chunks pasted
+verbatim and after rag.context_selection (MMR over 3k candidates, parent
+section expansion, merging, dedup): average characters per query and how often
+it contains the needle. Results are
+JSON, keyed by "<kind>-<size>", so two runs can be diffed with
+benchmarks/compare_results.py.
+
+The default embedder is a deterministic hashing model (no download, no torch).
+--embedder model uses EMBEDDING_MODEL_NAME / EMBEDDING_BACKEND from config.py.
+
+Usage (from the repository root):
+    python benchmarks/bench_rag.py --output before.json
+    python benchmarks/bench_rag.py --sizes 1,10 --kinds text --output after.json
+    python benchmarks/compare_results.py before.json after.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+_VOCABULARY = [
+    "alpha", "budget", "cluster", "deploy", "engine", "filter", "gateway", "harbor", "invoice",
+    "journal", "kernel", "ledger", "metric", "network", "orbit", "packet", "quota", "replica",
+    "schema", "ticket", "update", "vendor", "window", "yield", "zone", "the", "of", "and", "to",
+    "in", "is", "for", "with", "on", "by", "report", "system", "policy", "review", "service",
+]
+
+
+# ----------------------------------------------------------------------
+# Synthetic corpora
+# ----------------------------------------------------------------------
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_VOCABULARY) for _ in range(rng.randint(6, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+_NEEDLE_WORDS = [
+    "amber", "basalt", "cedar", "delta", "ember", "fjord", "granite", "hazel", "indigo", "jasper",
+    "kelp", "lumen", "marble", "nectar", "onyx", "pollen", "quartz", "russet", "sable", "tundra",
+]
+
+
+def _needle(i: int, rng: random.Random) -> tuple[str, str]:
+    """A fact with a unique code and two topic words, and a query that shares them (no filler words)."""
+    code = f"ref{i:05d}"
+    first, second = rng.sample(_NEEDLE_WORDS, 2)
+    return (
+        f"Project {code} stores its {first} {second} keys in vault nebula{i}.",
+        f"{code} {first} {second} keys",
+    )
+
+
+def make_text_corpus(size_mb: float, files: int, needles: int, seed: int) -> tuple[list[tuple[str, bytes]], list[str], list[str]]:
+    rng = random.Random(seed)
+    per_file = int(size_mb * 1024 * 1024 / files)
+    documents = []
+    for f in range(files):
+        paragraphs, length = [], 0
+        while length < per_file:
+            paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        documents.append(paragraphs)
+
+    facts, queries = [], []
+    for i in range(needles):
+        fact, query = _needle(i, rng)
+        # Inside a paragraph, so the needle shares its chunk with filler like real content
+        paragraphs = rng.choice(documents)
+        at = rng.randrange(len(paragraphs))
+        paragraphs[at] = f"{paragraphs[at]} {fact}"
+        facts.append(fact)
+        queries.append(query)
+    files_out = [(f"doc_{f:03d}.txt", "\n\n".join(p).encode("utf-8")) for f, p in enumerate(documents)]
+    return files_out, facts, queries
+
+
+def make_csv_corpus(size_mb: float, files: int, needles: int, seed: int) -> tuple[list[tuple[str, bytes]], list[str], list[str]]:
+    rng = random.Random(seed)
+    per_file = int(size_mb * 1024 * 1024 / files)
+    header = "id,category,owner,status,notes"
+    tables = []
+    for f in range(files):
+        rows, length = [], 0
+        while length < per_file:
+            row = ",".join([
+                str(len(rows) + 1),
+                rng.choice(_VOCABULARY),
+                rng.choice(_VOCABULARY),
+                rng.choice(["open", "closed", "pending"]),
+                '"' + _sentence(rng) + '"',
+            ])
+            rows.append(row)
+            length += len(row) + 1
+        tables.append(rows)
+
+    facts, queries = [], []
+    for i in range(needles):
+        fact, query = _needle(i, rng)
+        rows = rng.choice(tables)
+        rows.insert(rng.randrange(len(rows)), f'n{i},secret,admin,open,"{fact}"')
+        facts.append(fact)
+        queries.append(query)
+    files_out = [(f"table_{f:03d}.csv", "\n".join([header] + rows).encode("utf-8")) for f, rows in enumerate(tables)]
+    return files_out, facts, queries
+
+
+CORPORA = {"text": make_text_corpus, "csv": make_csv_corpus}
+
+
+# ----------------------------------------------------------------------
+# One run (executed in a child process)
+# ----------------------------------------------------------------------
+def _make_embedder(kind: str, dim: int):
+    from rag.embedding_model import EmbeddingModel, HashEmbeddingModel
+    import config
+
+    if kind == "hash":
+        return HashEmbeddingModel(dim)
+    return EmbeddingModel(
+        config.EMBEDDING_MODEL_NAME, config.EMBEDDING_BACKEND,
+        config.EMBEDDING_NUM_THREADS, config.EMBEDDING_MAX_SEQ_LENGTH,
+    )
+
+
+def run_one(params: dict) -> dict:
+    from rag import context_selection, ingest
+    from rag.vector_store_manager import VectorStoreManager
+
+    files, facts, queries = CORPORA[params["kind"]](params["size_mb"], params["files"], params["needles"], params["seed"])
+    total_bytes = sum(len(raw) for _, raw in files)
+    embedder = _make_embedder(params["embedder"], params["dim"])
+    embedder.load()
+
+    tracemalloc.start()
+    timings = {}
+
+    started = time.perf_counter()
+    decoded = [(name, ingest.decode_bytes(raw)[0]) for name, raw in files]
+    timings["decode"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chunks = ingest.build_chunks(decoded)
+    timings["chunk"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectors = ingest.embed_chunks(embedder, chunks, batch_size=params["batch_size"])
+    timings["embed"] = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStoreManager(Path(tmp) / "faiss.index", Path(tmp) / "metadata.json", **params["index_options"])
+        store.init_vector_store(dim=embedder.dimension)
+        started = time.perf_counter()
+        ingest.store_sources(store, chunks, decoded)
+        ingest.index_chunks(store, chunks, vectors)
+        timings["index"] = time.perf_counter() - started
+        metadata_bytes = store.metadata_path.stat().st_size
+
+        # Ground truth: every chunk holding the needle's unique code (a split needle counts in both halves)
+        codes = [fact.split()[1] for fact in facts]
+        relevant = [{i for i, c in enumerate(chunks) if code in c.text} for code in codes]
+        query_vectors = embedder.embed_chunks(queries) if queries else np.zeros((0, embedder.dimension))
+        latencies, hits = [], 0
+        context_chars = {"naive": 0, "selected": 0}
+        context_hits = {"naive": 0, "selected": 0}
+        for query_vector, expected, code in zip(query_vectors, relevant, codes):
+            t = time.perf_counter()
+            results = store.search(query_vector, k=params["k"])
+            latencies.append(time.perf_counter() - t)
+            hits += bool(expected & {doc_id for doc_id, _, _ in results})
+
+            entries = store.get_entries([doc_id for doc_id, _, _ in results])
+            naive = "".join(entries[doc_id]["text"] for doc_id, _, _ in results)
+            candidates = store.search(query_vector, k=params["k"] * 3)
+            spans = context_selection.select_context(
+                store, query_vector, candidates, max_chunks=params["k"], mmr_lambda=params["mmr_lambda"],
+                expand_min_hits=params["parent_min_hits"] or None,
+            )
+            selected = "".join(span.text for span in spans)
+            for name, text in (("naive", naive), ("selected", selected)):
+                context_chars[name] += len(text)
+                context_hits[name] += code in text
+        store.clear_index()
+
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == "Darwin":
+        max_rss_kb /= 1024  # bytes on macOS
+
+    mb = total_bytes / (1024 * 1024)
+    return {
+        "corpus_mb": mb,
+        "chunks": len(chunks),
+        "stage_seconds": timings,
+        "mb_per_second": {stage: mb / seconds if seconds else None for stage, seconds in timings.items()},
+        "chunks_per_second": {
+            stage: len(chunks) / timings[stage] if timings[stage] else None for stage in ("chunk", "embed", "index")
+        },
+        "total_seconds": sum(timings.values()),
+        "search_p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else None,
+        "search_p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else None,
+        f"recall_at_{params['k']}": hits / len(facts) if facts else None,
+        "context_chars": {name: chars / len(facts) if facts else None for name, chars in context_chars.items()},
+        "context_recall": {name: found / len(facts) if facts else None for name, found in context_hits.items()},
+        "peak_rss_mb": max_rss_kb / 1024,
+        "peak_heap_mb": heap_peak / (1024 * 1024),
+        "metadata_mb": metadata_bytes / (1024 * 1024),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="0.1,1,5", help="corpus sizes in MB, comma-separated")
+    parser.add_argument("--kinds", default="text,csv")
+    parser.add_argument("--files", type=int, default=4, help="files per corpus")
+    parser.add_argument("--needles", type=int, default=50, help="planted facts (= queries) per corpus")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--mmr-lambda", type=float, default=0.7, help="rag.context_selection MMR lambda")
+    parser.add_argument("--parent-min-hits", type=int, default=2,
+                        help="expand a parent section when this many of its chunks are selected (0 = never)")
+    parser.add_argument("--embedder", choices=("hash", "model"), default="hash")
+    parser.add_argument("--dim", type=int, default=384, help="dimension of the hash embedder")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--index-options", default="{}", help='JSON, e.g. \'{"index_type": "sq8"}\'')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for kind in args.kinds.split(","):
+        for size in args.sizes.split(","):
+            params = {
+                "kind": kind, "size_mb": float(size), "files": args.files, "needles": args.needles,
+                "k": args.k, "embedder": args.embedder, "dim": args.dim, "batch_size": args.batch_size,
+                "index_options": json.loads(args.index_options), "seed": args.seed,
+                "mmr_lambda": args.mmr_lambda, "parent_min_hits": args.parent_min_hits,
+            }
+            with context.Pool(1) as pool:
+                result = pool.apply(run_one, (params,))
+            key = f"{kind}-{size}mb"
+            results[key] = result
+            print(
+                f"{key:<12} chunks={result['chunks']:<7} total={result['total_seconds']:.2f}s "
+                f"embed={result['chunks_per_second']['embed'] or 0:.0f} chunks/s "
+                f"p50={result['search_p50_ms'] or 0:.2f}ms p99={result['search_p99_ms'] or 0:.2f}ms "
+                f"recall@{args.k}={result[f'recall_at_{args.k}']:.2f} rss={result['peak_rss_mb']:.0f}MB "
+                f"metadata={result['metadata_mb']:.1f}MB "
+                f"context={result['context_chars']['naive']:.0f}->{result['context_chars']['selected']:.0f} chars "
+                f"(recall {result['context_recall']['naive']:.2f}->{result['context_recall']['selected']:.2f})"
+            )
+
+    if args.output:
+        report = {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "params": vars(args),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Compare two benchmark JSON files (e.g. bench_rag.py output from two commits).
+
+Every numeric metric present in both files is printed with its relative
+change. Metrics where lower is better (seconds, latency, memory) and higher
+is better (throughput, recall) are told apart by name; --fail-above turns
+regressions beyond that percentage into a non-zero exit code.
+
+Usage (from the repository root):
+    python benchmarks/compare_results.py before.json after.json
+    python benchmarks/compare_results.py before.json after.json --fail-above 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+_HIGHER_IS_BETTER = ("per_second", "recall", "speedup")
+
+
+def flatten(value, prefix: str = "") -> dict[str, float]:
+    if isinstance(value, dict):
+        out = {}
+        for key, child in value.items():
+            out.update(flatten(child, f"{prefix}.{key}" if prefix else str(key)))
+        return out
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-above", type=float, help="fail if any metric regresses by more than this many percent")
+    args = parser.parse_args()
+
+    before = json.loads(Path(args.before).read_text())
+    after = json.loads(Path(args.after).read_text())
+    old, new = flatten(before.get("results", before)), flatten(after.get("results", after))
+    print(f"before: {before.get('commit') or args.before}   after: {after.get('commit') or args.after}")
+
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        a, b = old[name], new[name]
+        if a == 0:
+            continue
+        change = (b - a) / abs(a) * 100
+        higher_is_better = any(marker in name for marker in _HIGHER_IS_BETTER)
+        regression = -change if higher_is_better else change
+        flag = ""
+        if args.fail_above is not None and regression > args.fail_above:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(f"{name:<48} {a:>12.4g} {b:>12.4g} {change:>+8.1f}%{flag}")
+
+    if regressions:
+        print(f"FAIL: {len(regressions)} metric(s) regressed by more than {args.fail_above}%", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
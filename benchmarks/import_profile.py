@@ -0,0 +1,118 @@
+"""
+Import-time profile of the app's startup path.
+
+Runs ``python -X importtime`` on the modules app.py imports at start, aggregates
+the self time per top-level package, and prints (or writes) a Markdown report.
+Heavy optional dependencies must not show up here; --forbid turns that into a
+failing check so regressions are caught.
+
+Usage (from the repository root):
+    python benchmarks/import_profile.py
+    python benchmarks/import_profile.py --output benchmarks/import_profile.md
+    python benchmarks/import_profile.py --budget-ms 1500 --forbid torch,faiss,sentence_transformers
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+# What app.py imports at start (app.py itself can't be imported outside `streamlit run`).
+STARTUP_MODULES = ["config", "utils.persistence", "utils.state_cache", "utils.warmup", "ui.sidebar", "ui.chat_area"]
+
+# Dependencies that should only load when their feature is first used.
+DEFAULT_FORBIDDEN = [
+    "torch", "sentence_transformers", "transformers", "faiss",
+    "tiktoken", "langchain_text_splitters", "langchain_ollama", "openai", "pyperclip",
+]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(modules: list[str]) -> list[tuple[str, int, int, int]]:
+    """Returns [(module, self_us, cumulative_us, depth), ...] from -X importtime."""
+    code = "import " + ", ".join(modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"importing {modules} failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def report(rows, top: int) -> tuple[str, int, dict]:
+    per_package: dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        per_package[name.split(".")[0]] += self_us
+    total_us = sum(per_package.values())
+
+    lines = [
+        "# Import-time profile",
+        "",
+        f"Startup modules: `{', '.join(STARTUP_MODULES)}`  ",
+        f"Python {sys.version.split()[0]}, total import time **{total_us / 1000:.1f} ms**",
+        "",
+        f"## Top {top} top-level packages (self time, all submodules)",
+        "",
+        "| package | ms | share |",
+        "|---|---:|---:|",
+    ]
+    for package, us in sorted(per_package.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"| `{package}` | {us / 1000:.1f} | {us / total_us:.0%} |")
+    lines += [
+        "",
+        f"## Top {top} modules (cumulative time)",
+        "",
+        "| module | self ms | cumulative ms |",
+        "|---|---:|---:|",
+    ]
+    for name, self_us, cumulative_us, _ in sorted(rows, key=lambda r: -r[2])[:top]:
+        lines.append(f"| `{name}` | {self_us / 1000:.1f} | {cumulative_us / 1000:.1f} |")
+    return "\n".join(lines) + "\n", total_us, per_package
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the Markdown report here instead of stdout")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget-ms", type=float, help="fail if total import time exceeds this")
+    parser.add_argument(
+        "--forbid", default=",".join(DEFAULT_FORBIDDEN),
+        help="comma-separated packages that must not be imported at startup ('' to disable)",
+    )
+    args = parser.parse_args()
+
+    rows = profile(STARTUP_MODULES)
+    text, total_us, per_package = report(rows, args.top)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"wrote {args.output} (total {total_us / 1000:.1f} ms)")
+    else:
+        print(text)
+
+    status = 0
+    forbidden = [p for p in args.forbid.split(",") if p and p in per_package]
+    if forbidden:
+        print(f"FAIL: imported at startup: {', '.join(forbidden)}", file=sys.stderr)
+        status = 1
+    if args.budget_ms is not None and total_us / 1000 > args.budget_ms:
+        print(f"FAIL: {total_us / 1000:.1f} ms exceeds budget {args.budget_ms} ms", file=sys.stderr)
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+Local stand-in for an Ollama server, for benchmarks that must not depend on model speed.
+
+Speaks just enough of both protocols the app uses:
+
+  POST /api/chat, /api/generate      Ollama native, NDJSON stream (langchain_ollama, warm-up)
+  POST /v1/chat/completions          OpenAI-compatible, SSE stream
+  POST /v1/completions               OpenAI-compatible, SSE stream (get_ollama_response)
+  GET  /api/tags, /api/version       model listing / health
+
+Every response is --tokens deterministic tokens, the first after
+--first-token-ms, then one every 1/--tokens-per-second seconds (0 = as fast as
+possible). A request body's "options.num_predict" / "max_tokens" caps the length.
+
+Usage (from the repository root):
+    python benchmarks/stub_ollama.py --port 11555 --tokens-per-second 50 --first-token-ms 200
+and set OLLAMA_BASE_URL = "http://127.0.0.1:11555" in app/config.py, or start it
+in-process with StubOllama(...).start() as benchmarks/bench_llm_path.py does.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORDS = "the quick brown fox jumps over a lazy dog while streaming tokens to the chat area".split()
+
+
+def _token(i: int) -> str:
+    return ("" if i == 0 else " ") + _WORDS[i % len(_WORDS)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format, *args):  # noqa: A002 - quiet by default
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _json_body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _tokens(self, limit: int | None):
+        """Yields the response tokens on the configured schedule."""
+        count = self.server.tokens if not limit else min(self.server.tokens, limit)
+        time.sleep(self.server.first_token_seconds)
+        interval = 1.0 / self.server.tokens_per_second if self.server.tokens_per_second else 0.0
+        next_at = time.perf_counter()
+        for i in range(count):
+            if interval:
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0 and i:
+                    time.sleep(delay)
+            yield _token(i)
+
+    # ---- GET ----
+    def do_GET(self) -> None:
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.server.model, "model": self.server.model}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-stub"})
+        else:
+            self.send_error(404)
+
+    # ---- POST ----
+    def do_POST(self) -> None:
+        with self.server.stats_lock:
+            self.server.requests += 1
+        try:
+            body = self._json_body()
+            if self.path in ("/api/chat", "/api/generate"):
+                self._ollama(body, chat=self.path == "/api/chat")
+            elif self.path in ("/v1/chat/completions", "/v1/completions"):
+                self._openai(body, chat=self.path == "/v1/chat/completions")
+            else:
+                self.send_error(404)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up mid-stream (e.g. a cancelled answer).
+            with self.server.stats_lock:
+                self.server.disconnects += 1
+
+    def _ollama(self, body: dict, chat: bool) -> None:
+        model = body.get("model", self.server.model)
+        limit = (body.get("options") or {}).get("num_predict")
+        created = datetime.now(timezone.utc).isoformat()
+        if chat and not body.get("messages") or not chat and not body.get("prompt"):
+            # Warm-up / load request: answer immediately with an empty, finished response.
+            self._send_json({"model": model, "created_at": created, "response": "", "done": True})
+            return
+        if body.get("stream") is False:
+            text = "".join(self._tokens(limit))
+            payload = {"model": model, "created_at": created, "done": True, "done_reason": "stop"}
+            payload.update({"message": {"role": "assistant", "content": text}} if chat else {"response": text})
+            self._send_json(payload)
+            return
+
+        self._start_stream("application/x-ndjson")
+        for token in self._tokens(limit):
+            piece = {"message": {"role": "assistant", "content": token}} if chat else {"response": token}
+            self._write_chunk(json.dumps({"model": model, "created_at": created, "done": False, **piece}).encode() + b"\n")
+        final = {"message": {"role": "assistant", "content": ""}} if chat else {"response": ""}
+        self._write_chunk(json.dumps({
+            "model": model, "created_at": created, "done": True, "done_reason": "stop",
+            "eval_count": self.server.tokens, **final,
+        }).encode() + b"\n")
+        self._end_stream()
+
+    def _openai(self, body: dict, chat: bool) -> None:
+        model = body.get("model", self.server.model)
+        limit = body.get("max_tokens")
+        created = int(time.time())
+        kind = "chat.completion.chunk" if chat else "text_completion"
+
+        def event(delta: str | None, finish: str | None) -> bytes:
+            choice = {"index": 0, "finish_reason": finish}
+            if chat:
+                choice["delta"] = {"content": delta} if delta is not None else {}
+            else:
+                choice["text"] = delta or ""
+            payload = {"id": "stub", "object": kind, "created": created, "model": model, "choices": [choice]}
+            return b"data: " + json.dumps(payload).encode() + b"\n\n"
+
+        if not body.get("stream"):
+            text = "".join(self._tokens(limit))
+            choice = {"index": 0, "finish_reason": "stop"}
+            choice.update({"message": {"role": "assistant", "content": text}} if chat else {"text": text})
+            self._send_json({"id": "stub", "object": kind.replace(".chunk", ""), "created": created, "model": model, "choices": [choice]})
+            return
+
+        self._start_stream("text/event-stream")
+        for token in self._tokens(limit):
+            self._write_chunk(event(token, None))
+        self._write_chunk(event(None, "stop"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class StubOllama:
+    """
+    The stub server, runnable in a background thread.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tokens: int = 200,
+        tokens_per_second: float = 0.0,
+        first_token_ms: float = 0.0,
+        model: str = "stub",
+        verbose: bool = False,
+    ) -> None:
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.tokens = tokens
+        self.httpd.tokens_per_second = tokens_per_second
+        self.httpd.first_token_seconds = first_token_ms / 1000
+        self.httpd.model = model
+        self.httpd.verbose = verbose
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.disconnects = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def configure(self, **settings) -> None:
+        """Change tokens / tokens_per_second / first_token_ms between runs."""
+        if "first_token_ms" in settings:
+            settings["first_token_seconds"] = settings.pop("first_token_ms") / 1000
+        for name, value in settings.items():
+            setattr(self.httpd, name, value)
+
+    def stats(self) -> dict:
+        with self.httpd.stats_lock:
+            return {"requests": self.httpd.requests, "disconnects": self.httpd.disconnects}
+
+    def start(self) -> "StubOllama":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11555)
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per response")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="0 = unthrottled")
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    stub = StubOllama(
+        args.host, args.port, args.tokens, args.tokens_per_second, args.first_token_ms, verbose=args.verbose
+    )
+    print(f"stub Ollama on {stub.base_url} ({args.tokens} tokens @ {args.tokens_per_second}/s, "
+          f"first token after {args.first_token_ms} ms)")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Download models once, save them as safetensors into app/models/ and record
+them (size + sha256 per file) in app/models/manifest.json. The app resolves
+models against that manifest and loads them without network access.
+
+Usage (from the repository root, with network access):
+    python installation/register-models.py                  # every model below
+    python installation/register-models.py all-MiniLM-L6-v2 --onnx
+    python installation/register-models.py --import ./bert_model bert-qa question-answering
+"""
+import argparse
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+# name -> (hub id, kind)
+MODELS = {
+    "all-MiniLM-L6-v2": ("sentence-transformers/all-MiniLM-L6-v2", "sentence-transformers"),
+    "all-mpnet-base-v2": ("sentence-transformers/all-mpnet-base-v2", "sentence-transformers"),
+    "bert-large-squad": ("bert-large-uncased-whole-word-masking-finetuned-squad", "question-answering"),
+    "roberta-base-squad2": ("deepset/roberta-base-squad2", "question-answering"),
+}
+
+
+def save_model(hub_id, kind, target, onnx):
+    if kind == "sentence-transformers":
+        from sentence_transformers import SentenceTransformer
+        SentenceTransformer(hub_id, device="cpu").save(str(target), safe_serialization=True)
+        if onnx:
+            # Exported to target/onnx/model.onnx, used by EMBEDDING_BACKEND="onnx"
+            SentenceTransformer(hub_id, device="cpu", backend="onnx").save(str(target))
+    else:
+        from transformers import AutoModelForQuestionAnswering, AutoTokenizer
+        AutoModelForQuestionAnswering.from_pretrained(hub_id).save_pretrained(target, safe_serialization=True)
+        AutoTokenizer.from_pretrained(hub_id).save_pretrained(target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help=f"models to register (default: {', '.join(MODELS)})")
+    parser.add_argument("--onnx", action="store_true", help="also export sentence-transformers models to ONNX")
+    parser.add_argument(
+        "--import", dest="import_dir", nargs=3, metavar=("DIR", "NAME", "KIND"),
+        help="register an already-saved safetensors model folder (copied into the registry)",
+    )
+    args = parser.parse_args()
+
+    import config
+    from rag.model_registry import ModelRegistryError, check_weights, model_registry
+
+    root = APP_DIR / config.MODEL_REGISTRY_DIR
+    model_registry.root = root
+
+    if args.import_dir:
+        import shutil
+        source, name, kind = args.import_dir
+        target = root / name
+        try:
+            # Reject pickle weights before anything is copied into the registry
+            check_weights(source)
+        except ModelRegistryError as e:
+            sys.exit(f"not imported: {e}")
+        existed = target.exists()
+        shutil.copytree(source, target, dirs_exist_ok=True)
+        try:
+            entry = model_registry.register(name, target, kind)
+        except Exception:
+            if not existed:
+                shutil.rmtree(target, ignore_errors=True)  # leave no unregistered copy behind
+            raise
+        print(f"registered {name}: {len(entry['files'])} files")
+        return
+
+    for name in args.names or MODELS:
+        hub_id, kind = MODELS[name]
+        target = root / name
+        print(f"downloading {hub_id} -> {target}")
+        save_model(hub_id, kind, target, args.onnx)
+        entry = model_registry.register(name, target, kind, source=hub_id)
+        print(f"registered {name}: {len(entry['files'])} files")
+
+
+if __name__ == "__main__":
+    main()
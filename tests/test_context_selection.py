@@ -0,0 +1,85 @@
+import numpy as np
+
+from rag.context_selection import Span, dedup, merge_adjacent, mmr
+
+
+def _span(text, start, doc_id, score=0.5, filename="a.txt", parent=None):
+    return Span(filename=filename, text=text, score=score, doc_ids=[doc_id], start=start, parent=parent)
+
+
+# ---- merge_adjacent ----
+
+def test_overlapping_spans_keep_the_overlap_once():
+    merged = merge_adjacent([_span("hello world", 0, 0), _span("world again", 6, 1)])
+    assert [s.text for s in merged] == ["hello world again"]
+    assert merged[0].doc_ids == [0, 1]
+
+
+def test_small_gap_is_filled_so_offsets_line_up():
+    merged = merge_adjacent([_span("abc", 0, 0), _span("def", 5, 1)])
+    assert [s.text for s in merged] == ["abc\n\ndef"]
+    assert merged[0].end == 8
+
+
+def test_large_gap_keeps_spans_apart_sorted_by_score():
+    merged = merge_adjacent([_span("abc", 0, 0, score=0.2), _span("def", 50, 1, score=0.9)])
+    assert [s.text for s in merged] == ["def", "abc"]
+
+
+def test_contained_span_is_absorbed():
+    merged = merge_adjacent([_span("hello world", 0, 0, score=0.3), _span("lo wo", 3, 1, score=0.8)])
+    assert [s.text for s in merged] == ["hello world"]
+    assert merged[0].score == 0.8
+
+
+def test_spans_in_other_files_or_without_offsets_are_not_merged():
+    spans = [
+        _span("abc", 0, 0),
+        _span("def", 3, 1, filename="b.txt"),
+        Span(filename="a.txt", text="row", score=0.1, doc_ids=[2], start=None),
+    ]
+    assert sorted(s.text for s in merge_adjacent(spans)) == ["abc", "def", "row"]
+
+
+def test_consecutive_siblings_merge_across_a_larger_gap():
+    parent = (0, 1)
+    merged = merge_adjacent([_span("first", 0, 0, parent=parent), _span("second", 10, 1, parent=parent)])
+    assert [s.text for s in merged] == ["first" + "\n" * 5 + "second"]
+    assert merged[0].parent == parent
+
+
+def test_non_consecutive_siblings_are_not_merged():
+    parent = (0, 2)
+    merged = merge_adjacent([_span("first", 0, 0, parent=parent), _span("third", 10, 2, parent=parent)])
+    assert len(merged) == 2
+
+
+# ---- dedup ----
+
+def test_dedup_drops_repeats_and_contained_text_ignoring_whitespace():
+    spans = [
+        _span("The  quick brown\nfox", 0, 0),
+        _span("the quick brown fox", 100, 1, filename="b.txt"),
+        _span("quick brown", 200, 2, filename="c.txt"),
+        _span("something else", 300, 3),
+    ]
+    assert [s.doc_ids for s in dedup(spans)] == [[0], [3]]
+
+
+# ---- mmr ----
+
+def test_mmr_lambda_one_is_plain_top_k():
+    query = np.array([1.0, 0.0])
+    vectors = np.array([[0.9, 0.1], [1.0, 0.0], [0.0, 1.0]])
+    assert mmr(query, vectors, k=2, lambda_=1.0) == [1, 0]
+
+
+def test_mmr_prefers_a_diverse_candidate_over_a_near_duplicate():
+    query = np.array([1.0, 1.0])
+    vectors = np.array([[1.0, 0.9], [1.0, 0.9], [0.2, 1.0]])
+    assert mmr(query, vectors, k=2, lambda_=0.5) == [0, 2]
+
+
+def test_mmr_handles_empty_and_small_inputs():
+    assert mmr(np.ones(2), np.empty((0, 2)), k=3) == []
+    assert sorted(mmr(np.ones(2), np.eye(2), k=5)) == [0, 1]
@@ -0,0 +1,36 @@
+from rag.document_store import DocumentStore, byte_ranges, encode
+
+
+def _slices(text, ranges):
+    data = encode(text)
+    return [data[start:start + length].decode("utf-8") for start, length in byte_ranges(text, ranges)]
+
+
+def test_ascii_ranges_are_unchanged():
+    assert byte_ranges("hello world", [(6, 5), (0, 5)]) == [(6, 5), (0, 5)]
+
+
+def test_multi_byte_ranges_in_input_order():
+    text = "ab中文字cd😀ef"
+    ranges = [(7, 3), (2, 3), (0, 2)]
+    assert byte_ranges(text, ranges) == [(13, 6), (2, 9), (0, 2)]
+    assert _slices(text, ranges) == ["😀ef", "中文字", "ab"]
+
+
+def test_overlapping_multi_byte_ranges():
+    text = "é" * 10
+    assert _slices(text, [(2, 5), (4, 4), (0, 10)]) == ["é" * 5, "é" * 4, "é" * 10]
+
+
+def test_read_decodes_byte_ranges(tmp_path):
+    store = DocumentStore(tmp_path)
+    text = "第一段 first\n第二段 second 😀"
+    key = store.put(text)
+    assert store.put(text) == key
+    try:
+        (start, length), = byte_ranges(text, [(text.index("第二段"), 10)])
+        assert store.read(key, start, length) == "第二段 second"
+        assert store.read(key) == text
+        assert store.read(store.put(""), 0, 0) == ""
+    finally:
+        store.close()
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from utils.ollama_client import BACKGROUND, INTERACTIVE, OllamaScheduler, QueueFull
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_interactive_requests_run_before_background_ones():
+    scheduler = OllamaScheduler(max_in_flight=1, max_queue=8)
+    order = []
+
+    def worker(priority, name):
+        with scheduler.slot(priority, poll_interval=0.01):
+            order.append(name)
+
+    with scheduler.slot(INTERACTIVE):
+        threads = [threading.Thread(target=worker, args=(BACKGROUND, "background"))]
+        threads[0].start()
+        _wait_for(lambda: scheduler.stats()["waiting"] == 1)
+        threads.append(threading.Thread(target=worker, args=(INTERACTIVE, "interactive")))
+        threads[1].start()
+        _wait_for(lambda: scheduler.stats()["waiting"] == 2)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "background"]
+    assert scheduler.stats() == {"in_flight": 0, "waiting": 0, "waiting_interactive": 0}
+
+
+def test_position_follows_priority_then_arrival():
+    scheduler = OllamaScheduler(max_in_flight=1, max_queue=8)
+    background = scheduler._admit(BACKGROUND)
+    first = scheduler._admit(INTERACTIVE)
+    second = scheduler._admit(INTERACTIVE)
+    assert [scheduler.position(t) for t in (first, second, background)] == [1, 2, 3]
+
+
+def test_overflow_degrades_interactive_and_rejects_background():
+    scheduler = OllamaScheduler(max_in_flight=1, max_queue=1)
+    with scheduler.slot(INTERACTIVE) as ticket:
+        assert not ticket.degraded
+        assert not scheduler._admit(BACKGROUND).degraded
+        with pytest.raises(QueueFull):
+            scheduler._admit(BACKGROUND)
+        assert scheduler._admit(INTERACTIVE).degraded
+
+
+def test_overflow_reject_rejects_interactive():
+    scheduler = OllamaScheduler(max_in_flight=1, max_queue=0, overflow="reject")
+    with scheduler.slot(INTERACTIVE):
+        with pytest.raises(QueueFull):
+            scheduler._admit(INTERACTIVE)
+    with pytest.raises(ValueError):
+        OllamaScheduler(max_in_flight=1, max_queue=0, overflow="drop")
+
+
+def test_failed_wait_leaves_the_queue():
+    scheduler = OllamaScheduler(max_in_flight=1, max_queue=8)
+
+    def on_position(position):
+        raise RuntimeError("client went away")
+
+    with scheduler.slot(INTERACTIVE):
+        with pytest.raises(RuntimeError):
+            with scheduler.slot(INTERACTIVE, on_position=on_position):
+                pass
+        assert scheduler.stats()["waiting"] == 0
+
+
+def test_on_position_runs_every_poll_and_can_abandon_the_wait():
+    scheduler = OllamaScheduler(max_in_flight=1, max_queue=8)
+    calls = []
+
+    def on_position(position):
+        calls.append(position)
+        if len(calls) == 3:
+            raise KeyboardInterrupt  # like Streamlit's rerun exception, not an Exception
+
+    with scheduler.slot(INTERACTIVE):
+        with pytest.raises(KeyboardInterrupt):
+            with scheduler.slot(INTERACTIVE, on_position=on_position, poll_interval=0.01):
+                pass
+        assert calls == [1, 1, 1]
+        assert scheduler.stats()["waiting"] == 0
+    with scheduler.slot(INTERACTIVE):
+        assert scheduler.stats()["in_flight"] == 1
@@ -0,0 +1,27 @@
+import pytest
+
+from rag.retriever import fuse
+
+
+def test_documents_found_by_several_queries_rank_first():
+    fused = fuse([
+        [(1, 0.9, "a"), (2, 0.8, "a")],
+        [(2, 0.7, "a"), (3, 0.6, "b")],
+    ], k=60)
+    assert [hit[0] for hit, _ in fused] == [2, 1, 3]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_best_similarity_is_kept_per_document():
+    fused = fuse([[(5, 0.4, "a")], [(5, 0.9, "a")]])
+    assert fused == [((5, 0.9, "a"), pytest.approx(2 / 61))]
+
+
+def test_weights_scale_each_ranking():
+    fused = fuse([[(1, 0.9, "a")], [(2, 0.9, "a")]], weights=[0.5, 1.0])
+    assert [hit[0] for hit, _ in fused] == [2, 1]
+
+
+def test_empty_rankings():
+    assert fuse([]) == []
+    assert fuse([[], []]) == []